@@ -2,7 +2,6 @@
 import multiprocessing as mp
 import os
 import time
-from multiprocessing import set_start_method
 import inspect
 import math
 
@@ -10,15 +9,20 @@ import gym
 import numpy as np
 
 from tpg.trainer import Trainer
+from tpg import warmup
 from tpg.utils import getLearners, getTeams, learnerInstructionStats, actionInstructionStats, pathDepths
 
 """
 Transform visual input from ALE to flat vector.
 inState should be made int32 before passing in.
+If indices is given (like from Trainer.getReadSet), only those entries of the
+flat vector are computed and returned.
 """
-def getStateALE(inState):
+def getStateALE(inState, indices=None):
     # each row is all 1 color
     rgbRows = np.reshape(inState,(len(inState[0])*len(inState), 3)).T
+    if indices is not None:
+        rgbRows = rgbRows[:,indices]
 
     # add each with appropriate shifting
     # get RRRRRRRR GGGGGGGG BBBBBBBB
@@ -122,7 +126,7 @@ def runPopulationParallel(envName="Boxing-v0", gens=1000, popSize=360, reps=3,
     Python really is something special... sometimes it just deadlocks...¯\_(ツ)_/¯
     https://pythonspeed.com/articles/python-multiprocessing/
     '''
-    set_start_method("spawn")
+    context = mp.get_context("spawn")
 
     print("creating atari environment")
     # get num actions
@@ -141,10 +145,12 @@ def runPopulationParallel(envName="Boxing-v0", gens=1000, popSize=360, reps=3,
             traversal=traversal)
 
     trainer.configFunctions()
+    # compile once here so the workers load the kernels from the disk cache
+    warmup(stateDtypes=(np.int32,), precision=trainer.precision)
     #print(1/0)
 
-    man = mp.Manager()
-    pool = mp.Pool(processes=processes, maxtasksperchild=1)
+    man = context.Manager()
+    pool = context.Pool(processes=processes, maxtasksperchild=1)
 
     allScores = [] # track all scores each generation
 
@@ -0,0 +1 @@
+from tpg.program import warmup
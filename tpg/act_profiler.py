@@ -0,0 +1,102 @@
+from tpg.utils import getGraph
+import numpy as np
+
+"""
+Profiles an agent's acting by sampling, only every every'th act is timed
+(with time.perf_counter_ns) and measured, so it can be left on while training.
+Each sample adds the act's latency (nanoseconds), traversal depth (teams
+decided on) and number of instructions executed (by the learners that bid)
+to a histogram. Latency and instruction bins are log spaced, depth bins are
+one per depth up to maxDepth, anything past the last bin goes in it. Set it as
+Agent.profiler, see Agent.act, or turn it on for all agents with
+Trainer.setProfiling.
+"""
+class ActProfiler:
+
+    def __init__(self, every=100, maxDepth=32, latencyRange=(1e3, 1e9),
+            instructionRange=(1, 1e6), nBins=48):
+        self.every = every
+        self.acts = 0 # acts seen so far, sampled or not
+        self.samples = 0
+
+        self.latencyEdges = np.geomspace(latencyRange[0], latencyRange[1], nBins+1)
+        self.depthEdges = np.arange(maxDepth+2)
+        self.instructionEdges = np.geomspace(instructionRange[0], instructionRange[1], nBins+1)
+
+        self.latencies = np.zeros(nBins, dtype=np.int64)
+        self.depths = np.zeros(maxDepth+1, dtype=np.int64)
+        self.instructions = np.zeros(nBins, dtype=np.int64)
+
+    """
+    Counts an act, returns true if it is one to sample.
+    """
+    def tick(self):
+        self.acts += 1
+        return self.acts % self.every == 0
+
+    """
+    Records a sampled act of agent that took latency nanoseconds. visited is
+    the set the act traversed with, empty if it went through the compiled graph.
+    """
+    def record(self, agent, latency, visited):
+        graph = agent.compiled
+        if len(visited) == 0 and graph is not None and graph["stamp"] > 0:
+            # went through the compiled graph, stamps mark what this act reached
+            stamp = graph["stamp"]
+            bid = graph["bidStamps"] == stamp
+            instructions = np.diff(graph["instOffsets"])[bid].sum()
+            if graph["learnerTrav"]:
+                depth = np.count_nonzero(graph["visitStamps"] == stamp) + 1
+            else:
+                depth = np.count_nonzero(graph["teamStamps"] == stamp)
+        else:
+            # one team (or top learner) visited per decision
+            depth = len(visited)
+            frameNum = agent.actVars["frameNum"]
+            instructions = sum(lrnr.program.executionInstructions.shape[1]
+                for lrnr in getGraph(agent.team)[1]
+                if lrnr.frameNum == frameNum and lrnr.program.executionInstructions is not None)
+
+        self.latencies[self.bin(self.latencyEdges, latency)] += 1
+        self.depths[min(depth, len(self.depths)-1)] += 1
+        self.instructions[self.bin(self.instructionEdges, instructions)] += 1
+        self.samples += 1
+
+    """
+    Gets the index of the bin value falls in, clipped to the first and last.
+    """
+    @staticmethod
+    def bin(edges, value):
+        return min(max(np.searchsorted(edges, value, side="right") - 1, 0), len(edges)-2)
+
+    """
+    Gets the histograms as a dict of (counts, edges) pairs of arrays, edges
+    having one more entry than counts.
+    """
+    def histograms(self):
+        return {
+            "latency": (self.latencies.copy(), self.latencyEdges.copy()),
+            "depth": (self.depths.copy(), self.depthEdges.copy()),
+            "instructions": (self.instructions.copy(), self.instructionEdges.copy())
+        }
+
+    """
+    Gets the latency (nanoseconds) below which q percent of the samples fall,
+    to within a bin (the upper edge of the bin it lands in).
+    """
+    def latencyPercentile(self, q):
+        if self.samples == 0:
+            return np.nan
+        cumulative = np.cumsum(self.latencies)
+        index = np.searchsorted(cumulative, q/100*self.samples)
+        return self.latencyEdges[min(index, len(self.latencies)-1)+1]
+
+    """
+    Forgets all samples, keeping the bins.
+    """
+    def reset(self):
+        self.acts = 0
+        self.samples = 0
+        self.latencies[:] = 0
+        self.depths[:] = 0
+        self.instructions[:] = 0
@@ -110,7 +110,7 @@ class ActionObject:
 
     def zeroRegisters(self):
         try:
-            self.registers = np.zeros(len(self.registers), dtype=float)
+            self.registers = np.zeros(len(self.registers), dtype=self.registers.dtype)
         except:
             pass
 
@@ -150,7 +150,7 @@ class ActionObject:
             # let our current team know we won't be pointing to them anymore
             if not self.isAtomic():
                 print("Learner {} switching from Team {} to atomic action".format(learner_id, self.teamAction.id))
-                self.teamAction.inLearners.remove(str(learner_id))
+                self.teamAction.removeInLearner(learner_id)
 
             self.actionCode = random.choice(options)
             self.teamAction = None
@@ -165,11 +165,11 @@ class ActionObject:
                 oldTeam = None
                 if not self.isAtomic():
                     oldTeam = self.teamAction
-                    self.teamAction.inLearners.remove(str(learner_id))
+                    self.teamAction.removeInLearner(learner_id)
 
                 self.teamAction = random.choice(selection_pool)
                 # Let the new team know we're pointing to them
-                self.teamAction.inLearners.append(str(learner_id))
+                self.teamAction.addInLearner(learner_id)
 
                 if oldTeam != None:
                     print("Learner {} switched from Team {} to Team {}".format(learner_id, oldTeam.id, self.teamAction.id))
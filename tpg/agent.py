@@ -1,4 +1,6 @@
 from tpg.program import Program
+from tpg.utils import getTeams, getLearners, getGraph, getReadSet, renumberIds
+import numpy as np
 import pickle
 from random import random
 import time
@@ -16,36 +18,193 @@ class Agent:
         self.functionsDict = functionsDict
         self.agentNum = num
         self.actVars = actVars
+        self.compiled = None # flattened graph used by act, see compile
+        self.trace = None # DecisionTrace to record decisions into, if any
+        self.profiler = None # ActProfiler sampling acts, if any
 
     """
-    Gets an action from the root team of this agent / this agent.
+    Gets an action from the root team of this agent / this agent. frameNum is
+    normally new every act, pass the one given to PopulationExecutor.bid to
+    use the bids it already made for this state (goes through the teams even if
+    compiled). If the agent has a trace (DecisionTrace) the decision is recorded
+    into it, also going through the teams. If the agent has a profiler
+    (ActProfiler) the acts it samples are timed and measured, otherwise acting
+    isn't timed unless there is a path_trace.
     """
-    def act(self, state, path_trace=None):
-        start_execution_time = time.time()*1000.0
-        self.actVars["frameNum"] = random()
-        visited = list() #Create a new list to track visited team/learners each time
+    def act(self, state, path_trace=None, frameNum=None):
+        profiling = self.profiler is not None and self.profiler.tick()
+        if path_trace != None or profiling:
+            start_execution_time = time.perf_counter_ns()
+        self.actVars["frameNum"] = random() if frameNum is None else frameNum
+        visited = set() #Create a new set to track visited team/learners each time
+        self.actVars["trace"] = self.trace
+        if self.trace is not None:
+            self.trace.start()
         
         result = None
         path = None
         if path_trace != None:
             path = list()
             result = self.team.act(state, visited=visited, actVars=self.actVars, path_trace=path)
+        elif self.compiled is not None and frameNum is None and self.trace is None:
+            result = self.actCompiled(state)
         else:
             result = self.team.act(state, visited=visited, actVars=self.actVars)
 
-        end_execution_time = time.time()*1000.0
-        execution_time = end_execution_time - start_execution_time
+        if self.trace is not None:
+            self.trace.finish(result)
+
+        if path_trace != None or profiling:
+            execution_time = time.perf_counter_ns() - start_execution_time
+            if profiling:
+                self.profiler.record(self, execution_time, visited)
+
         if path_trace != None:
 
-            path_trace['execution_time'] = execution_time
+            path_trace['execution_time'] = execution_time/1e6
             path_trace['execution_time_units'] = 'milliseconds'
-            path_trace['root_team_id'] = str(self.team.id)
+            path_trace['root_team_id'] = self.team.id
             path_trace['final_action'] = result
             path_trace['path'] = path 
             path_trace['depth'] = len(path)
             
         return result
 
+    """
+    Flattens the graph reachable from the root team into integer arrays so that
+    act can traverse it in a single Program.executeGraph call, rather than going
+    team by team in python. The learners' registers become rows of one block
+    shared with the compiled graph, so both ways of acting see the same
+    registers. The compiled graph is a snapshot, compile again after the graph
+    changes (agents from the trainer are made anew each generation anyway).
+    Acting with a path trace always goes through the teams.
+    """
+    def compile(self):
+        # breadth first, the root team is team 0
+        teams, learners = getGraph(self.team)
+        teamIndex = {id(team): i for i, team in enumerate(teams)}
+        learnerIndex = {id(lrnr): i for i, lrnr in enumerate(learners)}
+
+        teamOffsets = np.zeros(len(teams)+1, dtype=np.int32)
+        teamOffsets[1:] = np.cumsum([len(team.learners) for team in teams])
+        teamLearners = np.array([learnerIndex[id(lrnr)]
+            for team in teams for lrnr in team.learners], dtype=np.int32)
+
+        learnerTeams = np.array([-1 if lrnr.isActionAtomic()
+            else teamIndex[id(lrnr.getActionTeam())] for lrnr in learners], dtype=np.int32)
+
+        registers = np.array([lrnr.registers for lrnr in learners])
+        for i, lrnr in enumerate(learners):
+            lrnr.registers = registers[i]
+
+        self.compiled = {
+            "learners": learners,
+            "registers": registers,
+            "insts": None, # packed on first act, see packCompiled
+            "instOffsets": None,
+            "packedKey": None,
+            "teamOffsets": teamOffsets,
+            "teamLearners": teamLearners,
+            "learnerTeams": learnerTeams,
+            "teamStamps": np.zeros(len(teams), dtype=np.int64),
+            "bidStamps": np.zeros(len(learners), dtype=np.int64),
+            "visitStamps": np.zeros(len(learners), dtype=np.int64),
+            "stamp": 0,
+            "learnerTrav": (self.functionsDict is not None
+                and self.functionsDict["Team"]["act"] == "learnerTrav")
+        }
+
+        return self
+
+    """
+    Packs the programs of the compiled learners into one instruction arena,
+    for states of length inputSize (and memory of memSize).
+    """
+    def packCompiled(self, inputSize, memSize=0):
+        graph = self.compiled
+        programs = [lrnr.program.getExecutionInstructions(len(lrnr.registers), inputSize, memSize)
+            for lrnr in graph["learners"]]
+
+        graph["instOffsets"] = np.zeros(len(programs)+1, dtype=np.int32)
+        graph["instOffsets"][1:] = np.cumsum([insts.shape[1] for insts in programs])
+        graph["insts"] = np.ascontiguousarray(np.concatenate(programs, axis=1))
+        graph["packedKey"] = (inputSize, memSize)
+
+    """
+    Gets an action by traversing the compiled graph in one kernel call, only
+    the action object of the final learner is run in python.
+    """
+    def actCompiled(self, state):
+        graph = self.compiled
+        graph["stamp"] += 1
+        if graph["packedKey"] != (len(state), 0):
+            self.packCompiled(len(state))
+
+        top = Program.executeGraph(Program.executeId, state, graph["registers"],
+            graph["insts"], graph["instOffsets"], graph["teamOffsets"],
+            graph["teamLearners"], graph["learnerTeams"], graph["teamStamps"],
+            graph["bidStamps"], graph["visitStamps"], graph["stamp"],
+            graph["learnerTrav"])
+        if top == -1:
+            raise ValueError("No valid learners found in compiled graph!")
+
+        return graph["learners"][top].getAction(state, visited=set(), actVars=self.actVars)
+
+    """
+    Gets an action for each row of states, for offline evaluation on a dataset.
+    Rows are independent of each other, each is acted on as if the registers
+    (of learners and real action programs) were zeroed just before. The bids of
+    every learner in the graph are found up front with one batched call per
+    learner, then the graph is traversed for each row using those bids. With
+    memory, all rows of one learner are done before the next learner.
+    """
+    def actBatch(self, states):
+        self.actVars["trace"] = None
+        learners = getGraph(self.team)[1]
+        registers = [np.zeros((len(states), len(lrnr.registers)), dtype=lrnr.registers.dtype)
+            for lrnr in learners]
+        for lrnr, regs in zip(learners, registers):
+            lrnr.bidBatch(states, registers=regs, actVars=self.actVars)
+
+        # real actions run per row, on zeroed registers of their own
+        actionObjs = [lrnr.actionObj for lrnr in learners
+            if getattr(lrnr.actionObj, "registers", None) is not None]
+        actionRegisters = [np.zeros((len(states), len(actionObj.registers)),
+            dtype=actionObj.registers.dtype) for actionObj in actionObjs]
+
+        # keep the learners' own registers aside while the batch ones are used
+        savedRegisters = [lrnr.registers for lrnr in learners]
+        savedFrameNums = [lrnr.frameNum for lrnr in learners]
+        savedActionRegisters = [actionObj.registers for actionObj in actionObjs]
+
+        results = []
+        try:
+            for n in range(len(states)):
+                # learners already bid on this frame just return registers[0]
+                self.actVars["frameNum"] = random()
+                for lrnr, regs in zip(learners, registers):
+                    lrnr.registers = regs[n]
+                    lrnr.frameNum = self.actVars["frameNum"]
+                for actionObj, regs in zip(actionObjs, actionRegisters):
+                    actionObj.registers = regs[n]
+
+                results.append(self.team.act(states[n], visited=set(), actVars=self.actVars))
+        finally:
+            for lrnr, regs, frameNum in zip(learners, savedRegisters, savedFrameNums):
+                lrnr.registers = regs
+                lrnr.frameNum = frameNum
+            for actionObj, regs in zip(actionObjs, savedActionRegisters):
+                actionObj.registers = regs
+
+        return results
+
+    """
+    Gets the sorted indices of the state that this agent can ever read. See
+    utils.getReadSet and utils.scatterState.
+    """
+    def getReadSet(self, inputSize):
+        return getReadSet(getLearners(self.team), inputSize)
+
     """
     Give this agent/root team a reward for the given task
     """
@@ -60,6 +219,31 @@ class Agent:
 
     def zeroRegisters(self):
         self.team.zeroRegisters()
+        self.linkRegisters()
+
+    """
+    Puts the learners' registers back on the compiled register block, as
+    views of it, keeping their values. Needed when something gives the
+    learners registers of their own (zeroing them, loading or copying).
+    """
+    def linkRegisters(self):
+        if self.compiled is not None:
+            for i, lrnr in enumerate(self.compiled["learners"]):
+                self.compiled["registers"][i] = lrnr.registers
+                lrnr.registers = self.compiled["registers"][i]
+
+    """
+    Agents saved before they had a compiled graph, trace or profiler get none,
+    and their teams and learners get integer ids if they had uuids. Pickling
+    doesn't keep the learners' registers views of the compiled ones.
+    """
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in ("compiled", "trace", "profiler"):
+            self.__dict__.setdefault(name, None)
+        if not isinstance(self.team.id, int):
+            renumberIds(getTeams(self.team), getLearners(self.team), {})
+        self.linkRegisters()
 
     """
     Should be called when the agent is loaded from a file or when loaded into 
@@ -70,6 +254,9 @@ class Agent:
         from tpg.learner import Learner
         from tpg.action_object import ActionObject
         from tpg.program import Program
+        from tpg.configuration.configurer import upgradeFunctionsDict, upgradeActVars
+
+        upgradeFunctionsDict(self.functionsDict)
 
         # first set up Agent functions
         Agent.configFunctions(self.functionsDict["Agent"])
@@ -86,6 +273,8 @@ class Agent:
         # set up Program functions
         Program.configFunctions(self.functionsDict["Program"])
 
+        upgradeActVars(self.actVars, Program)
+
     """
     Ensures proper functions are used in this class as set up by configurer.
     """
@@ -99,6 +288,11 @@ class Agent:
         if functionsDict["act"] == "def":
             cls.act = ConfAgent.act_def
 
+        if functionsDict["actCompiled"] == "def":
+            cls.actCompiled = ConfAgent.actCompiled_def
+        elif functionsDict["actCompiled"] == "mem":
+            cls.actCompiled = ConfAgent.actCompiled_mem
+
         if functionsDict["reward"] == "def":
             cls.reward = ConfAgent.reward_def
 
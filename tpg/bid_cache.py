@@ -0,0 +1,38 @@
+import numpy as np
+
+"""
+Remembers the registers that programs ended with on the current frame, so that
+learners running identical programs from identical registers only execute it
+once. Keyed by the program's effective instruction hash and the registers it
+started from. Everything is forgotten as soon as the frame number changes.
+Only valid without memory, where running a program has no side effects.
+"""
+class BidCache:
+
+    def __init__(self):
+        self.frameNum = None
+        self.results = {}
+
+    """
+    Gets the key for running program from registers, and the registers that
+    run ended with if it was already done this frame (else None).
+    """
+    def lookup(self, frameNum, program, registers):
+        if frameNum != self.frameNum:
+            self.frameNum = frameNum
+            self.results.clear()
+
+        key = (program.getEffectiveHash(len(registers)), registers.tobytes())
+        return key, self.results.get(key)
+
+    """
+    Saves the registers that the run under key ended with.
+    """
+    def store(self, key, registers):
+        self.results[key] = np.array(registers)
+
+    """
+    Caches are per process and per frame, no point in saving the contents.
+    """
+    def __getstate__(self):
+        return {"frameNum": None, "results": {}}
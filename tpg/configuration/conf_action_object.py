@@ -97,7 +97,8 @@ class ConfActionObject:
                 '''
                 print("Index error")
 
-        self.registers = np.zeros(max(initParams["nActRegisters"], initParams["nDestinations"]))
+        self.registers = np.zeros(max(initParams["nActRegisters"], initParams["nDestinations"]),
+            dtype=initParams.get("precision", "float64"))
 
     """
     Returns the action code, and if applicable corresponding real action.
@@ -128,9 +129,12 @@ class ConfActionObject:
     Gets the real action from a register.
     """
     def getRealAction_real(self, state, actVars=None):
+        instructions = self.program.getExecutionInstructions(len(self.registers), len(state),
+                        effective=False)
+
         Program.execute(state, self.registers,
-                        self.program.instructions[:,0], self.program.instructions[:,1],
-                        self.program.instructions[:,2], self.program.instructions[:,3])
+                        instructions[0], instructions[1],
+                        instructions[2], instructions[3])
 
         return self.registers[:self.actionLength]
 
@@ -138,11 +142,14 @@ class ConfActionObject:
     Gets the real action from a register. With memory.
     """
     def getRealAction_real_mem(self, state, actVars=None):
+        instructions = self.program.getExecutionInstructions(len(self.registers), len(state),
+                        actVars["memMatrix"].size, effective=False)
+
         Program.execute(state, self.registers,
-                        self.program.instructions[:,0], self.program.instructions[:,1],
-                        self.program.instructions[:,2], self.program.instructions[:,3],
+                        instructions[0], instructions[1],
+                        instructions[2], instructions[3],
                         actVars["memMatrix"], actVars["memMatrix"].shape[0], actVars["memMatrix"].shape[1],
-                        Program.memWriteProbFunc)
+                        actVars["memWriteProbs"])
 
         return self.registers[:self.actionLength]
 
@@ -171,7 +178,7 @@ class ConfActionObject:
             # let our current team know we won't be pointing to them anymore
             if not self.isAtomic():
                 #print("Learner {} switching from Team {} to atomic action".format(learner_id, self.teamAction.id))
-                self.teamAction.inLearners.remove(str(learner_id))
+                self.teamAction.removeInLearner(learner_id)
 
             self.actionCode = random.choice(options)
             self.teamAction = None
@@ -186,11 +193,11 @@ class ConfActionObject:
                 oldTeam = None
                 if not self.isAtomic():
                     oldTeam = self.teamAction
-                    self.teamAction.inLearners.remove(str(learner_id))
+                    self.teamAction.removeInLearner(learner_id)
 
                 self.teamAction = random.choice(selection_pool)
                 # Let the new team know we're pointing to them
-                self.teamAction.inLearners.append(str(learner_id))
+                self.teamAction.addInLearner(learner_id)
 
                 #if oldTeam != None:
                 #    print("Learner {} switched from Team {} to Team {}".format(learner_id, oldTeam.id, self.teamAction.id))
@@ -221,7 +228,7 @@ class ConfActionObject:
             # let our current team know we won't be pointing to them anymore
             if not self.isAtomic():
                 #print("Learner {} switching from Team {} to atomic action".format(learner_id, self.teamAction.id))
-                self.teamAction.inLearners.remove(str(learner_id))
+                self.teamAction.removeInLearner(learner_id)
 
             self.actionCode = random.choice(options)
             self.actionLength = mutateParams["actionLengths"][self.actionCode]
@@ -237,11 +244,11 @@ class ConfActionObject:
                 oldTeam = None
                 if not self.isAtomic():
                     oldTeam = self.teamAction
-                    self.teamAction.inLearners.remove(str(learner_id))
+                    self.teamAction.removeInLearner(learner_id)
 
                 self.teamAction = random.choice(selection_pool)
                 # Let the new team know we're pointing to them
-                self.teamAction.inLearners.append(str(learner_id))
+                self.teamAction.addInLearner(learner_id)
 
                 #if oldTeam != None:
                 #    print("Learner {} switched from Team {} to Team {}".format(learner_id, oldTeam.id, self.teamAction.id))
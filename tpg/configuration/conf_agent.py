@@ -16,36 +16,102 @@ class ConfAgent:
         self.functionsDict = functionsDict
         self.agentNum = num
         self.actVars = actVars
+        self.compiled = None # flattened graph used by act, see compile
+        self.trace = None # DecisionTrace to record decisions into, if any
+        self.profiler = None # ActProfiler sampling acts, if any
 
     """
-    Gets an action from the root team of this agent / this agent.
+    Gets an action from the root team of this agent / this agent. frameNum is
+    normally new every act, pass the one given to PopulationExecutor.bid to
+    use the bids it already made for this state (goes through the teams even if
+    compiled). If the agent has a trace (DecisionTrace) the decision is recorded
+    into it, also going through the teams. If the agent has a profiler
+    (ActProfiler) the acts it samples are timed and measured, otherwise acting
+    isn't timed unless there is a path_trace.
     """
-    def act_def(self, state, path_trace=None):
+    def act_def(self, state, path_trace=None, frameNum=None):
 
-        start_execution_time = time.time()*1000.0
-        self.actVars["frameNum"] = random()
-        visited = list() #Create a new list to track visited team/learners each time
+        profiling = self.profiler is not None and self.profiler.tick()
+        if path_trace != None or profiling:
+            start_execution_time = time.perf_counter_ns()
+        self.actVars["frameNum"] = random() if frameNum is None else frameNum
+        visited = set() #Create a new set to track visited team/learners each time
+        self.actVars["trace"] = self.trace
+        if self.trace is not None:
+            self.trace.start()
         
         result = None
         path = None
         if path_trace != None:
             path = list()
             result = self.team.act(state, visited=visited, actVars=self.actVars, path_trace=path)
+        elif self.compiled is not None and frameNum is None and self.trace is None:
+            result = self.actCompiled(state)
         else:
             result = self.team.act(state, visited=visited, actVars=self.actVars)
 
-        end_execution_time = time.time()*1000.0
-        execution_time = end_execution_time - start_execution_time
+        if self.trace is not None:
+            self.trace.finish(result)
+
+        if path_trace != None or profiling:
+            execution_time = time.perf_counter_ns() - start_execution_time
+            if profiling:
+                self.profiler.record(self, execution_time, visited)
+
         if path_trace != None:
 
-            path_trace['execution_time'] = execution_time
+            path_trace['execution_time'] = execution_time/1e6
             path_trace['execution_time_units'] = 'milliseconds'
-            path_trace['root_team_id'] = str(self.team.id)
+            path_trace['root_team_id'] = self.team.id
             path_trace['final_action'] = result
             path_trace['path'] = path 
             path_trace['depth'] = len(path)
             
         return result
+
+    """
+    Gets an action by traversing the compiled graph in one kernel call, only
+    the action object of the final learner is run in python.
+    """
+    def actCompiled_def(self, state):
+        graph = self.compiled
+        graph["stamp"] += 1
+        if graph["packedKey"] != (len(state), 0):
+            self.packCompiled(len(state))
+
+        top = Program.executeGraph(Program.executeId, state, graph["registers"],
+            graph["insts"], graph["instOffsets"], graph["teamOffsets"],
+            graph["teamLearners"], graph["learnerTeams"], graph["teamStamps"],
+            graph["bidStamps"], graph["visitStamps"], graph["stamp"],
+            graph["learnerTrav"])
+        if top == -1:
+            raise ValueError("No valid learners found in compiled graph!")
+
+        return graph["learners"][top].getAction(state, visited=set(), actVars=self.actVars)
+
+    """
+    Gets an action by traversing the compiled graph in one kernel call. Passes
+    memory args to program.
+    """
+    def actCompiled_mem(self, state):
+        graph = self.compiled
+        graph["stamp"] += 1
+        memSize = self.actVars["memMatrix"].size
+        if graph["packedKey"] != (len(state), memSize):
+            self.packCompiled(len(state), memSize)
+
+        top = Program.executeGraph(Program.executeId, state, graph["registers"],
+            graph["insts"], graph["instOffsets"], graph["teamOffsets"],
+            graph["teamLearners"], graph["learnerTeams"], graph["teamStamps"],
+            graph["bidStamps"], graph["visitStamps"], graph["stamp"],
+            graph["learnerTrav"],
+            self.actVars["memMatrix"], self.actVars["memMatrix"].shape[0], self.actVars["memMatrix"].shape[1],
+            self.actVars["memWriteProbs"])
+        if top == -1:
+            raise ValueError("No valid learners found in compiled graph!")
+
+        return graph["learners"][top].getAction(state, visited=set(), actVars=self.actVars)
+
     """
     Give this agent/root team a reward for the given task
     """
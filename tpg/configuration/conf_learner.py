@@ -1,11 +1,10 @@
 from tpg.program import Program
 from tpg.action_object import ActionObject
 import numpy as np
-from tpg.utils import flip
+from tpg.utils import flip, newHandle, newId
 import random
 import time
 import copy
-import uuid
 
 """
 A team has multiple learners, each learner has a program which is executed to
@@ -19,10 +18,11 @@ class ConfLearner:
     """
     def init_def(self, initParams, program, actionObj, numRegisters, learner_id=None):
         self.program = Program(
-            instructions=program.instructions
+            instructions=program.instructions,
+            initParams=initParams
         ) #Each learner should have their own copy of the program
         self.actionObj = ActionObject(action=actionObj, initParams=initParams) #Each learner should have their own copy of the action object
-        self.registers = np.zeros(numRegisters, dtype=float)
+        self.registers = np.zeros(numRegisters, dtype=initParams.get("precision", "float64"))
 
         self.ancestor = None #By default no ancestor
 
@@ -41,15 +41,16 @@ class ConfLearner:
         TODO should this be -1 before it sees any frames?
         '''
         self.frameNum = 0 # Last seen frame is 0
+        self.handle = newHandle() # for visited checks while acting
 
         # Assign id from initParams counter
-        self.id = uuid.uuid4()
+        self.id = newId(initParams, "idCountLearner")
 
 
         if not self.isActionAtomic():
-            self.actionObj.teamAction.inLearners.append(str(self.id))
+            self.actionObj.teamAction.addInLearner(self.id)
 
-        #print("Creating a brand new learner" if learner_id == None else "Creating a learner from {}".format(str(learner_id)))
+        #print("Creating a brand new learner" if learner_id == None else "Creating a learner from {}".format(learner_id))
         #print("Created learner {} [{}] -> {}".format(self.id, "atomic" if self.isActionAtomic() else "Team", self.actionObj.actionCode if self.isActionAtomic() else self.actionObj.teamAction.id))
         
 
@@ -63,9 +64,22 @@ class ConfLearner:
 
         self.frameNum = actVars["frameNum"]
 
+        # another learner may have already run the same program this frame
+        bidCache = actVars.get("bidCache")
+        if bidCache is not None:
+            key, cached = bidCache.lookup(actVars["frameNum"], self.program, self.registers)
+            if cached is not None:
+                self.registers[:] = cached
+                return self.registers[0]
+
+        instructions = self.program.getExecutionInstructions(len(self.registers), len(state))
+
         Program.execute(state, self.registers,
-                        self.program.instructions[:,0], self.program.instructions[:,1],
-                        self.program.instructions[:,2], self.program.instructions[:,3])
+                        instructions[0], instructions[1],
+                        instructions[2], instructions[3])
+
+        if bidCache is not None:
+            bidCache.store(key, self.registers)
 
         return self.registers[0]
 
@@ -79,14 +93,53 @@ class ConfLearner:
 
         self.frameNum = actVars["frameNum"]
 
+        instructions = self.program.getExecutionInstructions(len(self.registers), len(state),
+                        actVars["memMatrix"].size)
+
         Program.execute(state, self.registers,
-                        self.program.instructions[:,0], self.program.instructions[:,1],
-                        self.program.instructions[:,2], self.program.instructions[:,3],
+                        instructions[0], instructions[1],
+                        instructions[2], instructions[3],
                         actVars["memMatrix"], actVars["memMatrix"].shape[0], actVars["memMatrix"].shape[1],
-                        Program.memWriteProbFunc)
+                        actVars["memWriteProbs"])
 
         return self.registers[0]
 
+    """
+    Get the bid values for a batch of states, one per row of states. Each row
+    starts from its own row of registers (zeros if not given), the registers of
+    this learner are left untouched.
+    """
+    def bidBatch_def(self, states, registers=None, actVars=None):
+        if registers is None:
+            registers = np.zeros((len(states), len(self.registers)), dtype=self.registers.dtype)
+
+        instructions = self.program.getExecutionInstructions(len(self.registers), len(states[0]))
+
+        Program.executeBatch(Program.executeId, states, registers,
+                        instructions[0], instructions[1],
+                        instructions[2], instructions[3])
+
+        return registers[:,0]
+
+    """
+    Get the bid values for a batch of states, one per row of states. Passes memory
+    args to program, rows are done in order against the shared memory.
+    """
+    def bidBatch_mem(self, states, registers=None, actVars=None):
+        if registers is None:
+            registers = np.zeros((len(states), len(self.registers)), dtype=self.registers.dtype)
+
+        instructions = self.program.getExecutionInstructions(len(self.registers), len(states[0]),
+                        actVars["memMatrix"].size)
+
+        Program.executeBatch(Program.executeId, states, registers,
+                        instructions[0], instructions[1],
+                        instructions[2], instructions[3],
+                        actVars["memMatrix"], actVars["memMatrix"].shape[0], actVars["memMatrix"].shape[1],
+                        actVars["memWriteProbs"])
+
+        return registers[:,0]
+
     """
     Returns the action of this learner, either atomic, or requests the action
     from the action team.
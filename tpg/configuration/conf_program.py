@@ -1,14 +1,676 @@
 from numba import njit
 import numpy as np
-from numpy import pi, inf, NINF, float64, finfo
+from numpy import pi, inf, NINF, finfo
 from numpy.random import rand
 import math
 from math import isnan, cos, log, exp
 import random
-from tpg.utils import flip
-import uuid
+from tpg.utils import flip, newId, getRng
 import copy
 
+"""
+The numba kernels live at module level rather than in ConfProgram so that they
+can be cached on disk (cache=True), and don't get compiled again in every new
+process. None of them take functions as arguments, which numba can't cache. See
+tpg.warmup to compile them ahead of time.
+"""
+
+"""
+Executes the program which returns a single final value.
+"""
+@njit(cache=True)
+def execute_def(inpt, regs, modes, ops, dsts, srcs):
+    for i in range(len(modes)):
+        # first get source, operands are already in range, see
+        # Program.getExecutionInstructions
+        if modes[i] == 0:
+            src = regs[srcs[i]]
+        elif modes[i] == 1:
+            src = inpt[srcs[i]]
+        else:
+            src = 0.0 # no source (memory reads)
+
+
+        # get data for operation
+        op = ops[i]
+        x = regs[dsts[i]]
+        y = src
+        dest = dsts[i]
+
+        # do an operation
+        if op == 0:
+            regs[dest] = x+y
+        elif op == 1:
+            regs[dest] = x-y
+        elif op == 2:
+            regs[dest] = x*2
+        elif op == 3:
+            regs[dest] = x/2
+        elif op == 4:
+            if x < y:
+                regs[dest] = x*(-1)
+
+        if math.isnan(regs[dest]):
+            regs[dest] = 0
+        elif regs[dest] == np.inf:
+            regs[dest] = finfo(regs.dtype).max
+        elif regs[dest] == np.NINF:
+            regs[dest] = finfo(regs.dtype).min
+
+"""
+Executes the program which returns a single final value using shared memory.
+"""
+@njit(cache=True)
+def execute_mem(inpt, regs, modes, ops, dsts, srcs,
+        memMatrix, memRows, memCols, memWriteProbs):
+    for i in range(len(modes)):
+        # first get source, operands are already in range, see
+        # Program.getExecutionInstructions
+        if modes[i] == 0:
+            src = regs[srcs[i]]
+        elif modes[i] == 1:
+            src = inpt[srcs[i]]
+        else:
+            src = 0.0 # no source (memory reads)
+
+        # get data for operation
+        op = ops[i]
+        x = regs[dsts[i]]
+        y = src
+        dest = dsts[i]
+
+        # do an operation
+        if op == 0:
+            regs[dest] = x+y
+        elif op == 1:
+            regs[dest] = x-y
+        elif op == 2:
+            regs[dest] = x*2
+        elif op == 3:
+            regs[dest] = x/2
+        elif op == 4:
+            if x < y:
+                regs[dest] = x*(-1)
+        elif op == 5:
+            index = srcs[i]
+            row = int(index / memRows)
+            col = index % memCols
+            regs[dest] = memMatrix[row, col]
+        elif op == 6:
+            # row offset (start from center, go to edges)
+            halfRows = int(memRows/2) # halfRows
+            # one draw for each cell of the lower and upper half, all at once
+            draws = rand(halfRows, memCols, 2)
+            for r in range(halfRows):
+                # probability to write (gets smaller as r increases)
+                writeProb = memWriteProbs[r]
+                lower = (halfRows - r) - 1
+                upper = halfRows + r
+                # column to maybe write corresponding value into
+                for col in range(memCols):
+                    # try write to lower half
+                    if draws[r,col,0] < writeProb:
+                        memMatrix[lower,col] = regs[col]
+                    # try write to upper half
+                    if draws[r,col,1] < writeProb:
+                        memMatrix[upper,col] = regs[col]
+
+        if isnan(regs[dest]):
+            regs[dest] = 0
+        elif regs[dest] == inf:
+            regs[dest] = finfo(regs.dtype).max
+        elif regs[dest] == NINF:
+            regs[dest] = finfo(regs.dtype).min
+
+"""
+Executes the program which returns a single final value.
+"""
+@njit(cache=True)
+def execute_full(inpt, regs, modes, ops, dsts, srcs):
+    for i in range(len(modes)):
+        # first get source, operands are already in range, see
+        # Program.getExecutionInstructions
+        if modes[i] == 0:
+            src = regs[srcs[i]]
+        elif modes[i] == 1:
+            src = inpt[srcs[i]]
+        else:
+            src = 0.0 # no source (memory reads)
+
+        # get data for operation
+        op = ops[i]
+        x = regs[dsts[i]]
+        y = src
+        dest = dsts[i]
+
+        # do an operation
+        if op == 0:
+            regs[dest] = x+y
+        elif op == 1:
+            regs[dest] = x-y
+        elif op == 2:
+            regs[dest] = x*2
+        elif op == 3:
+            regs[dest] = x/2
+        elif op == 4:
+            if x < y:
+                regs[dest] = x*(-1)
+        elif op == 5:
+            regs[dest] = cos(y)
+        elif op == 6:
+            if y > 0:
+                regs[dest] = log(y)
+        elif op == 7:
+            regs[dest] = exp(y)
+
+        if isnan(regs[dest]):
+            regs[dest] = 0
+        elif regs[dest] == inf:
+            regs[dest] = finfo(regs.dtype).max
+        elif regs[dest] == NINF:
+            regs[dest] = finfo(regs.dtype).min
+
+"""
+Executes the program which returns a single final value using shared memory.
+"""
+@njit(cache=True)
+def execute_mem_full(inpt, regs, modes, ops, dsts, srcs,
+        memMatrix, memRows, memCols, memWriteProbs):
+    for i in range(len(modes)):
+        # first get source, operands are already in range, see
+        # Program.getExecutionInstructions
+        if modes[i] == 0:
+            src = regs[srcs[i]]
+        elif modes[i] == 1:
+            src = inpt[srcs[i]]
+        else:
+            src = 0.0 # no source (memory reads)
+
+        # get data for operation
+        op = ops[i]
+        x = regs[dsts[i]]
+        y = src
+        dest = dsts[i]
+
+        # do an operation
+        if op == 0:
+            regs[dest] = x+y
+        elif op == 1:
+            regs[dest] = x-y
+        elif op == 2:
+            regs[dest] = x*2
+        elif op == 3:
+            regs[dest] = x/2
+        elif op == 4:
+            if x < y:
+                regs[dest] = x*(-1)
+        elif op == 5:
+            regs[dest] = cos(y)
+        elif op == 6:
+            if y > 0:
+                regs[dest] = log(y)
+        elif op == 7:
+            regs[dest] = exp(y)
+        elif op == 8:
+            index = srcs[i]
+            row = int(index / memRows)
+            col = index % memCols
+            regs[dest] = memMatrix[row, col]
+        elif op == 9:
+            # row offset (start from center, go to edges)
+            halfRows = int(memRows/2) # halfRows
+            # one draw for each cell of the lower and upper half, all at once
+            draws = rand(halfRows, memCols, 2)
+            for r in range(halfRows):
+                # probability to write (gets smaller as r increases)
+                writeProb = memWriteProbs[r]
+                lower = (halfRows - r) - 1
+                upper = halfRows + r
+                # column to maybe write corresponding value into
+                for col in range(memCols):
+                    # try write to lower half
+                    if draws[r,col,0] < writeProb:
+                        memMatrix[lower,col] = regs[col]
+                    # try write to upper half
+                    if draws[r,col,1] < writeProb:
+                        memMatrix[upper,col] = regs[col]
+
+        if isnan(regs[dest]):
+            regs[dest] = 0
+        elif regs[dest] == inf:
+            regs[dest] = finfo(regs.dtype).max
+        elif regs[dest] == NINF:
+            regs[dest] = finfo(regs.dtype).min
+
+"""
+Executes the program which returns a single final value.
+"""
+@njit(cache=True)
+def execute_robo(inpt, regs, modes, ops, dsts, srcs):
+    for i in range(len(modes)):
+        # first get source, operands are already in range, see
+        # Program.getExecutionInstructions
+        if modes[i] == 0:
+            src = regs[srcs[i]]
+        elif modes[i] == 1:
+            src = inpt[srcs[i]]
+        else:
+            src = 0.0 # no source (memory reads)
+
+        # get data for operation
+        op = ops[i]
+        x = regs[dsts[i]]
+        y = src
+        dest = dsts[i]
+
+        # do an operation
+        if op == 0:
+            regs[dest] = x+y
+        elif op == 1:
+            regs[dest] = x-y
+        elif op == 2:
+            regs[dest] = x*y
+        elif op == 3:
+            if y != 0:
+                regs[dest] = x/y
+        elif op == 4:
+            if x < y:
+                regs[dest] = x*(-1)
+        elif op == 5:
+            regs[dest] = cos(y)
+
+        if isnan(regs[dest]):
+            regs[dest] = 0
+        elif regs[dest] == inf:
+            regs[dest] = finfo(regs.dtype).max
+        elif regs[dest] == NINF:
+            regs[dest] = finfo(regs.dtype).min
+
+"""
+Executes the program which returns a single final value.
+"""
+@njit(cache=True)
+def execute_mem_robo(inpt, regs, modes, ops, dsts, srcs,
+        memMatrix, memRows, memCols, memWriteProbs):
+    for i in range(len(modes)):
+        # first get source, operands are already in range, see
+        # Program.getExecutionInstructions
+        if modes[i] == 0:
+            src = regs[srcs[i]]
+        elif modes[i] == 1:
+            src = inpt[srcs[i]]
+        else:
+            src = 0.0 # no source (memory reads)
+
+        # get data for operation
+        op = ops[i]
+        x = regs[dsts[i]]
+        y = src
+        dest = dsts[i]
+
+        # do an operation
+        if op == 0:
+            regs[dest] = x+y
+        elif op == 1:
+            regs[dest] = x-y
+        elif op == 2:
+            regs[dest] = x*y
+        elif op == 3:
+            if y != 0:
+                regs[dest] = x/y
+        elif op == 4:
+            if x < y:
+                regs[dest] = x*(-1)
+        elif op == 5:
+            regs[dest] = cos(y)
+        elif op == 6:
+            index = srcs[i]
+            row = int(index / memRows)
+            col = index % memCols
+            regs[dest] = memMatrix[row, col]
+        elif op == 7:
+            # row offset (start from center, go to edges)
+            halfRows = int(memRows/2) # halfRows
+            # one draw for each cell of the lower and upper half, all at once
+            draws = rand(halfRows, memCols, 2)
+            for r in range(halfRows):
+                # probability to write (gets smaller as r increases)
+                writeProb = memWriteProbs[r]
+                lower = (halfRows - r) - 1
+                upper = halfRows + r
+                # column to maybe write corresponding value into
+                for col in range(memCols):
+                    # try write to lower half
+                    if draws[r,col,0] < writeProb:
+                        memMatrix[lower,col] = regs[col]
+                    # try write to upper half
+                    if draws[r,col,1] < writeProb:
+                        memMatrix[upper,col] = regs[col]
+
+        if isnan(regs[dest]):
+            regs[dest] = 0
+        elif regs[dest] == inf:
+            regs[dest] = finfo(regs.dtype).max
+        elif regs[dest] == NINF:
+            regs[dest] = finfo(regs.dtype).min
+
+"""
+Runs the execute function numbered variant (0 def, 1 full, 2 robo). Kernels
+that run programs call this rather than taking the execute function as an
+argument, which would stop numba from caching them.
+"""
+@njit(cache=True)
+def executeVariant(variant, inpt, regs, modes, ops, dsts, srcs):
+    if variant == 0:
+        execute_def(inpt, regs, modes, ops, dsts, srcs)
+    elif variant == 1:
+        execute_full(inpt, regs, modes, ops, dsts, srcs)
+    else:
+        execute_robo(inpt, regs, modes, ops, dsts, srcs)
+
+"""
+Runs the memory execute function numbered variant (0 mem, 1 mem_full,
+2 mem_robo), see executeVariant.
+"""
+@njit(cache=True)
+def executeVariant_mem(variant, inpt, regs, modes, ops, dsts, srcs,
+        memMatrix, memRows, memCols, memWriteProbs):
+    if variant == 0:
+        execute_mem(inpt, regs, modes, ops, dsts, srcs,
+            memMatrix, memRows, memCols, memWriteProbs)
+    elif variant == 1:
+        execute_mem_full(inpt, regs, modes, ops, dsts, srcs,
+            memMatrix, memRows, memCols, memWriteProbs)
+    else:
+        execute_mem_robo(inpt, regs, modes, ops, dsts, srcs,
+            memMatrix, memRows, memCols, memWriteProbs)
+
+"""
+Executes the program on each row of inpts, using the matching row of regs as
+the registers. The whole batch is done in one call, variant is the execute
+function to use (see executeVariant).
+"""
+@njit(cache=True)
+def executeBatch_def(variant, inpts, regs, modes, ops, dsts, srcs):
+    for n in range(len(inpts)):
+        executeVariant(variant, inpts[n], regs[n], modes, ops, dsts, srcs)
+
+"""
+Executes the program on each row of inpts using shared memory. Rows are done
+in order, so memory written on one row is seen by the rows after it.
+"""
+@njit(cache=True)
+def executeBatch_mem(variant, inpts, regs, modes, ops, dsts, srcs,
+        memMatrix, memRows, memCols, memWriteProbs):
+    for n in range(len(inpts)):
+        executeVariant_mem(variant, inpts[n], regs[n], modes, ops, dsts, srcs,
+            memMatrix, memRows, memCols, memWriteProbs)
+
+"""
+Executes the programs of all of a team's learners in one call, returning the
+index of the valid learner with the highest bid (first one on ties), or -1 if
+none are valid. insts holds every program back to back as rows of modes, ops,
+dsts and srcs, learner l's program being columns offsets[l] to offsets[l+1].
+Only stale learners are executed, the rest already bid this frame.
+"""
+@njit(cache=True)
+def executeTeam_def(variant, inpt, regs, insts, offsets, valid, stale):
+    top = -1
+    for l in range(len(offsets)-1):
+        if not valid[l]:
+            continue
+
+        if stale[l]:
+            start = offsets[l]
+            end = offsets[l+1]
+            executeVariant(variant, inpt, regs[l], insts[0,start:end], insts[1,start:end],
+                insts[2,start:end], insts[3,start:end])
+
+        if top == -1 or regs[l,0] > regs[top,0]:
+            top = l
+
+    return top
+
+"""
+Executes the programs of all of a team's learners in one call using shared
+memory, returning the index of the top valid learner.
+"""
+@njit(cache=True)
+def executeTeam_mem(variant, inpt, regs, insts, offsets, valid, stale,
+        memMatrix, memRows, memCols, memWriteProbs):
+    top = -1
+    for l in range(len(offsets)-1):
+        if not valid[l]:
+            continue
+
+        if stale[l]:
+            start = offsets[l]
+            end = offsets[l+1]
+            executeVariant_mem(variant, inpt, regs[l], insts[0,start:end], insts[1,start:end],
+                insts[2,start:end], insts[3,start:end],
+                memMatrix, memRows, memCols, memWriteProbs)
+
+        if top == -1 or regs[l,0] > regs[top,0]:
+            top = l
+
+    return top
+
+"""
+Traverses a whole compiled agent graph in one call, returning the index of
+the atomic learner that ends the traversal, or -1 if a team is reached with
+no valid learners. Team t has learners teamLearners[teamOffsets[t] to
+teamOffsets[t+1]], learnerTeams[l] is the team learner l points to or -1 if
+atomic, and programs are packed as in executeTeam. A team or learner has
+been visited (or bid) this act if its entry in the stamp arrays equals
+stamp. Team 0 is the root. If learnerTrav, learners rather than teams are
+marked visited, as in Team.act_learnerTrav.
+"""
+@njit(cache=True)
+def executeGraph_def(variant, inpt, regs, insts, instOffsets, teamOffsets,
+        teamLearners, learnerTeams, teamStamps, bidStamps, visitStamps,
+        stamp, learnerTrav):
+    team = 0
+    while True:
+        teamStamps[team] = stamp
+
+        top = -1
+        for e in range(teamOffsets[team], teamOffsets[team+1]):
+            l = teamLearners[e]
+            if learnerTeams[l] != -1:
+                if learnerTrav and visitStamps[l] == stamp:
+                    continue
+                if not learnerTrav and teamStamps[learnerTeams[l]] == stamp:
+                    continue
+
+            if bidStamps[l] != stamp:
+                bidStamps[l] = stamp
+                start = instOffsets[l]
+                end = instOffsets[l+1]
+                executeVariant(variant, inpt, regs[l], insts[0,start:end], insts[1,start:end],
+                    insts[2,start:end], insts[3,start:end])
+
+            if top == -1 or regs[l,0] > regs[top,0]:
+                top = l
+
+        if top == -1 or learnerTeams[top] == -1:
+            return top
+
+        visitStamps[top] = stamp
+        team = learnerTeams[top]
+
+"""
+Traverses a whole compiled agent graph in one call using shared memory,
+returning the index of the atomic learner that ends the traversal.
+"""
+@njit(cache=True)
+def executeGraph_mem(variant, inpt, regs, insts, instOffsets, teamOffsets,
+        teamLearners, learnerTeams, teamStamps, bidStamps, visitStamps,
+        stamp, learnerTrav,
+        memMatrix, memRows, memCols, memWriteProbs):
+    team = 0
+    while True:
+        teamStamps[team] = stamp
+
+        top = -1
+        for e in range(teamOffsets[team], teamOffsets[team+1]):
+            l = teamLearners[e]
+            if learnerTeams[l] != -1:
+                if learnerTrav and visitStamps[l] == stamp:
+                    continue
+                if not learnerTrav and teamStamps[learnerTeams[l]] == stamp:
+                    continue
+
+            if bidStamps[l] != stamp:
+                bidStamps[l] = stamp
+                start = instOffsets[l]
+                end = instOffsets[l+1]
+                executeVariant_mem(variant, inpt, regs[l], insts[0,start:end], insts[1,start:end],
+                    insts[2,start:end], insts[3,start:end],
+                    memMatrix, memRows, memCols, memWriteProbs)
+
+            if top == -1 or regs[l,0] > regs[top,0]:
+                top = l
+
+        if top == -1 or learnerTeams[top] == -1:
+            return top
+
+        visitStamps[top] = stamp
+        team = learnerTeams[top]
+
+"""
+Returns probability of write at given index using default distribution.
+"""
+@njit(cache=True)
+def memWriteProb_def(i):
+    return 0.25 - (0.01*i)**2
+
+"""
+Returns probability of write at given index using cauchy distribution with
+lambda = 1.
+"""
+@njit(cache=True)
+def memWriteProb_cauchy1(i):
+    return 1/(pi*(i**2+1))
+
+"""
+Returns probability of write at given index using cauchy distribution with
+lambda = 1/2.
+"""
+@njit(cache=True)
+def memWriteProb_cauchyHalf(i):
+    return 0.25/(0.5*pi*(i**2+0.25))
+
+"""
+Gets a value from 0 to maxVal (inclusive) from a uniform draw in [0, 1).
+"""
+@njit(cache=True)
+def drawInt(draw, maxVal):
+    return min(int(draw*(maxVal+1)), maxVal)
+
+"""
+Number of uniform draws one pass of mutateBuffer uses: the delete
+flip and row, the mutate flip, row, column and value, the swap flip and two
+rows, the add flip and row, and the 4 values of the added instruction.
+"""
+mutateDraws = 15
+
+"""
+Mutates the first length rows of buffer (instructions, see Program) in place,
+pass by pass with a row of draws each, until a pass changes something. Each
+pass maybe deletes a row, changes one value, swaps two rows and adds a row,
+with probabilities probs (pInstDel, pInstMut, pInstSwp, pInstAdd). maxVals
+are the largest values of each column. Buffer needs a row to spare for each
+pass. Returns the new length and the number of passes used, 0 if none
+changed anything (draw more and call it again).
+"""
+@njit(cache=True)
+def mutateBuffer(buffer, length, draws, probs, maxVals):
+    for p in range(draws.shape[0]):
+        d = draws[p]
+        changed = False
+
+        # maybe delete an instruction
+        if length > 1 and d[0] < probs[0]:
+            for r in range(drawInt(d[1], length-1), length-1):
+                for c in range(4):
+                    buffer[r,c] = buffer[r+1,c]
+            length -= 1
+            changed = True
+
+        # maybe change a value of an instruction
+        if d[2] < probs[1]:
+            r = drawInt(d[3], length-1)
+            c = drawInt(d[4], 3)
+            value = drawInt(d[5], maxVals[c])
+            if buffer[r,c] != value:
+                buffer[r,c] = value
+                changed = True
+
+        # maybe swap two instructions
+        if length > 1 and d[6] < probs[2]:
+            r1 = drawInt(d[7], length-1)
+            r2 = drawInt(d[8], length-2)
+            if r2 >= r1:
+                r2 += 1
+            for c in range(4):
+                value = buffer[r1,c]
+                if value != buffer[r2,c]:
+                    buffer[r1,c] = buffer[r2,c]
+                    buffer[r2,c] = value
+                    changed = True
+
+        # maybe add an instruction
+        if d[9] < probs[3]:
+            r = drawInt(d[10], length)
+            for i in range(length, r, -1):
+                for c in range(4):
+                    buffer[i,c] = buffer[i-1,c]
+            for c in range(4):
+                buffer[r,c] = drawInt(d[11+c], maxVals[c])
+            length += 1
+            changed = True
+
+        if changed:
+            return length, p+1
+
+    return length, 0
+
+"""
+Mutates each of programs (until it changes, see mutateBuffer) in
+its own buffer, with the draws for all of them taken at once from the numpy
+Generator in mutateParams (see utils.getRng). Each program gets a new id.
+passes is how many passes are drawn for each program up front, more are only
+drawn for programs none of those changed. Raises ValueError if a mutated
+program isn't valid (see Program.validate).
+"""
+def mutatePrograms(programs, mutateParams, passes=2):
+    probs = np.array([mutateParams["pInstDel"], mutateParams["pInstMut"],
+        mutateParams["pInstSwp"], mutateParams["pInstAdd"]], dtype=np.float64)
+    if not np.any(probs > 0):
+        raise ValueError("Can't mutate programs with pInstDel, pInstMut, pInstSwp and pInstAdd all 0")
+    maxVals = np.array([1, mutateParams["nOperations"]-1, mutateParams["nDestinations"]-1,
+        mutateParams["inputSize"]-1], dtype=np.int64)
+
+    rng = getRng(mutateParams)
+    draws = rng.random((len(programs), passes, mutateDraws))
+    for program, programDraws in zip(programs, draws):
+        program.reserve(program.length + passes)
+        length, used = mutateBuffer(program.buffer, program.length,
+            programDraws, probs, maxVals)
+        while used == 0: # rare, e.g. low probabilities or setting a value to what it was
+            program.reserve(length + passes)
+            length, used = mutateBuffer(program.buffer, length,
+                rng.random((passes, mutateDraws)), probs, maxVals)
+        program.length = length
+
+        program.validate() # like the per-program mutation, before the kernels see it
+
+        program.id = newId(mutateParams, "idCountProgram")
+        program.effectiveInstructions = None
+        program.executionInstructions = None
+
+    return programs
+
 """
 A program that is executed to help obtain the bid for a learner.
 """
@@ -26,431 +688,70 @@ class ConfProgram:
                     random.randint(0, nDestinations-1),
                     random.randint(0, inputSize-1))
                 for _ in range(random.randint(1, maxProgramLength))], dtype=np.int32)
+        self.validate()
 
-        self.id = uuid.uuid4()
+        # programs made outside of a trainer don't get an id
+        self.id = newId(initParams, "idCountProgram") if initParams is not None else None
 
+        # instructions that can affect the bid, see getEffectiveInstructions
+        self.effectiveInstructions = None
+        self.effectiveRegisters = None
+        self.effectiveHash = None
+        # instructions ready for execute, see getExecutionInstructions
+        self.executionInstructions = None
+        self.executionKey = None
 
-    """
-    Executes the program which returns a single final value.
-    """
-    @njit
-    def execute_def(inpt, regs, modes, ops, dsts, srcs):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*2
-            elif op == 3:
-                regs[dest] = x/2
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-
-            if math.isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == np.inf:
-                regs[dest] = np.finfo(np.float64).max
-            elif regs[dest] == np.NINF:
-                regs[dest] = np.finfo(np.float64).min
-
-    """
-    Executes the program which returns a single final value using shared memory.
-    """
-    @njit
-    def execute_mem(inpt, regs, modes, ops, dsts, srcs,
-            memMatrix, memRows, memCols, memWriteProbFunc):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*2
-            elif op == 3:
-                regs[dest] = x/2
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-            elif op == 5:
-                index = srcs[i]
-                index %= (memRows*memCols)
-                row = int(index / memRows)
-                col = index % memCols
-                regs[dest] = memMatrix[row, col]
-            elif op == 6:
-                # row offset (start from center, go to edges)
-                halfRows = int(memRows/2) # halfRows
-                for i in range(halfRows):
-                    # probability to write (gets smaller as i increases)
-                    # TODO: swap out write prob func by passing in an array of values for that row.
-                    writeProb = memWriteProbFunc(i)
-                    # column to maybe write corresponding value into
-                    for col in range(memCols):
-                        # try write to lower half
-                        if rand(1)[0] < writeProb:
-                            row = (halfRows - i) - 1
-                            memMatrix[row,col] = regs[col]
-                        # try write to upper half
-                        if rand(1)[0] < writeProb:
-                            row = halfRows + i
-                            memMatrix[row,col] = regs[col]
-
-            if isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == inf:
-                regs[dest] = finfo(float64).max
-            elif regs[dest] == NINF:
-                regs[dest] = finfo(float64).min
 
     """
-    Executes the program which returns a single final value.
+    What each operation of an execute function does, used to find the effective
+    instructions of a program. One row per operation, columns are: reads the
+    destination register, reads the source, writes the destination register,
+    writes memory (reading all registers to do so), reads memory at the source.
     """
-    @njit
-    def execute_full(inpt, regs, modes, ops, dsts, srcs):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*2
-            elif op == 3:
-                regs[dest] = x/2
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-            elif op == 5:
-                regs[dest] = cos(y)
-            elif op == 6:
-                if y > 0:
-                    regs[dest] = log(y)
-            elif op == 7:
-                regs[dest] = exp(y)
-
-            if isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == inf:
-                regs[dest] = finfo(float64).max
-            elif regs[dest] == NINF:
-                regs[dest] = finfo(float64).min
+    opTraits_def = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,0,1,0,0), (1,0,1,0,0), (1,1,1,0,0)], dtype=bool)
+    opTraits_mem = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,0,1,0,0), (1,0,1,0,0), (1,1,1,0,0),
+        (0,0,1,0,1), (0,0,0,1,0)], dtype=bool)
+    opTraits_full = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,0,1,0,0), (1,0,1,0,0), (1,1,1,0,0),
+        (0,1,1,0,0), (1,1,1,0,0), (0,1,1,0,0)], dtype=bool)
+    opTraits_mem_full = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,0,1,0,0), (1,0,1,0,0), (1,1,1,0,0),
+        (0,1,1,0,0), (1,1,1,0,0), (0,1,1,0,0), (0,0,1,0,1), (0,0,0,1,0)], dtype=bool)
+    opTraits_robo = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,1,1,0,0), (1,1,1,0,0), (1,1,1,0,0),
+        (0,1,1,0,0)], dtype=bool)
+    opTraits_mem_robo = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,1,1,0,0), (1,1,1,0,0), (1,1,1,0,0),
+        (0,1,1,0,0), (0,0,1,0,1), (0,0,0,1,0)], dtype=bool)
+
+    # the kernels, defined above
+    execute_def = execute_def
+    execute_mem = execute_mem
+    execute_full = execute_full
+    execute_mem_full = execute_mem_full
+    execute_robo = execute_robo
+    execute_mem_robo = execute_mem_robo
+    executeBatch_def = executeBatch_def
+    executeBatch_mem = executeBatch_mem
+    executeTeam_def = executeTeam_def
+    executeTeam_mem = executeTeam_mem
+    executeGraph_def = executeGraph_def
+    executeGraph_mem = executeGraph_mem
+    executeVariant = executeVariant
+    executeVariant_mem = executeVariant_mem
+    memWriteProb_def = memWriteProb_def
+    memWriteProb_cauchy1 = memWriteProb_cauchy1
+    memWriteProb_cauchyHalf = memWriteProb_cauchyHalf
 
     """
-    Executes the program which returns a single final value using shared memory.
-    """
-    @njit
-    def execute_mem_full(inpt, regs, modes, ops, dsts, srcs,
-            memMatrix, memRows, memCols, memWriteProbFunc):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*2
-            elif op == 3:
-                regs[dest] = x/2
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-            elif op == 5:
-                regs[dest] = cos(y)
-            elif op == 6:
-                if y > 0:
-                    regs[dest] = log(y)
-            elif op == 7:
-                regs[dest] = exp(y)
-            elif op == 8:
-                index = srcs[i]
-                index %= (memRows*memCols)
-                row = int(index / memRows)
-                col = index % memCols
-                regs[dest] = memMatrix[row, col]
-            elif op == 9:
-                # row offset (start from center, go to edges)
-                halfRows = int(memRows/2) # halfRows
-                for i in range(halfRows):
-                    # probability to write (gets smaller as i increases)
-                    # TODO: swap out write prob func by passing in an array of values for that row.
-                    writeProb = memWriteProbFunc(i)
-                    # column to maybe write corresponding value into
-                    for col in range(memCols):
-                        # try write to lower half
-                        if rand(1)[0] < writeProb:
-                            row = (halfRows - i) - 1
-                            memMatrix[row,col] = regs[col]
-                        # try write to upper half
-                        if rand(1)[0] < writeProb:
-                            row = halfRows + i
-                            memMatrix[row,col] = regs[col]
-
-            if isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == inf:
-                regs[dest] = finfo(float64).max
-            elif regs[dest] == NINF:
-                regs[dest] = finfo(float64).min
-
-    """
-    Executes the program which returns a single final value.
-    """
-    @njit
-    def execute_robo(inpt, regs, modes, ops, dsts, srcs):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*y
-            elif op == 3:
-                if y != 0:
-                    regs[dest] = x/y
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-            elif op == 5:
-                regs[dest] = cos(y)
-
-            if isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == inf:
-                regs[dest] = finfo(float64).max
-            elif regs[dest] == NINF:
-                regs[dest] = finfo(float64).min
-
-    """
-    Executes the program which returns a single final value.
-    """
-    @njit
-    def execute_mem_robo(inpt, regs, modes, ops, dsts, srcs,
-            memMatrix, memRows, memCols, memWriteProbFunc):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*y
-            elif op == 3:
-                if y != 0:
-                    regs[dest] = x/y
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-            elif op == 5:
-                regs[dest] = cos(y)
-            elif op == 6:
-                index = srcs[i]
-                index %= (memRows*memCols)
-                row = int(index / memRows)
-                col = index % memCols
-                regs[dest] = memMatrix[row, col]
-            elif op == 7:
-                # row offset (start from center, go to edges)
-                halfRows = int(memRows/2) # halfRows
-                for i in range(halfRows):
-                    # probability to write (gets smaller as i increases)
-                    # TODO: swap out write prob func by passing in an array of values for that row.
-                    writeProb = memWriteProbFunc(i)
-                    # column to maybe write corresponding value into
-                    for col in range(memCols):
-                        # try write to lower half
-                        if rand(1)[0] < writeProb:
-                            row = (halfRows - i) - 1
-                            memMatrix[row,col] = regs[col]
-                        # try write to upper half
-                        if rand(1)[0] < writeProb:
-                            row = halfRows + i
-                            memMatrix[row,col] = regs[col]
-
-            if isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == inf:
-                regs[dest] = finfo(float64).max
-            elif regs[dest] == NINF:
-                regs[dest] = finfo(float64).min
-
-    """
-    Returns probability of write at given index using default distribution.
-    """
-    @njit
-    def memWriteProb_def(i):
-        return 0.25 - (0.01*i)**2
-
-    """
-    Returns probability of write at given index using cauchy distribution with
-    lambda = 1.
-    """
-    @njit
-    def memWriteProb_cauchy1(i):
-        return 1/(pi*(i**2+1))
-
-    """
-    Returns probability of write at given index using cauchy distribution with
-    lambda = 1/2.
-    """
-    @njit
-    def memWriteProb_cauchyHalf(i):
-        return 0.25/(0.5*pi*(i**2+0.25))
-
-    """
-    Mutates the program, by performing some operations on the instructions.
+    Mutates the program, by performing some operations on the instructions
+    until they change, in place, see mutatePrograms.
     """
     def mutate_def(self, mutateParams):
-        # Make a copy of our original instructions
-        original_instructions = copy.deepcopy(self.instructions)
-
-        # Since we're mutating change our id
-        self.id = uuid.uuid4()
-
-        # While we haven't changed from our original instructions keep mutating
-        while np.array_equal(self.instructions, original_instructions):
-            # maybe delete instruction
-            if len(self.instructions) > 1 and flip(mutateParams["pInstDel"]):
-                # delete random row/instruction
-                self.instructions = np.delete(self.instructions,
-                                    random.randint(0, len(self.instructions)-1),
-                                    0)
-
-                
-
-            # maybe mutate an instruction (flip a bit)
-            if flip(mutateParams["pInstMut"]):
-                # index of instruction and part of instruction
-                idx1 = random.randint(0, len(self.instructions)-1)
-                idx2 = random.randint(0,3)
-
-                # change max value depending on part of instruction
-                if idx2 == 0:
-                    maxVal = 1
-                elif idx2 == 1:
-                    maxVal = mutateParams["nOperations"]-1
-                elif idx2 == 2:
-                    maxVal = mutateParams["nDestinations"]-1
-                elif idx2 == 3:
-                    maxVal = mutateParams["inputSize"]-1
-
-                # change it
-                self.instructions[idx1, idx2] = random.randint(0, maxVal)
-
-                
-
-            # maybe swap two instructions
-            if len(self.instructions) > 1 and flip(mutateParams["pInstSwp"]):
-                # indices to swap
-                idx1, idx2 = random.sample(range(len(self.instructions)), 2)
-
-                # do swap
-                tmp = np.array(self.instructions[idx1])
-                self.instructions[idx1] = np.array(self.instructions[idx2])
-                self.instructions[idx2] = tmp
-
-                
-
-            # maybe add instruction
-            if flip(mutateParams["pInstAdd"]):
-                # insert new random instruction
-                self.instructions = np.insert(self.instructions,
-                        random.randint(0,len(self.instructions)),
-                            (random.randint(0,1),
-                            random.randint(0, mutateParams["nOperations"]-1),
-                            random.randint(0, mutateParams["nDestinations"]-1),
-                            random.randint(0, mutateParams["inputSize"]-1)),0)
-            
-            return self
+        mutatePrograms([self], mutateParams)
+        return self
 
     """
     Potentially modifies the instructions in a few ways.
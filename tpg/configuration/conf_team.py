@@ -1,8 +1,10 @@
 from tpg import learner
-from tpg.utils import flip
+from tpg.utils import flip, newHandle, newId
 from tpg.learner import Learner
+from tpg.program import Program
+from tpg.population import LearnerSampler
+import numpy as np
 import random
-import uuid
 
 """
 The main building block of TPG. Each team has multiple learning which decide the
@@ -12,37 +14,51 @@ class ConfTeam:
 
     def init_def(self, initParams):
         self.learners = []
-        self.outcomes = {} # scores at various tasks
+        self.outcomes = {} # scores at various tasks, see OutcomeTable
         self.fitness = None
         self.inLearners = [] # ids of learners referencing this team
-        self.id = uuid.uuid4()
+        self.roots = None # RootSet of the trainer tracking this team, if any
+        self.collector = None # Collector of the trainer tracking this team, if any
+        self.id = newId(initParams, "idCountTeam")
+        self.handle = newHandle() # for visited checks while acting
 
         self.genCreate = initParams["generation"]
 
+        # learners' programs packed together for Program.executeTeam, see packLearners
+        self.packedInstructions = None
+        self.packedOffsets = None
+        self.packedKey = None
+        self.packedIds = None # ids of the packed learners, for DecisionTrace
+
     """
     Returns an action to use based on the current state. Team traversal.
-    NOTE: Do not set visited = list() because that will only be
-    evaluated once, and thus won't create a new list every time.
+    visited is the set of handles of the teams visited so far this act.
+    NOTE: Do not set visited = set() because that will only be
+    evaluated once, and thus won't create a new set every time.
     """
     def act_def(self, state, visited, actVars=None, path_trace=None):
 
         # If we've already visited me, throw an exception
-        if str(self.id) in visited:
+        if self.handle in visited:
             print("Visited:")
             for i,cursor in enumerate(visited):
                 print("{}|{}".format(i, cursor))
-            raise(Exception("Already visited team {}!".format(str(self.id))))
+            raise(Exception("Already visited team {}!".format(self.id)))
 
-        # Add this team's id to the list of visited ids
-        visited.append(str(self.id)) 
+        # Add this team's handle to the set of visited handles
+        visited.add(self.handle)
         
         '''
         Valid learners are ones which:
             * Are action atomic
             * Whose team we have not yet visited
         '''
-        valid_learners = [lrnr for lrnr in self.learners
-                if lrnr.isActionAtomic() or str(lrnr.getActionTeam().id) not in visited]
+        valid = np.array([lrnr.isActionAtomic() or lrnr.getActionTeam().handle not in visited
+                for lrnr in self.learners], dtype=bool)
+        if not valid.any():
+            raise ValueError("No valid learners on team {}!".format(self.id))
+
+        top_learner = self.learners[self.topLearner(state, valid, actVars=actVars)]
 
         """if len(valid_learners) == 0:
             print("checking learner visiteds")
@@ -54,11 +70,6 @@ class ConfTeam:
                     print("Team: " + str(learner.getActionTeam().id))
             print("")"""
 
-
-        top_learner = max(valid_learners,
-            key=lambda lrnr: lrnr.bid(state, actVars=actVars))
-
-    
         # If we're tracing this path
         if path_trace != None:
             
@@ -66,20 +77,20 @@ class ConfTeam:
 
             # Create our path segment
             path_segment =  {
-                'team_id': str(self.id),
-                'top_learner': str(top_learner.id),
+                'team_id': self.id,
+                'top_learner': top_learner.id,
                 'top_bid': top_learner.bid(state, actVars=actVars),
-                'top_action': top_learner.actionObj.actionCode if top_learner.isActionAtomic() else str(top_learner.actionObj.teamAction.id),
+                'top_action': top_learner.actionObj.actionCode if top_learner.isActionAtomic() else top_learner.actionObj.teamAction.id,
                 'depth': last_segment['depth'] + 1 if last_segment != None else 0,# Record path depth
                 'bids': []
             }
 
             # Populate bid values
-            for cursor in valid_learners:
+            for cursor in [lrnr for lrnr, v in zip(self.learners, valid) if v]:
                 path_segment['bids'].append({
-                    'learner_id': str(cursor.id),
+                    'learner_id': cursor.id,
                     'bid': cursor.bid(state, actVars=actVars),
-                    'action': cursor.actionObj.actionCode if cursor.isActionAtomic() else str(cursor.actionObj.teamAction.id)
+                    'action': cursor.actionObj.actionCode if cursor.isActionAtomic() else cursor.actionObj.teamAction.id
                 })
 
             # Append our path segment to the trace
@@ -93,11 +104,12 @@ class ConfTeam:
     """
     def act_learnerTrav(self, state, visited, actVars=None, path_trace=None):
 
-        valid_learners = [lrnr for lrnr in self.learners
-                if lrnr.isActionAtomic() or str(lrnr.id) not in visited]
+        valid = np.array([lrnr.isActionAtomic() or lrnr.handle not in visited
+                for lrnr in self.learners], dtype=bool)
+        if not valid.any():
+            raise ValueError("No valid learners on team {}!".format(self.id))
 
-        top_learner = max(valid_learners,
-            key=lambda lrnr: lrnr.bid(state, actVars=actVars))
+        top_learner = self.learners[self.topLearner(state, valid, actVars=actVars)]
 
         # If we're tracing this path
         if path_trace != None:
@@ -105,28 +117,97 @@ class ConfTeam:
 
             # Create our path segment
             path_segment =  {
-                'team_id': str(self.id),
-                'top_learner': str(top_learner.id),
+                'team_id': self.id,
+                'top_learner': top_learner.id,
                 'top_bid': top_learner.bid(state, actVars=actVars),
-                'top_action': top_learner.actionObj.actionCode if top_learner.isActionAtomic() else str(top_learner.actionObj.teamAction.id),
+                'top_action': top_learner.actionObj.actionCode if top_learner.isActionAtomic() else top_learner.actionObj.teamAction.id,
                 'depth': last_segment['depth'] + 1 if last_segment != None else 0,# Record path depth
                 'bids': []
             }
 
             # Populate bid values
-            for cursor in valid_learners:
+            for cursor in [lrnr for lrnr, v in zip(self.learners, valid) if v]:
                 path_segment['bids'].append({
-                    'learner_id': str(cursor.id),
+                    'learner_id': cursor.id,
                     'bid': cursor.bid(state, actVars=actVars),
-                    'action': cursor.actionObj.actionCode if cursor.isActionAtomic() else str(cursor.actionObj.teamAction.id)
+                    'action': cursor.actionObj.actionCode if cursor.isActionAtomic() else cursor.actionObj.teamAction.id
                 })
 
             # Append our path segment to the trace
             path_trace.append(path_segment)
 
-        visited.append(str(top_learner.id))
+        visited.add(top_learner.handle)
         return top_learner.getAction(state, visited=visited, actVars=actVars, path_trace=path_trace)
 
+    """
+    Gets the index of the valid learner with the highest bid, running all of the
+    learners' programs in one call. Learners that already bid this frame keep
+    their bid, same as Learner.bid.
+    """
+    def topLearner_def(self, state, valid, actVars=None):
+        if self.packedInstructions is None or self.packedKey != (len(state), 0):
+            self.packLearners(len(state))
+
+        registers = np.array([lrnr.registers for lrnr in self.learners])
+        stale = np.array([lrnr.frameNum != actVars["frameNum"]
+            for lrnr in self.learners], dtype=bool)
+        update = valid & stale
+
+        # skip learners whose program already ran this frame from the same registers
+        bidCache = actVars.get("bidCache")
+        if bidCache is not None:
+            keys = [None]*len(self.learners)
+            for i in np.flatnonzero(update):
+                keys[i], cached = bidCache.lookup(actVars["frameNum"],
+                    self.learners[i].program, registers[i])
+                if cached is not None:
+                    registers[i] = cached
+                    stale[i] = False
+
+        top = Program.executeTeam(Program.executeId, state, registers,
+            self.packedInstructions, self.packedOffsets, valid, stale)
+
+        for i in np.flatnonzero(update):
+            self.learners[i].registers[:] = registers[i]
+            self.learners[i].frameNum = actVars["frameNum"]
+            if bidCache is not None and stale[i]:
+                bidCache.store(keys[i], registers[i])
+
+        trace = actVars.get("trace")
+        if trace is not None:
+            trace.record(self.id, self.packedIds, registers[:,0], valid, top)
+
+        return top
+
+    """
+    Gets the index of the valid learner with the highest bid, running all of the
+    learners' programs in one call. Passes memory args to program.
+    """
+    def topLearner_mem(self, state, valid, actVars=None):
+        memSize = actVars["memMatrix"].size
+        if self.packedInstructions is None or self.packedKey != (len(state), memSize):
+            self.packLearners(len(state), memSize)
+
+        registers = np.array([lrnr.registers for lrnr in self.learners])
+        stale = np.array([lrnr.frameNum != actVars["frameNum"]
+            for lrnr in self.learners], dtype=bool)
+
+        top = Program.executeTeam(Program.executeId, state, registers,
+            self.packedInstructions, self.packedOffsets, valid, stale,
+            actVars["memMatrix"], actVars["memMatrix"].shape[0], actVars["memMatrix"].shape[1],
+            actVars["memWriteProbs"])
+
+        for i, lrnr in enumerate(self.learners):
+            if valid[i] and stale[i]:
+                lrnr.registers[:] = registers[i]
+                lrnr.frameNum = actVars["frameNum"]
+
+        trace = actVars.get("trace")
+        if trace is not None:
+            trace.record(self.id, self.packedIds, registers[:,0], valid, top)
+
+        return top
+
     """
     Adds learner to the team and updates number of references to that program.
     """
@@ -134,7 +215,8 @@ class ConfTeam:
         program = learner.program
 
         self.learners.append(learner)
-        learner.inTeams.append(str(self.id)) # Add this team's id to the list of teams that reference the learner
+        learner.inTeams.append(self.id) # Add this team's id to the list of teams that reference the learner
+        self.packedInstructions = None
 
         return True
 
@@ -148,7 +230,7 @@ class ConfTeam:
         '''
         if learner not in self.learners:
             raise Exception("Attempted to remove a learner ({}) not referenced by team {}".format(
-            str(learner.id), str(self.id)
+            learner.id, self.id
         ))
 
         # Find the learner to remove
@@ -159,20 +241,26 @@ class ConfTeam:
 
         # Build a new list of learners containing only learners that are not the learner
         self.learners = [cursor for cursor in self.learners if cursor != learner ]
+        self.packedInstructions = None
 
         # Remove our id from the learner's inTeams
         # NOTE: Have to do this after removing the learner otherwise, removal will fail 
         # since the learner's inTeams will not match 
-        to_remove.inTeams.remove(str(self.id))
+        to_remove.inTeams.remove(self.id)
+        if self.collector is not None and len(to_remove.inTeams) == 0:
+            self.collector.queue(to_remove)
 
     """
     Bulk removes learners from teams.
     """
     def removeLearners_def(self):
         for learner in self.learners:
-            learner.inTeams.remove(str(self.id))
+            learner.inTeams.remove(self.id)
+            if self.collector is not None and len(learner.inTeams) == 0:
+                self.collector.queue(learner)
 
         del self.learners[:]
+        self.packedInstructions = None
 
     """
     Number of learners with atomic actions on this team.
@@ -213,6 +301,7 @@ class ConfTeam:
 
         mutation_delta = {}
         new_learners = []
+        sampler = LearnerSampler(allLearners)
 
         for i in range(rampantReps):
             #print("i/rampant reps:  {}/{} ".format(i, rampantReps))
@@ -222,18 +311,15 @@ class ConfTeam:
             '''
             deleted_learners = self.mutation_delete(mutateParams["pLrnDel"])
 
-            # Create a selection pool from which to add learners to this team
-            
-            # Filter out learners that already belong to this team
-            selection_pool = list(filter(lambda x: x not in self.learners, allLearners))
-            
-            # Filter out learners that point to this team
-            selection_pool = list(filter(lambda x: str(x.id) not in self.inLearners, selection_pool))
+            # Learners to add to this team are drawn from all learners, except for
+            # the ones that already belong to this team, the ones that point to
+            # this team, and the ones we just deleted
+            excluded = {learner.id for learner in self.learners}
+            excluded.update(self.inLearners)
+            excluded.update(learner.id for learner in deleted_learners)
 
-            # Filter out learners we just deleted
-            selection_pool = list(filter(lambda x: x not in deleted_learners, selection_pool))
-            
-            added_learners = self.mutation_add(mutateParams["pLrnAdd"], mutateParams["maxTeamSize"], selection_pool)
+            added_learners = self.mutation_add(mutateParams["pLrnAdd"], sampler,
+                mutateParams.get("maxTeamSize", 0), excluded)
 
             # give chance to mutate all learners
             mutated_learners, mutation_added_learners = self.mutation_mutate(mutateParams["pLrnMut"], mutateParams, teams)
@@ -251,7 +337,7 @@ class ConfTeam:
 
         for cursor in new_learners:
                 if len(cursor.inTeams) == 0 and not cursor.isActionAtomic():
-                    cursor.actionObj.teamAction.inLearners.remove(str(cursor.id))
+                    cursor.actionObj.teamAction.removeInLearner(cursor.id)
 
         # return the number of iterations of mutation
         return rampantReps, mutation_delta
\ No newline at end of file
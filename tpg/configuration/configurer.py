@@ -21,11 +21,13 @@ def configure(trainer, Trainer, Agent, Team, Learner, ActionObject, Program,
     mutateParamKeys = ["generation", "maxTeamSize", "pLrnDel", "pLrnAdd", "pLrnMut",
         "pProgMut", "pActMut", "pActAtom", "pInstDel", "pInstAdd", "pInstSwp", "pInstMut",
         "actionCodes", "nDestinations", "inputSize", "initMaxProgSize",
-        "rampantGen", "rampantMin", "rampantMax", "idCountTeam", "idCountLearner", "idCountProgram"]
+        "rampantGen", "rampantMin", "rampantMax", "idCountTeam", "idCountLearner", "idCountProgram",
+        "precision", "rng"]
     mutateParamVals = [trainer.generation, trainer.maxTeamSize, trainer.pLrnDel, trainer.pLrnAdd, trainer.pLrnMut,
         trainer.pProgMut, trainer.pActMut, trainer.pActAtom, trainer.pInstDel, trainer.pInstAdd, trainer.pInstSwp, trainer.pInstMut,
         trainer.actionCodes, trainer.nRegisters, trainer.inputSize, trainer.initMaxProgSize,
-        trainer.rampancy[0], trainer.rampancy[1], trainer.rampancy[2], 0, 0, 0]
+        trainer.rampancy[0], trainer.rampancy[1], trainer.rampancy[2], 0, 0, 0,
+        trainer.precision, np.random.default_rng(np.random.randint(2**31))]
 
     # additional stuff for act, like memory matrix possible
     actVarKeys = ["frameNum"]
@@ -35,7 +37,7 @@ def configure(trainer, Trainer, Agent, Team, Learner, ActionObject, Program,
     configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Program)
 
     # configure Program execution stuff, affected by memory and operations set
-    configureProgram(trainer, Learner, Program, actVarKeys, actVarVals,
+    configureProgram(trainer, Agent, Team, Learner, Program, actVarKeys, actVarVals,
             mutateParamKeys, mutateParamVals, doMemory, memType, operationSet)
 
     # configure stuff for using real valued actions
@@ -60,6 +62,7 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     # set agent functions
     Agent.__init__ = ConfAgent.init_def
     Agent.act = ConfAgent.act_def
+    Agent.actCompiled = ConfAgent.actCompiled_def
     Agent.reward = ConfAgent.reward_def
     Agent.taskDone = ConfAgent.taskDone_def
     Agent.saveToFile = ConfAgent.saveToFile_def
@@ -67,6 +70,7 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     # set team functions
     Team.__init__ = ConfTeam.init_def
     Team.act = ConfTeam.act_def
+    Team.topLearner = ConfTeam.topLearner_def
     Team.addLearner = ConfTeam.addLearner_def
     Team.removeLearner = ConfTeam.removeLearner_def
     Team.removeLearners = ConfTeam.removeLearners_def
@@ -76,6 +80,7 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     # set learner functions
     Learner.__init__ = ConfLearner.init_def
     Learner.bid = ConfLearner.bid_def
+    Learner.bidBatch = ConfLearner.bidBatch_def
     Learner.getAction = ConfLearner.getAction_def
     Learner.getActionTeam = ConfLearner.getActionTeam_def
     Learner.isActionAtomic = ConfLearner.isActionAtomic_def
@@ -90,6 +95,11 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     # set program functions
     Program.__init__ = ConfProgram.init_def
     Program.execute = ConfProgram.execute_def
+    Program.opTraits = ConfProgram.opTraits_def
+    Program.executeId = 0
+    Program.executeBatch = ConfProgram.executeBatch_def
+    Program.executeTeam = ConfProgram.executeTeam_def
+    Program.executeGraph = ConfProgram.executeGraph_def
     Program.mutate = ConfProgram.mutate_def
     Program.memWriteProbFunc = ConfProgram.memWriteProb_def
 
@@ -98,6 +108,7 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     trainer.functionsDict["Agent"] = {
         "init": "def",
         "act": "def",
+        "actCompiled": "def",
         "reward": "def",
         "taskDone": "def",
         "saveToFile": "def"
@@ -105,6 +116,7 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     trainer.functionsDict["Team"] = {
         "init": "def",
         "act": "def",
+        "topLearner": "def",
         "addLearner": "def",
         "removeLearner": "def",
         "removeLearners": "def",
@@ -114,6 +126,7 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     trainer.functionsDict["Learner"] = {
         "init": "def",
         "bid": "def",
+        "bidBatch": "def",
         "getAction": "def",
         "getActionTeam": "def",
         "isActionAtomic": "def",
@@ -129,30 +142,76 @@ def configureDefaults(trainer, Trainer, Agent, Team, Learner, ActionObject, Prog
     trainer.functionsDict["Program"] = {
         "init": "def",
         "execute": "def",
+        "executeBatch": "def",
+        "executeTeam": "def",
+        "executeGraph": "def",
         "mutate": "def",
         "memWriteProbFunc": "def"
     }
 
+"""
+Entries of functionsDict added since trainers and agents were first saved, by
+class. All of them are "mem" with memory and "def" without, like the learner's
+bid function.
+"""
+addedFunctions = {
+    "Agent": ["actCompiled"],
+    "Team": ["topLearner"],
+    "Learner": ["bidBatch"],
+    "Program": ["executeBatch", "executeTeam", "executeGraph"]
+}
+
+"""
+Fills in the entries of functionsDict (of a trainer or agent saved before they
+were added) that it is missing, see addedFunctions.
+"""
+def upgradeFunctionsDict(functionsDict):
+    variant = "mem" if functionsDict["Learner"]["bid"] == "mem" else "def"
+    for cls, names in addedFunctions.items():
+        for name in names:
+            functionsDict[cls].setdefault(name, variant)
+
+"""
+Gets the write probability of each row offset of a memory of shape, as
+Program.memWriteProbFunc gives them.
+"""
+def makeMemWriteProbs(Program, shape):
+    return np.array([Program.memWriteProbFunc(i) for i in range(int(shape[0]/2))], dtype=float)
+
+"""
+Fills in the write probabilities of actVars (of a trainer or agent saved
+before they were made once), with Program's functions configured already.
+"""
+def upgradeActVars(actVars, Program):
+    if actVars is not None and "memMatrix" in actVars and "memWriteProbs" not in actVars:
+        actVars["memWriteProbs"] = makeMemWriteProbs(Program, actVars["memMatrix"].shape)
+
 """
 Decides the operations and functions to be used in program execution.
 """
-def configureProgram(trainer, Learner, Program, actVarKeys, actVarVals,
+def configureProgram(trainer, Agent, Team, Learner, Program, actVarKeys, actVarVals,
         mutateParamKeys, mutateParamVals, doMemory, memType, operationSet):
     # change functions as needed
     if doMemory:
         # default (reduced) or full operation set
         if operationSet == "def":
             Program.execute = ConfProgram.execute_mem
+            Program.opTraits = ConfProgram.opTraits_mem
+            Program.executeId = 0
             trainer.functionsDict["Program"]["execute"] = "mem"
             trainer.nOperations = 7
             trainer.operations = ["ADD", "SUB", "MULT", "DIV", "NEG", "MEM_READ", "MEM_WRITE"]
         elif operationSet == "full":
             Program.execute = ConfProgram.execute_mem_full
+            Program.opTraits = ConfProgram.opTraits_mem_full
+            Program.executeId = 1
             trainer.functionsDict["Program"]["execute"] = "mem_full"
             trainer.nOperations = 10
             trainer.operations = ["ADD", "SUB", "MULT", "DIV", "NEG", "COS", "LOG", "EXP", "MEM_READ", "MEM_WRITE"]
         elif operationSet == "robo":
             Program.execute = ConfProgram.execute_mem_robo
+            Program.opTraits = ConfProgram.opTraits_mem_robo
+            Program.executeId = 2
             trainer.functionsDict["Program"]["execute"] = "mem_robo"
             trainer.nOperations = 8
             trainer.operations = ["ADD", "SUB", "MULT", "DIV", "NEG", "COS", "MEM_READ", "MEM_WRITE"]
@@ -168,36 +227,71 @@ def configureProgram(trainer, Learner, Program, actVarKeys, actVarVals,
             Program.memWriteProbFunc = ConfProgram.memWriteProb_def
             trainer.functionsDict["Program"]["memWriteProbFunc"] = "def"
 
+        # batches of states also need to pass through the memory
+        Program.executeBatch = ConfProgram.executeBatch_mem
+        trainer.functionsDict["Program"]["executeBatch"] = "mem"
+        Program.executeTeam = ConfProgram.executeTeam_mem
+        trainer.functionsDict["Program"]["executeTeam"] = "mem"
+        Program.executeGraph = ConfProgram.executeGraph_mem
+        trainer.functionsDict["Program"]["executeGraph"] = "mem"
+        Agent.actCompiled = ConfAgent.actCompiled_mem
+        trainer.functionsDict["Agent"]["actCompiled"] = "mem"
+
         # change bid function to accomodate additional parameters needed for memory
         Learner.bid = ConfLearner.bid_mem
         trainer.functionsDict["Learner"]["bid"] = "mem"
+        Learner.bidBatch = ConfLearner.bidBatch_mem
+        trainer.functionsDict["Learner"]["bidBatch"] = "mem"
+        Team.topLearner = ConfTeam.topLearner_mem
+        trainer.functionsDict["Team"]["topLearner"] = "mem"
 
         # trainer needs to have memory
-        trainer.memMatrix = np.zeros(shape=trainer.memMatrixShape)
+        trainer.memMatrix = np.zeros(shape=trainer.memMatrixShape, dtype=trainer.precision)
+        # write probability of each row offset, made once rather than per write
+        memWriteProbs = makeMemWriteProbs(Program, trainer.memMatrixShape)
         # agents need access to memory too, and to pass through act
-        actVarKeys += ["memMatrix"]
-        actVarVals += [trainer.memMatrix]
+        actVarKeys += ["memMatrix", "memWriteProbs"]
+        actVarVals += [trainer.memMatrix, memWriteProbs]
 
     else:
         # default (reduced) or full operation set
         if operationSet == "def":
             Program.execute = ConfProgram.execute_def
+            Program.opTraits = ConfProgram.opTraits_def
+            Program.executeId = 0
             trainer.functionsDict["Program"]["execute"] = "def"
             trainer.nOperations = 5
             trainer.operations = ["ADD", "SUB", "MULT", "DIV", "NEG"]
         elif operationSet == "full":
             Program.execute = ConfProgram.execute_full
+            Program.opTraits = ConfProgram.opTraits_full
+            Program.executeId = 1
             trainer.functionsDict["Program"]["execute"] = "full"
             trainer.nOperations = 8
             trainer.operations = ["ADD", "SUB", "MULT", "DIV", "NEG", "COS", "LOG", "EXP"]
         elif operationSet == "robo":
             Program.execute = ConfProgram.execute_robo
+            Program.opTraits = ConfProgram.opTraits_robo
+            Program.executeId = 2
             trainer.functionsDict["Program"]["execute"] = "robo"
             trainer.nOperations = 6
             trainer.operations = ["ADD", "SUB", "MULT", "DIV", "NEG", "COS"]
 
+        Program.executeBatch = ConfProgram.executeBatch_def
+        trainer.functionsDict["Program"]["executeBatch"] = "def"
+        Program.executeTeam = ConfProgram.executeTeam_def
+        trainer.functionsDict["Program"]["executeTeam"] = "def"
+        Program.executeGraph = ConfProgram.executeGraph_def
+        trainer.functionsDict["Program"]["executeGraph"] = "def"
+        Agent.actCompiled = ConfAgent.actCompiled_def
+        trainer.functionsDict["Agent"]["actCompiled"] = "def"
+
         Learner.bid = ConfLearner.bid_def
         trainer.functionsDict["Learner"]["bid"] = "def"
+        Learner.bidBatch = ConfLearner.bidBatch_def
+        trainer.functionsDict["Learner"]["bidBatch"] = "def"
+        Team.topLearner = ConfTeam.topLearner_def
+        trainer.functionsDict["Team"]["topLearner"] = "def"
 
     mutateParamKeys += ["nOperations"]
     mutateParamVals += [trainer.nOperations]
@@ -0,0 +1,96 @@
+import numpy as np
+
+"""
+Records the decisions an agent makes while acting into preallocated arrays,
+keeping the last size of them (a ring buffer). For each decision the teams
+visited in order, with the ids and bids of each team's learners (nan if not
+valid) as found during the traversal, the top learner of each team, and the
+action. A much lighter alternative to path_trace that can be kept on. Arrays
+grow if a traversal goes deeper, or a team has more learners, than they have
+room for. Set it as Agent.trace, see Agent.act.
+"""
+class DecisionTrace:
+
+    def __init__(self, size=1, maxDepth=8, maxLearners=8):
+        self.size = size
+        self.count = 0 # decisions started so far
+        self.slot = -1 # where the current decision goes
+
+        self.depths = np.zeros(size, dtype=np.int32)
+        self.actions = np.full(size, -1, dtype=np.int64)
+        self.teams = np.full((size, maxDepth), -1, dtype=np.int64)
+        self.topLearners = np.full((size, maxDepth), -1, dtype=np.int64)
+        self.learners = np.full((size, maxDepth, maxLearners), -1, dtype=np.int64)
+        self.bids = np.full((size, maxDepth, maxLearners), np.nan)
+
+    """
+    Starts recording a new decision, over the oldest one if full.
+    """
+    def start(self):
+        self.slot = self.count % self.size
+        self.count += 1
+
+        self.depths[self.slot] = 0
+        self.actions[self.slot] = -1
+        self.teams[self.slot] = -1
+        self.topLearners[self.slot] = -1
+        self.learners[self.slot] = -1
+        self.bids[self.slot] = np.nan
+
+    """
+    Records a team of the current decision, with its learners' ids and bids, which
+    learners were valid, and the index of the top learner.
+    """
+    def record(self, team, learnerIds, bids, valid, top):
+        depth = self.depths[self.slot]
+        if depth == self.teams.shape[1]:
+            self.grow(depth*2, self.learners.shape[2])
+        if len(bids) > self.learners.shape[2]:
+            self.grow(self.teams.shape[1], len(bids))
+
+        n = len(bids)
+        self.teams[self.slot, depth] = team
+        self.topLearners[self.slot, depth] = learnerIds[top]
+        self.learners[self.slot, depth, :n] = learnerIds
+        self.bids[self.slot, depth, :n] = bids
+        self.bids[self.slot, depth, :n][~valid] = np.nan
+        self.depths[self.slot] = depth + 1
+
+    """
+    Records the action the current decision ended with (the action code for
+    real actions).
+    """
+    def finish(self, action):
+        self.actions[self.slot] = action[0] if isinstance(action, tuple) else action
+
+    """
+    Makes room for maxDepth teams per decision and maxLearners learners per
+    team, keeping what is recorded.
+    """
+    def grow(self, maxDepth, maxLearners):
+        def resized(array, shape, fill):
+            bigger = np.full(shape, fill, dtype=array.dtype)
+            bigger[tuple(slice(0, n) for n in array.shape)] = array
+            return bigger
+
+        self.teams = resized(self.teams, (self.size, maxDepth), -1)
+        self.topLearners = resized(self.topLearners, (self.size, maxDepth), -1)
+        self.learners = resized(self.learners, (self.size, maxDepth, maxLearners), -1)
+        self.bids = resized(self.bids, (self.size, maxDepth, maxLearners), np.nan)
+
+    """
+    Gets the recorded decisions, oldest first, as a dict of arrays indexed by
+    decision.
+    """
+    def decisions(self):
+        kept = min(self.count, self.size)
+        order = np.arange(self.count - kept, self.count) % self.size
+
+        return {
+            "depths": self.depths[order],
+            "actions": self.actions[order],
+            "teams": self.teams[order],
+            "topLearners": self.topLearners[order],
+            "learners": self.learners[order],
+            "bids": self.bids[order]
+        }
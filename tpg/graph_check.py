@@ -0,0 +1,89 @@
+from collections import namedtuple, Counter
+
+"""
+A problem found in the graph of a trainer's teams and learners by
+checkGraph. kind says what is wrong, team and learner are the ids involved
+(None where not relevant).
+"""
+GraphViolation = namedtuple("GraphViolation", ["kind", "team", "learner"])
+
+"""
+Checks the graph of teams and learners (populations of a trainer), going over
+each team, learner and edge a fixed number of times, so it can be done every
+generation. Returns a list of GraphViolations, empty if the graph is sound.
+The kinds of violation are:
+    - duplicateTeam, duplicateLearner: two members share an id.
+    - noAction: a learner has neither an action code nor a team to go to.
+    - missingLearner: a team holds a learner not in learners.
+    - missingTeam: a learner points to a team not in teams.
+    - inTeams: a learner's inTeams doesn't list the teams holding it (as many
+      times as they do), the team is one in question.
+    - inLearners: a team's inLearners doesn't list the learners pointing to it
+      (as many times as they do), the learner is one in question.
+    - noAtomic: a team has no learner with an atomic action.
+    - selfReference: a learner of a team points to the team.
+    - root: roots (the trainer's RootSet, if given) disagrees with a team's
+      inLearners about it being a root team.
+"""
+def checkGraph(teams, learners, roots=None):
+    violations = []
+
+    teamsById = {}
+    for team in teams:
+        if team.id in teamsById:
+            violations.append(GraphViolation("duplicateTeam", team.id, None))
+        teamsById[team.id] = team
+
+    learnersById = {}
+    for learner in learners:
+        if learner.id in learnersById:
+            violations.append(GraphViolation("duplicateLearner", None, learner.id))
+        learnersById[learner.id] = learner
+
+    # edges from teams to learners, as held and as recorded in inTeams
+    held = Counter()
+    for team in teamsById.values():
+        atomic = False
+        for learner in team.learners:
+            held[(team.id, learner.id)] += 1
+            if learnersById.get(learner.id) is not learner:
+                violations.append(GraphViolation("missingLearner", team.id, learner.id))
+            if learner.isActionAtomic():
+                atomic = True
+            elif learner.getActionTeam() is team:
+                violations.append(GraphViolation("selfReference", team.id, learner.id))
+        if not atomic:
+            violations.append(GraphViolation("noAtomic", team.id, None))
+
+    recorded = Counter()
+    for learner in learnersById.values():
+        for teamId in learner.inTeams:
+            recorded[(teamId, learner.id)] += 1
+    for teamId, learnerId in (held - recorded) + (recorded - held):
+        violations.append(GraphViolation("inTeams", teamId, learnerId))
+
+    # edges from learners to teams, as pointed and as recorded in inLearners
+    pointed = Counter()
+    for learner in learnersById.values():
+        if learner.isActionAtomic():
+            if learner.actionObj.actionCode is None:
+                violations.append(GraphViolation("noAction", None, learner.id))
+            continue
+        team = learner.getActionTeam()
+        pointed[(team.id, learner.id)] += 1
+        if teamsById.get(team.id) is not team:
+            violations.append(GraphViolation("missingTeam", team.id, learner.id))
+
+    recorded = Counter()
+    for team in teamsById.values():
+        for learnerId in team.inLearners:
+            recorded[(team.id, learnerId)] += 1
+    for teamId, learnerId in (pointed - recorded) + (recorded - pointed):
+        violations.append(GraphViolation("inLearners", teamId, learnerId))
+
+    if roots is not None:
+        for team in teamsById.values():
+            if (len(team.inLearners) == 0) != (team in roots):
+                violations.append(GraphViolation("root", team.id, None))
+
+    return violations
@@ -0,0 +1,122 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+"""
+The outcomes (scores at tasks) of a trainer's teams, in a 2-D array with a
+row (slot) per team and a column per task, NaN where a team has no outcome
+for a task, so that scoring and stats are array operations over the rows of
+the root teams. A team's outcomes are a view (TeamOutcomes) of its row once
+the team is attached, and a plain dict when it isn't (new, or pickled, e.g.
+sent to another process as part of an agent). Slots of released teams are
+reused, the array grows as needed.
+"""
+class OutcomeTable:
+
+    def __init__(self):
+        self.tasks = {} # column of each task
+        self.slots = {} # row of each attached team, by team id
+        self.free = [] # rows of released teams
+        self.values = np.full((16, 4), np.nan)
+
+    """
+    Makes team's outcomes a view of its row, with the outcomes it had.
+    Nothing to do if it already is.
+    """
+    def attach(self, team):
+        outcomes = team.outcomes
+        if isinstance(outcomes, TeamOutcomes) and outcomes.table is self:
+            return
+
+        slot = self.slots.get(team.id)
+        if slot is not None: # outcomes set to something else since attached
+            self.values[slot] = np.nan
+        elif len(self.free) > 0:
+            slot = self.free.pop()
+        else:
+            slot = len(self.slots)
+            if slot == len(self.values):
+                self.values = np.concatenate((self.values, np.full(self.values.shape, np.nan)))
+        self.slots[team.id] = slot
+
+        team.outcomes = TeamOutcomes(self, slot)
+        team.outcomes.update(outcomes)
+
+    """
+    Gives team back its outcomes as a dict and frees its row, if attached.
+    """
+    def release(self, team):
+        outcomes = team.outcomes
+        if not isinstance(outcomes, TeamOutcomes) or outcomes.table is not self:
+            return
+
+        team.outcomes = dict(outcomes)
+        self.values[outcomes.slot] = np.nan
+        self.free.append(outcomes.slot)
+        del self.slots[team.id]
+
+    """
+    Gets the column of task, adding one if it doesn't have one yet.
+    """
+    def column(self, task):
+        column = self.tasks.get(task)
+        if column is None:
+            column = len(self.tasks)
+            if column == self.values.shape[1]:
+                self.values = np.concatenate((self.values, np.full(self.values.shape, np.nan)), axis=1)
+            self.tasks[task] = column
+        return column
+
+    """
+    Gets the outcomes of teams (attaching them) at tasks as a new array, a row
+    per team and a column per task, NaN where there is none.
+    """
+    def matrix(self, teams, tasks):
+        for team in teams:
+            self.attach(team)
+        rows = np.array([self.slots[team.id] for team in teams], dtype=np.int64)
+
+        outcomes = np.full((len(rows), len(tasks)), np.nan)
+        for i, task in enumerate(tasks):
+            column = self.tasks.get(task)
+            if column is not None:
+                outcomes[:,i] = self.values[rows, column]
+        return outcomes
+
+    def __len__(self):
+        return len(self.slots)
+
+"""
+The outcomes of one team, a dict-like view of its row in an OutcomeTable.
+Pickled (or copied) as a plain dict of them.
+"""
+class TeamOutcomes(MutableMapping):
+
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+
+    def __getitem__(self, task):
+        column = self.table.tasks.get(task)
+        if column is None or np.isnan(self.table.values[self.slot, column]):
+            raise KeyError(task)
+        return self.table.values[self.slot, column].item()
+
+    def __setitem__(self, task, score):
+        self.table.values[self.slot, self.table.column(task)] = score
+
+    def __delitem__(self, task):
+        self[task] # KeyError if not there
+        self.table.values[self.slot, self.table.tasks[task]] = np.nan
+
+    def __iter__(self):
+        row = self.table.values[self.slot]
+        return iter([task for task, column in self.table.tasks.items() if not np.isnan(row[column])])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __repr__(self):
+        return repr(dict(self))
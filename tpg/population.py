@@ -0,0 +1,193 @@
+import random
+
+"""
+A population of teams or learners for the trainer, used like a list but with
+members kept in a dict by their integer id, so checking for, adding and
+removing a member doesn't go through the whole population (nor compare teams
+or learners, which is slow). Members keep the order they were added in.
+Indexing builds a list of the members once, until the population changes.
+"""
+class PopulationList:
+
+    def __init__(self, members=()):
+        self.members = {}
+        self.ordered = None # members as a list, see list
+        for member in members:
+            self.append(member)
+
+    """
+    Adds member, unless it's already in. Raises ValueError if another member
+    has its id, ids are only unique within one trainer.
+    """
+    def append(self, member):
+        found = self.members.get(member.id)
+        if found is not None and found is not member:
+            raise ValueError("id {} is already taken in population".format(member.id))
+        self.members[member.id] = member
+        self.ordered = None
+
+    def extend(self, members):
+        for member in members:
+            self.append(member)
+
+    def remove(self, member):
+        if member not in self:
+            raise ValueError("{} not in population".format(member.id))
+        del self.members[member.id]
+        self.ordered = None
+
+    """
+    Gets the member with id, None if there isn't one.
+    """
+    def get(self, id):
+        return self.members.get(id)
+
+    """
+    Gets the members as a list, in the order they were added. Don't change it.
+    """
+    def list(self):
+        if self.ordered is None:
+            self.ordered = list(self.members.values())
+        return self.ordered
+
+    def __contains__(self, member):
+        # only compared if another object has the same id, e.g. from a loaded trainer
+        found = self.members.get(getattr(member, "id", None))
+        return found is not None and (found is member or found == member)
+
+    def __iter__(self):
+        return iter(self.list())
+
+    def __len__(self):
+        return len(self.members)
+
+    def __getitem__(self, index):
+        return self.list()[index]
+
+    def __repr__(self):
+        return "PopulationList({})".format(self.list())
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["ordered"] = None
+        return state
+
+"""
+Draws learners uniformly from a population (any sequence of learners) while
+leaving out a few, given by id, without building the pool of learners left.
+Draws are rejected until one isn't excluded, for the few excluded (team
+members, learners pointing to the team, ...) out of a large population. If
+too many draws get rejected the pool is built after all, which also finds
+when every learner is excluded.
+"""
+class LearnerSampler:
+
+    def __init__(self, learners, maxRejects=32):
+        self.learners = learners
+        self.maxRejects = maxRejects
+
+    """
+    Gets a random learner whose id isn't in excluded, None if there is none.
+    """
+    def sample(self, excluded):
+        if len(self.learners) == 0:
+            return None
+
+        for _ in range(self.maxRejects):
+            learner = self.learners[random.randrange(len(self.learners))]
+            if learner.id not in excluded:
+                return learner
+
+        pool = [learner for learner in self.learners if learner.id not in excluded]
+        if len(pool) == 0:
+            return None
+        return random.choice(pool)
+
+    def __len__(self):
+        return len(self.learners)
+
+"""
+The root teams (those no learner points to) of the teams a trainer tracks,
+kept up to date as learners start and stop pointing to teams (see
+Team.addInLearner and Team.removeInLearner), so that counting or listing them
+doesn't go through the population. A tracked team refers to the set as
+team.roots, only the last set to track a team is kept up to date.
+"""
+class RootSet:
+
+    def __init__(self, teams=()):
+        self.members = {} # root teams by id, in the order they became root
+        for team in teams:
+            self.track(team)
+
+    def track(self, team):
+        team.roots = self
+        self.update(team)
+
+    def untrack(self, team):
+        if team.roots is self:
+            team.roots = None
+        self.members.pop(team.id, None)
+
+    """
+    Adds team if no learner points to it, otherwise removes it.
+    """
+    def update(self, team):
+        if len(team.inLearners) == 0:
+            self.members[team.id] = team
+        else:
+            self.members.pop(team.id, None)
+
+    def __contains__(self, team):
+        return self.members.get(getattr(team, "id", None)) is team
+
+    def __iter__(self):
+        return iter(list(self.members.values()))
+
+    def __len__(self):
+        return len(self.members)
+
+"""
+Collects a trainer's orphans, the learners no team holds any more, as they
+come up rather than by going through all the learners. A team tracked by the
+collector (as team.collector) queues a learner when it drops the learner's
+last team (see Team.removeLearner and Team.removeLearners), so the work of
+collecting is in proportion to what died.
+"""
+class Collector:
+
+    def __init__(self):
+        self.queued = {} # learners that became orphans, by id
+
+    def track(self, team):
+        team.collector = self
+
+    def untrack(self, team):
+        if team.collector is self:
+            team.collector = None
+
+    def queue(self, learner):
+        self.queued[learner.id] = learner
+
+    """
+    Removes the queued learners that are still orphans from learners (a
+    PopulationList), and their ids from the inLearners of the teams they
+    point to, which may make those teams root teams. Returns the learners
+    removed.
+    """
+    def collect(self, learners):
+        collected = []
+        for learner in self.queued.values():
+            if learner.numTeamsReferencing() > 0 or learner not in learners:
+                continue # held by a team again, or not in the population
+
+            learners.remove(learner)
+            if not learner.isActionAtomic():
+                learner.getActionTeam().removeInLearner(learner.id)
+            collected.append(learner)
+
+        self.queued = {}
+        return collected
+
+    def __len__(self):
+        return len(self.queued)
@@ -0,0 +1,95 @@
+from numba import njit, prange
+import numpy as np
+from tpg.program import Program
+from tpg.configuration import conf_program as kernels
+
+"""
+Executes the programs of every learner on each row of inpts, learners in
+parallel. regs[n,l] are the registers of learner l for row n. insts and
+offsets are packed as in Program.executeTeam, variant is the execute function
+(see conf_program.executeVariant).
+"""
+@njit(parallel=True, cache=True)
+def executePopulation(variant, inpts, regs, insts, offsets):
+    for l in prange(len(offsets)-1):
+        start = offsets[l]
+        end = offsets[l+1]
+        for n in range(len(inpts)):
+            kernels.executeVariant(variant, inpts[n], regs[n,l], insts[0,start:end],
+                insts[1,start:end], insts[2,start:end], insts[3,start:end])
+
+"""
+Runs the programs of a whole population of learners (e.g. Trainer.learners)
+in one parallel call, for when every agent sees the same state, such as a
+vectorized environment. bid makes every learner bid on the state under a frame
+number, acting with that frame number (Agent.act) then only looks the bids up.
+Unlike acting on its own, every learner bids, not just the ones a traversal
+reaches. Programs with memory depend on the order they run in, so memory isn't
+supported.
+"""
+class PopulationExecutor:
+
+    def __init__(self, learners):
+        if Program.executeTeam is kernels.executeTeam_mem:
+            raise Exception("PopulationExecutor can't be used with memory")
+
+        self.learners = list(learners)
+        if len({len(lrnr.registers) for lrnr in self.learners}) > 1:
+            raise Exception("All learners must have the same number of registers")
+
+        self.instructions = None
+        self.offsets = None
+        self.packedKey = None
+
+    """
+    Packs the programs of the learners into one array, for states of length
+    inputSize.
+    """
+    def pack(self, inputSize):
+        programs = [lrnr.program.getExecutionInstructions(len(lrnr.registers), inputSize)
+            for lrnr in self.learners]
+
+        self.offsets = np.zeros(len(self.learners)+1, dtype=np.int32)
+        self.offsets[1:] = np.cumsum([insts.shape[1] for insts in programs])
+        self.instructions = np.ascontiguousarray(
+            np.concatenate([np.zeros((4,0), dtype=np.int32)] + programs, axis=1))
+        self.packedKey = inputSize
+
+    """
+    Every learner bids on state from its own registers, which are updated, and
+    is marked as having bid on frame frameNum. Returns the bids, in the order
+    of the learners.
+    """
+    def bid(self, state, frameNum):
+        if self.packedKey != len(state):
+            self.pack(len(state))
+
+        registers = np.array([lrnr.registers for lrnr in self.learners])
+        executePopulation(Program.executeId, state[np.newaxis], registers[np.newaxis],
+            self.instructions, self.offsets)
+
+        for lrnr, regs in zip(self.learners, registers):
+            lrnr.registers[:] = regs
+            lrnr.frameNum = frameNum
+
+        return registers[:,0]
+
+    """
+    Gets the bid of every learner on each row of states, as a matrix with a row
+    per state and a column per learner. Every row starts from registers (a row
+    of registers per learner, zeros if not given), the learners' own registers
+    are left untouched.
+    """
+    def bidBatch(self, states, registers=None):
+        if self.packedKey != len(states[0]):
+            self.pack(len(states[0]))
+
+        nRegisters = len(self.learners[0].registers)
+        regs = np.zeros((len(states), len(self.learners), nRegisters),
+            dtype=self.learners[0].registers.dtype)
+        if registers is not None:
+            regs[:] = registers
+
+        executePopulation(Program.executeId, states, regs, self.instructions, self.offsets)
+
+        return regs[:,:,0]
@@ -1,10 +1,10 @@
 import random
 import numpy as np
-from numba import njit
-import math
+import numba
 import copy
-from tpg.utils import flip
-import uuid
+from tpg.utils import flip, newId
+import hashlib
+from tpg.configuration import conf_program as kernels
 
 """
 A program that is executed to help obtain the bid for a learner.
@@ -23,8 +23,49 @@ class Program:
                     random.randint(0, nDestinations-1),
                     random.randint(0, inputSize-1))
                 for _ in range(random.randint(1, maxProgramLength))], dtype=np.int32)
+        self.validate()
 
-        self.id = uuid.uuid4()
+        # programs made outside of a trainer don't get an id
+        self.id = newId(initParams, "idCountProgram") if initParams is not None else None
+
+        # instructions that can affect the bid, see getEffectiveInstructions
+        self.effectiveInstructions = None
+        self.effectiveRegisters = None
+        self.effectiveHash = None
+        # instructions ready for execute, see getExecutionInstructions
+        self.executionInstructions = None
+        self.executionKey = None
+
+    """
+    The instructions, rows of (mode, op, destination, source). They are the
+    first length rows of buffer, which has rows to spare so that mutation can
+    add instructions without reallocating, see reserve. Setting them copies
+    them into a new buffer.
+    """
+    @property
+    def instructions(self):
+        return self.buffer[:self.length]
+
+    @instructions.setter
+    def instructions(self, instructions):
+        instructions = np.asarray(instructions, dtype=np.int32)
+        if instructions.ndim != 2 or instructions.shape[1] != 4:
+            raise ValueError("Program instructions must be rows of 4 values, got shape {}".format(
+                instructions.shape))
+
+        self.buffer = np.empty((max(16, 2*len(instructions)), 4), dtype=np.int32)
+        self.buffer[:len(instructions)] = instructions
+        self.length = len(instructions)
+
+    """
+    Makes sure buffer has room for at least rows instructions, doubling it
+    if not.
+    """
+    def reserve(self, rows):
+        if len(self.buffer) < rows:
+            buffer = np.empty((max(rows, 2*len(self.buffer)), 4), dtype=np.int32)
+            buffer[:self.length] = self.buffer[:self.length]
+            self.buffer = buffer
 
     '''
     A program is equal to another object if that object:
@@ -47,115 +88,176 @@ class Program:
         return not self.__eq__(o)
 
     """
-    Executes the program which returns a single final value.
-    """
-    @njit
-    def execute(inpt, regs, modes, ops, dsts, srcs):
-        regSize = len(regs)
-        inptLen = len(inpt)
-        for i in range(len(modes)):
-            # first get source
-            if modes[i] == 0:
-                src = regs[srcs[i]%regSize]
-            else:
-                src = inpt[srcs[i]%inptLen]
-
-
-            # get data for operation
-            op = ops[i]
-            x = regs[dsts[i]]
-            y = src
-            dest = dsts[i]%regSize
-
-            # do an operation
-            if op == 0:
-                regs[dest] = x+y
-            elif op == 1:
-                regs[dest] = x-y
-            elif op == 2:
-                regs[dest] = x*2
-            elif op == 3:
-                regs[dest] = x/2
-            elif op == 4:
-                if x < y:
-                    regs[dest] = x*(-1)
-
-            if math.isnan(regs[dest]):
-                regs[dest] = 0
-            elif regs[dest] == np.inf:
-                regs[dest] = np.finfo(np.float64).max
-            elif regs[dest] == np.NINF:
-                regs[dest] = np.finfo(np.float64).min
-            
-
-    """
-    Potentially modifies the instructions in a few ways.
+    What each operation of execute does, one row per operation. Columns are:
+    reads the destination register, reads the source, writes the destination
+    register, writes memory, reads memory. Set along with execute by the
+    configurer.
     """
-    def mutate(self, mutateParams):
-        
-        # Make a copy of our original instructions
-        original_instructions = copy.deepcopy(self.instructions)
-
-        # Since we're mutating change our id
-        self.id = uuid.uuid4()
-
-        # While we haven't changed from our original instructions keep mutating
-        while np.array_equal(self.instructions, original_instructions):
-            # maybe delete instruction
-            if len(self.instructions) > 1 and flip(mutateParams["pInstDel"]):
-                # delete random row/instruction
-                self.instructions = np.delete(self.instructions,
-                                    random.randint(0, len(self.instructions)-1),
-                                    0)
-
-                
-
-            # maybe mutate an instruction (flip a bit)
-            if flip(mutateParams["pInstMut"]):
-                # index of instruction and part of instruction
-                idx1 = random.randint(0, len(self.instructions)-1)
-                idx2 = random.randint(0,3)
-
-                # change max value depending on part of instruction
-                if idx2 == 0:
-                    maxVal = 1
-                elif idx2 == 1:
-                    maxVal = mutateParams["nOperations"]-1
-                elif idx2 == 2:
-                    maxVal = mutateParams["nDestinations"]-1
-                elif idx2 == 3:
-                    maxVal = mutateParams["inputSize"]-1
-
-                # change it
-                self.instructions[idx1, idx2] = random.randint(0, maxVal)
-
-                
-
-            # maybe swap two instructions
-            if len(self.instructions) > 1 and flip(mutateParams["pInstSwp"]):
-                # indices to swap
-                idx1, idx2 = random.sample(range(len(self.instructions)), 2)
-
-                # do swap
-                tmp = np.array(self.instructions[idx1])
-                self.instructions[idx1] = np.array(self.instructions[idx2])
-                self.instructions[idx2] = tmp
-
-                
-
-            # maybe add instruction
-            if flip(mutateParams["pInstAdd"]):
-                # insert new random instruction
-                self.instructions = np.insert(self.instructions,
-                        random.randint(0,len(self.instructions)),
-                            (random.randint(0,1),
-                            random.randint(0, mutateParams["nOperations"]-1),
-                            random.randint(0, mutateParams["nDestinations"]-1),
-                            random.randint(0, mutateParams["inputSize"]-1)),0)
-            
-            return self
+    opTraits = np.array([
+        (1,1,1,0,0), (1,1,1,0,0), (1,0,1,0,0), (1,0,1,0,0), (1,1,1,0,0)], dtype=bool)
+
+    """
+    The execute function and the kernels that run programs in bulk, the
+    defaults from conf_program. executeId says which execute function the
+    non memory kernels should run, see conf_program.executeVariant.
+    """
+    execute = kernels.execute_def
+    executeId = 0
+    executeBatch = kernels.executeBatch_def
+    executeTeam = kernels.executeTeam_def
+    executeGraph = kernels.executeGraph_def
+
+    """
+    Gets the instructions of this program that can affect register 0 (the bid),
+    dropping the rest (introns). Found by going backwards through the program
+    tracking which registers are live. Registers carry over between frames, so
+    registers read before being written are live at the end as well, repeated
+    until nothing changes. Instructions that write memory are always kept.
+    Cached until the program is mutated.
+    """
+    def getEffectiveInstructions(self, numRegisters):
+        if (self.effectiveInstructions is not None
+                and self.effectiveRegisters == numRegisters):
+            return self.effectiveInstructions
+
+        modes = self.instructions[:,0]
+        ops = self.instructions[:,1]
+        dsts = self.instructions[:,2] % numRegisters
+        srcs = self.instructions[:,3] % numRegisters
+
+        liveOut = np.zeros(numRegisters, dtype=bool)
+        liveOut[0] = True
+        while True:
+            live = np.array(liveOut)
+            effective = np.zeros(len(self.instructions), dtype=bool)
+            for i in range(len(self.instructions)-1, -1, -1):
+                if ops[i] >= len(Program.opTraits):
+                    continue # does nothing
+                readsDest, readsSrc, writesDest, writesMem, readsMem = Program.opTraits[ops[i]]
+
+                if writesMem:
+                    effective[i] = True
+                    live[:] = True
+                    continue
+
+                if not writesDest or not live[dsts[i]]:
+                    continue
+
+                effective[i] = True
+                if not readsDest:
+                    live[dsts[i]] = False
+                if readsSrc and modes[i] == 0:
+                    live[srcs[i]] = True
+
+            # live at the start means read from the previous frame
+            if np.all(liveOut[live]):
+                break
+            liveOut |= live
+
+        self.effectiveInstructions = self.instructions[effective]
+        self.effectiveRegisters = numRegisters
+        self.effectiveHash = None
+
+        return self.effectiveInstructions
+
+    """
+    Gets the instructions in the form execute takes: a contiguous row each of
+    modes, ops, dsts and srcs, with every operand already reduced into range
+    so that execute can index directly. Register sources and destinations are
+    taken mod numRegisters, input sources mod inputSize, and memory reads get
+    mode 2 with the source taken mod memSize. Only the effective instructions
+    unless effective is False (real action programs use all of their output
+    registers). Cached until the program is mutated.
+    """
+    def getExecutionInstructions(self, numRegisters, inputSize, memSize=0, effective=True):
+        key = (numRegisters, inputSize, memSize, effective)
+        if self.executionInstructions is not None and self.executionKey == key:
+            return self.executionInstructions
+
+        if effective:
+            instructions = np.array(self.getEffectiveInstructions(numRegisters))
+        else:
+            instructions = np.array(self.instructions)
+
+        modes = instructions[:,0]
+        ops = instructions[:,1]
+        srcs = np.array(instructions[:,3])
+
+        instructions[:,2] %= numRegisters
+        instructions[:,3] = np.where(modes == 0, srcs % numRegisters, srcs % inputSize)
+        if memSize > 0:
+            known = ops < len(Program.opTraits)
+            readsMem = np.zeros(len(instructions), dtype=bool)
+            readsMem[known] = Program.opTraits[ops[known], 4]
+            instructions[readsMem,0] = 2
+            instructions[readsMem,3] = srcs[readsMem] % memSize
 
+        self.executionInstructions = np.ascontiguousarray(instructions.T)
+        self.executionKey = key
 
+        return self.executionInstructions
+
+    """
+    Checks that the instructions are in the expected format: rows of (mode, op,
+    destination, source) ints, at least one row, mode 0 or 1 and nothing
+    negative. Done when created, mutated and loaded, so that
+    getExecutionInstructions can rely on it.
+    """
+    def validate(self):
+        if (self.instructions.ndim != 2 or self.instructions.shape[1] != 4
+                or len(self.instructions) == 0):
+            raise ValueError("Program instructions must be rows of 4 values, got shape {}".format(
+                self.instructions.shape))
+
+        if np.any(self.instructions < 0) or np.any(self.instructions[:,0] > 1):
+            raise ValueError("Program instructions out of range", self.instructions)
+
+    """
+    Only the instructions in use are saved, not the rest of the buffer.
+    """
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["buffer"], state["length"]
+        state["instructions"] = np.array(self.instructions)
+        return state
+
+    """
+    Programs saved before the instruction caches existed don't have them, so
+    they (and the instructions) are brought up to date on load.
+    """
+    def __setstate__(self, state):
+        state = dict(state)
+        instructions = state.pop("instructions", None)
+        self.__dict__.update(state)
+        if instructions is not None:
+            self.instructions = instructions
+        self.validate()
+
+        self.effectiveInstructions = None
+        self.effectiveRegisters = None
+        self.effectiveHash = None
+        self.executionInstructions = None
+        self.executionKey = None
+
+    """
+    Gets a hash of the effective instructions, programs that behave the same
+    have the same hash. Cached along with the effective instructions.
+    """
+    def getEffectiveHash(self, numRegisters):
+        instructions = self.getEffectiveInstructions(numRegisters)
+        if self.effectiveHash is None:
+            self.effectiveHash = hashlib.blake2b(instructions.tobytes(),
+                digest_size=16).digest()
+
+        return self.effectiveHash
+
+    """
+    Mutates the program, by performing some operations on the instructions
+    until they change, in place, see conf_program.mutatePrograms.
+    """
+    def mutate(self, mutateParams):
+        kernels.mutatePrograms([self], mutateParams)
+        return self
 
     """
     Ensures proper functions are used in this class as set up by configurer.
@@ -169,16 +271,43 @@ class Program:
 
         if functionsDict["execute"] == "def":
             cls.execute = ConfProgram.execute_def
+            cls.opTraits = ConfProgram.opTraits_def
+            cls.executeId = 0
         elif functionsDict["execute"] == "full":
             cls.execute = ConfProgram.execute_full
+            cls.opTraits = ConfProgram.opTraits_full
+            cls.executeId = 1
         elif functionsDict["execute"] == "mem":
             cls.execute = ConfProgram.execute_mem
+            cls.opTraits = ConfProgram.opTraits_mem
+            cls.executeId = 0
         elif functionsDict["execute"] == "mem_full":
             cls.execute = ConfProgram.execute_mem_full
+            cls.opTraits = ConfProgram.opTraits_mem_full
+            cls.executeId = 1
         elif functionsDict["execute"] == "robo":
             cls.execute = ConfProgram.execute_robo
+            cls.opTraits = ConfProgram.opTraits_robo
+            cls.executeId = 2
         elif functionsDict["execute"] == "mem_robo":
             cls.execute = ConfProgram.execute_mem_robo
+            cls.opTraits = ConfProgram.opTraits_mem_robo
+            cls.executeId = 2
+
+        if functionsDict["executeBatch"] == "def":
+            cls.executeBatch = ConfProgram.executeBatch_def
+        elif functionsDict["executeBatch"] == "mem":
+            cls.executeBatch = ConfProgram.executeBatch_mem
+
+        if functionsDict["executeTeam"] == "def":
+            cls.executeTeam = ConfProgram.executeTeam_def
+        elif functionsDict["executeTeam"] == "mem":
+            cls.executeTeam = ConfProgram.executeTeam_mem
+
+        if functionsDict["executeGraph"] == "def":
+            cls.executeGraph = ConfProgram.executeGraph_def
+        elif functionsDict["executeGraph"] == "mem":
+            cls.executeGraph = ConfProgram.executeGraph_mem
 
         if functionsDict["mutate"] == "def":
             cls.mutate = ConfProgram.mutate_def
@@ -189,3 +318,44 @@ class Program:
             cls.memWriteProbFunc = ConfProgram.memWriteProb_cauchy1
         elif functionsDict["memWriteProbFunc"] == "cauchyHalf":
             cls.memWriteProbFunc = ConfProgram.memWriteProb_cauchyHalf
+
+
+"""
+Compiles the configured execute function and the kernels that run programs in
+bulk ahead of time, for states of each dtype in stateDtypes and registers of
+type precision (see Trainer), so that acting doesn't stop to compile on the
+first frame. Signatures are the exact types the kernels are called with. The
+kernels are cached on disk, so after the first process this only loads them,
+call it once the trainer is made (e.g. at the start of each worker).
+"""
+def warmup(stateDtypes=(np.float64,), precision="float64"):
+    regs = np.zeros(2, dtype=precision)
+    regsBlock = np.zeros((1, 2), dtype=precision)
+    insts = np.zeros((4, 1), dtype=np.int32)
+    offsets = np.array([0, 1], dtype=np.int32)
+    flags = np.ones(1, dtype=bool)
+    stamps = np.zeros(1, dtype=np.int64)
+    teamLearners = np.zeros(1, dtype=np.int32)
+    learnerTeams = np.full(1, -1, dtype=np.int32)
+
+    if Program.executeTeam is kernels.executeTeam_mem:
+        memMatrix = np.zeros((2, 1), dtype=precision)
+        memArgs = (memMatrix, memMatrix.shape[0], memMatrix.shape[1], np.zeros(1))
+    else:
+        memArgs = ()
+
+    for dtype in stateDtypes:
+        state = np.zeros(1, dtype=dtype)
+        states = np.zeros((1, 1), dtype=dtype)
+
+        calls = [
+            (Program.execute, (state, regs, insts[0], insts[1], insts[2], insts[3]) + memArgs),
+            (Program.executeBatch, (Program.executeId, states, regsBlock,
+                insts[0], insts[1], insts[2], insts[3]) + memArgs),
+            (Program.executeTeam, (Program.executeId, state, regsBlock, insts, offsets,
+                flags, flags) + memArgs),
+            (Program.executeGraph, (Program.executeId, state, regsBlock, insts, offsets, offsets,
+                teamLearners, learnerTeams, stamps, stamps, stamps, 0, False) + memArgs)]
+
+        for kernel, args in calls:
+            kernel.compile(tuple(numba.typeof(arg) for arg in args))
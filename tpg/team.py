@@ -1,8 +1,10 @@
 
 from os import curdir
-import uuid
-from tpg.utils import flip
+from tpg.utils import flip, newHandle, newId
 from tpg.learner import Learner
+from tpg.program import Program
+from tpg.population import LearnerSampler
+import numpy as np
 import random
 import collections
 import copy
@@ -15,12 +17,21 @@ class Team:
 
     def __init__(self, initParams):
         self.learners = []
-        self.outcomes = {} # scores at various tasks
+        self.outcomes = {} # scores at various tasks, see OutcomeTable
         self.fitness = None
         self.inLearners = [] # ids of learners referencing this team
-        self.id = uuid.uuid4()
+        self.roots = None # RootSet of the trainer tracking this team, if any
+        self.collector = None # Collector of the trainer tracking this team, if any
+        self.id = newId(initParams, "idCountTeam")
+        self.handle = newHandle() # for visited checks while acting
 
         self.genCreate = initParams["generation"]
+
+        # learners' programs packed together for Program.executeTeam, see packLearners
+        self.packedInstructions = None
+        self.packedOffsets = None
+        self.packedKey = None
+        self.packedIds = None # ids of the packed learners, for DecisionTrace
     
 
 
@@ -83,6 +94,29 @@ class Team:
     def __ne__(self, o: object) -> bool:
         return not self.__eq__(o)
 
+    '''
+    The trainer's RootSet and Collector aren't saved with the team, they track
+    the team again when the trainer is loaded.
+    '''
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["roots"] = None
+        state["collector"] = None
+        return state
+
+    '''
+    Handles are only unique within a process, loaded or copied teams get a new
+    one. Teams saved before their learners were packed are packed when next
+    needed.
+    '''
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in ("packedInstructions", "packedOffsets", "packedKey", "packedIds"):
+            self.__dict__.setdefault(name, None)
+        self.handle = newHandle()
+        self.roots = None
+        self.collector = None
+
     def zeroRegisters(self):
         for learner in self.learners:
             learner.zeroRegisters()
@@ -93,34 +127,49 @@ class Team:
     def numLearnersReferencing(self):
         return len(self.inLearners)
 
+    '''
+    Records that the learner with learnerId points to this team, or no longer
+    does, keeping the RootSet tracking this team up to date.
+    '''
+    def addInLearner(self, learnerId):
+        self.inLearners.append(learnerId)
+        if self.roots is not None and len(self.inLearners) == 1:
+            self.roots.update(self)
+
+    def removeInLearner(self, learnerId):
+        self.inLearners.remove(learnerId)
+        if self.roots is not None and len(self.inLearners) == 0:
+            self.roots.update(self)
+
     """
     Returns an action to use based on the current state.
-    NOTE: Do not set visited = list() because that will only be
-    evaluated once, and thus won't create a new list every time.
+    visited is the set of handles of the teams visited so far this act.
+    NOTE: Do not set visited = set() because that will only be
+    evaluated once, and thus won't create a new set every time.
     """
     def act(self, state, visited, actVars=None, path_trace=None):
         # If we've already visited me, throw an exception
-        if str(self.id) in visited:
+        if self.handle in visited:
             print("Visited:")
             for i,cursor in enumerate(visited):
                 print("{}|{}".format(i, cursor))
-            raise(Exception("Already visited team {}!".format(str(self.id))))
+            raise(Exception("Already visited team {}!".format(self.id)))
 
-        # Add this team's id to the list of visited ids
-        visited.append(str(self.id)) 
+        # Add this team's handle to the set of visited handles
+        visited.add(self.handle)
         
         '''
         Valid learners are ones which:
             * Are action atomic
             * Whose team we have not yet visited
         '''
-        valid_learners = [lrnr for lrnr in self.learners
-                if lrnr.isActionAtomic() or str(lrnr.getActionTeam().id) not in visited]
+        valid = np.array([lrnr.isActionAtomic() or lrnr.getActionTeam().handle not in visited
+                for lrnr in self.learners], dtype=bool)
+        if not valid.any():
+            raise ValueError("No valid learners on team {}!".format(self.id))
 
+        top_learner = self.learners[self.topLearner(state, valid, actVars=actVars)]
 
-        top_learner = max(valid_learners,
-            key=lambda lrnr: lrnr.bid(state, actVars=actVars))
-    
         # If we're tracing this path
         if path_trace != None:
             
@@ -128,20 +177,20 @@ class Team:
 
             # Create our path segment
             path_segment =  {
-                'team_id': str(self.id),
-                'top_learner': str(top_learner.id),
+                'team_id': self.id,
+                'top_learner': top_learner.id,
                 'top_bid': top_learner.bid(state, actVars=actVars),
-                'top_action': top_learner.actionObj.actionCode if top_learner.isActionAtomic() else str(top_learner.actionObj.teamAction.id),
+                'top_action': top_learner.actionObj.actionCode if top_learner.isActionAtomic() else top_learner.actionObj.teamAction.id,
                 'depth': last_segment['depth'] + 1 if last_segment != None else 0,# Record path depth
                 'bids': []
             }
 
             # Populate bid values
-            for cursor in valid_learners:
+            for cursor in [lrnr for lrnr, v in zip(self.learners, valid) if v]:
                 path_segment['bids'].append({
-                    'learner_id': str(cursor.id),
+                    'learner_id': cursor.id,
                     'bid': cursor.bid(state, actVars=actVars),
-                    'action': cursor.actionObj.actionCode if cursor.isActionAtomic() else str(cursor.actionObj.teamAction.id)
+                    'action': cursor.actionObj.actionCode if cursor.isActionAtomic() else cursor.actionObj.teamAction.id
                 })
 
             # Append our path segment to the trace
@@ -149,6 +198,64 @@ class Team:
 
         return top_learner.getAction(state, visited=visited, actVars=actVars, path_trace=path_trace) 
 
+    """
+    Packs the programs of this team's learners into one array for
+    Program.executeTeam, for states of length inputSize (and memory of memSize).
+    The pack is dropped whenever the learners on the team change, learners are
+    cloned before their programs get mutated so that is the only way it can go
+    out of date.
+    """
+    def packLearners(self, inputSize, memSize=0):
+        programs = [lrnr.program.getExecutionInstructions(len(lrnr.registers), inputSize, memSize)
+            for lrnr in self.learners]
+
+        self.packedOffsets = np.zeros(len(self.learners)+1, dtype=np.int32)
+        self.packedOffsets[1:] = np.cumsum([insts.shape[1] for insts in programs])
+        self.packedInstructions = np.ascontiguousarray(
+            np.concatenate([np.zeros((4,0), dtype=np.int32)] + programs, axis=1))
+        self.packedKey = (inputSize, memSize)
+        self.packedIds = np.array([lrnr.id for lrnr in self.learners], dtype=np.int64)
+
+    """
+    Gets the index of the valid learner with the highest bid, running all of the
+    learners' programs in one call. Learners that already bid this frame keep
+    their bid, same as Learner.bid.
+    """
+    def topLearner(self, state, valid, actVars=None):
+        if self.packedInstructions is None or self.packedKey != (len(state), 0):
+            self.packLearners(len(state))
+
+        registers = np.array([lrnr.registers for lrnr in self.learners])
+        stale = np.array([lrnr.frameNum != actVars["frameNum"]
+            for lrnr in self.learners], dtype=bool)
+        update = valid & stale
+
+        # skip learners whose program already ran this frame from the same registers
+        bidCache = actVars.get("bidCache")
+        if bidCache is not None:
+            keys = [None]*len(self.learners)
+            for i in np.flatnonzero(update):
+                keys[i], cached = bidCache.lookup(actVars["frameNum"],
+                    self.learners[i].program, registers[i])
+                if cached is not None:
+                    registers[i] = cached
+                    stale[i] = False
+
+        top = Program.executeTeam(Program.executeId, state, registers,
+            self.packedInstructions, self.packedOffsets, valid, stale)
+
+        for i in np.flatnonzero(update):
+            self.learners[i].registers[:] = registers[i]
+            self.learners[i].frameNum = actVars["frameNum"]
+            if bidCache is not None and stale[i]:
+                bidCache.store(keys[i], registers[i])
+
+        trace = actVars.get("trace")
+        if trace is not None:
+            trace.record(self.id, self.packedIds, registers[:,0], valid, top)
+
+        return top
+
     """
     Adds learner to the team and updates number of references to that program.
     """
@@ -156,7 +263,8 @@ class Team:
         program = learner.program
 
         self.learners.append(learner)
-        learner.inTeams.append(str(self.id)) # Add this team's id to the list of teams that reference the learner
+        learner.inTeams.append(self.id) # Add this team's id to the list of teams that reference the learner
+        self.packedInstructions = None
 
         return True
 
@@ -170,7 +278,7 @@ class Team:
         '''
         if learner not in self.learners:
             raise Exception("Attempted to remove a learner ({}) not referenced by team {}".format(
-            str(learner.id), str(self.id)
+            learner.id, self.id
         ))
 
         # Find the learner to remove
@@ -181,20 +289,26 @@ class Team:
 
         # Build a new list of learners containing only learners that are not the learner
         self.learners = [cursor for cursor in self.learners if cursor != learner ]
+        self.packedInstructions = None
 
         # Remove our id from the learner's inTeams
         # NOTE: Have to do this after removing the learner otherwise, removal will fail 
         # since the learner's inTeams will not match 
-        to_remove.inTeams.remove(str(self.id))
+        to_remove.inTeams.remove(self.id)
+        if self.collector is not None and len(to_remove.inTeams) == 0:
+            self.collector.queue(to_remove)
 
     """
     Bulk removes learners from the team.
     """
     def removeLearners(self):
         for learner in self.learners:
-            learner.inTeams.remove(str(self.id))
+            learner.inTeams.remove(self.id)
+            if self.collector is not None and len(learner.inTeams) == 0:
+                self.collector.queue(learner)
 
         del self.learners[:]
+        self.packedInstructions = None
 
     """
     Number of learners with atomic actions on this team.
@@ -265,7 +379,8 @@ class Team:
 
     ''' 
     A learner is added from the provided selection pool with a given 
-    probability. 
+    probability. The selection pool is a list of learners or a LearnerSampler,
+    learners with ids in excluded are never picked.
         - Returns the learners that have been added.
         - Returns immediately if the probability of addition is 0.0
         - Raises an exception if the probability of addition is 1.0 or greater
@@ -274,10 +389,14 @@ class Team:
           there is a 0.5 * (0.5)^2 probability of 2 learners being added. 
           0.5 * (0.5)^2 * (0.5)^3 probability of 3 learners being added, and so on.
     '''
-    def mutation_add(self, probability, maxTeamSize, selection_pool):
+    def mutation_add(self, probability, selection_pool, maxTeamSize=0, excluded=None):
 
         original_probability = float(probability)
 
+        if not isinstance(selection_pool, LearnerSampler):
+            selection_pool = LearnerSampler(selection_pool)
+        excluded = set() if excluded is None else set(excluded)
+
         # Zero chance to add anything, return right away
         if probability == 0.0 or len(selection_pool) == 0 or (maxTeamSize > 0 and len(self.learners) >= maxTeamSize):
             return []
@@ -288,19 +407,18 @@ class Team:
 
         added_learners = []  
         while flip(probability) and (maxTeamSize <= 0 or len(self.learners) < maxTeamSize):
+            learner = selection_pool.sample(excluded)
             # If no valid selections left, break out of the loop
-            if len(selection_pool) == 0:
+            if learner is None:
                 break
 
             probability *= original_probability # decrease next chance
 
-
-            learner = random.choice(selection_pool)
             added_learners.append(learner)
             self.addLearner(learner)
 
-            # Ensure we don't pick the same learner twice by filtering the learners we've added from the selection pool
-            selection_pool = list(filter(lambda x:x not in added_learners, selection_pool))
+            # Ensure we don't pick the same learner twice
+            excluded.add(learner.id)
 
         return added_learners
 
@@ -354,7 +472,7 @@ class Team:
                 #print("removing old learner {}".format(learner.id))
 
                 # Add the mutated learner to our list of mutations
-                mutated_learners[str(learner.id)] = str(newLearner.id)
+                mutated_learners[learner.id] = newLearner.id
 
       
         return mutated_learners, new_learners              
@@ -388,27 +506,25 @@ class Team:
 
         mutation_delta = {}
         new_learners = []
+        sampler = LearnerSampler(allLearners)
 
         for i in range(rampantReps):
-            print("i/rampant reps:  {}/{} ".format(i, rampantReps))
+            #print("i/rampant reps:  {}/{} ".format(i, rampantReps))
             # delete some learners
             '''
             TODO log mutation deltas...
             '''
             deleted_learners = self.mutation_delete(mutateParams["pLrnDel"])
 
-            # Create a selection pool from which to add learners to this team
-            
-            # Filter out learners that already belong to this team
-            selection_pool = list(filter(lambda x: x not in self.learners, allLearners))
-            
-            # Filter out learners that point to this team
-            selection_pool = list(filter(lambda x: str(x.id) not in self.inLearners, selection_pool))
+            # Learners to add to this team are drawn from all learners, except for
+            # the ones that already belong to this team, the ones that point to
+            # this team, and the ones we just deleted
+            excluded = {learner.id for learner in self.learners}
+            excluded.update(self.inLearners)
+            excluded.update(learner.id for learner in deleted_learners)
 
-            # Filter out learners we just deleted
-            selection_pool = list(filter(lambda x: x not in deleted_learners, selection_pool))
-            
-            added_learners = self.mutation_add(mutateParams["pLrnAdd"], selection_pool)
+            added_learners = self.mutation_add(mutateParams["pLrnAdd"], sampler,
+                mutateParams.get("maxTeamSize", 0), excluded)
 
             # give chance to mutate all learners
             mutated_learners, mutation_added_learners = self.mutation_mutate(mutateParams["pLrnMut"], mutateParams, teams)
@@ -426,7 +542,7 @@ class Team:
 
         for cursor in new_learners:
                 if len(cursor.inTeams) == 0 and not cursor.isActionAtomic():
-                    cursor.actionObj.teamAction.inLearners.remove(str(cursor.id))
+                    cursor.actionObj.teamAction.removeInLearner(cursor.id)
 
         # return the number of iterations of mutation
         return rampantReps, mutation_delta
@@ -446,6 +562,11 @@ class Team:
         elif functionsDict["act"] == "learnerTrav":
             cls.act = ConfTeam.act_learnerTrav
 
+        if functionsDict["topLearner"] == "def":
+            cls.topLearner = ConfTeam.topLearner_def
+        elif functionsDict["topLearner"] == "mem":
+            cls.topLearner = ConfTeam.topLearner_mem
+
         if functionsDict["addLearner"] == "def":
             cls.addLearner = ConfTeam.addLearner_def
 
@@ -4,12 +4,20 @@ from tpg.program import Program
 from tpg.learner import Learner
 from tpg.team import Team
 from tpg.agent import Agent
+from tpg.act_profiler import ActProfiler
+from tpg.bid_cache import BidCache
+from tpg.population import PopulationList, RootSet, Collector
+from tpg.outcomes import OutcomeTable
+from tpg.graph_check import checkGraph
 from tpg.configuration import configurer
 import random
 import numpy as np
 import pickle
 from collections import namedtuple
 import json
+import copy
+import uuid
+from tpg.utils import getReadSet, getRng, newId, renumberIds, countBeaten, paretoFronts, lexicaseCounts
 
 """
 Functionality for actually growing TPG and evolving it to be functional.
@@ -55,6 +63,10 @@ class Trainer:
     doMutate: Whether to continue mutating newly created root teams below the team
     level. If true only mutates teams by changing up the learners, but doesn't
     mutate the learners or
+
+    precision: "float64" or "float32", the float type of learner registers and
+    the memory matrix. "float32" halves their size, plenty for pixel or sensor
+    inputs.
     """
     def __init__(self, actions, teamPopSize=360, rootBasedPop=True, gap=0.5,
         inputSize=33600, nRegisters=8, initMaxTeamSize=5, initMaxProgSize=128, maxTeamSize=-1,
@@ -62,7 +74,7 @@ class Trainer:
         pActAtom=0.5, pInstDel=0.5, pInstAdd=0.5, pInstSwp=1.0, pInstMut=1.0,
         doElites=True, memType=None, memMatrixShape=(100,8), rampancy=(0,0,0),
         operationSet="def", traversal="team", prevPops=None, mutatePrevs=True,
-        initMaxActProgSize=64, nActRegisters=4):
+        initMaxActProgSize=64, nActRegisters=4, precision="float64"):
 
         '''
         Validate inputs
@@ -103,6 +115,11 @@ class Trainer:
         if operationSet not in valid_operation_sets:
             raise Exception("Invalid operation set")
 
+        # Validate precision
+        valid_precisions = ["float64", "float32"]
+        if precision not in valid_precisions:
+            raise Exception("Invalid precision")
+
         # Validate Probability parameters
         probabilities = {
             "pLrnDel": pLrnDel,
@@ -186,11 +203,18 @@ class Trainer:
             nActRegisters = max(max(self.actionLengths), nActRegisters)
         self.nActRegisters = nActRegisters
 
+        # float type of registers and memory, float32 halves their size
+        self.precision = precision
+
         # core components of TPG
-        self.teams = []
-        self.rootTeams = []
-        self.learners = []
+        self.teams = PopulationList()
+        self.rootTeams = PopulationList()
+        self.learners = PopulationList()
+        self.roots = RootSet() # teams no learner points to, see countRootTeams
+        self.collector = Collector() # learners no team holds, see select
+        self.adoptedExtras = {} # copies of the extra teams adopted, see generate
         self.elites = [] # save best at each task
+        self.outcomeTable = OutcomeTable() # outcomes of the teams, see OutcomeTable
 
         self.generation = 0 # track this
 
@@ -199,6 +223,11 @@ class Trainer:
         self.actVars = {}
         self.nOperations = None
         self.functionsDict = {}
+        self.uuids = {} # for exporting ids, see getUuid
+        self.profileEvery = None # acts between samples when profiling, see setProfiling
+        self.profilers = {} # ActProfiler of each root team, by team id
+        self.graphChecking = False # check the graph each evolve, see setGraphChecking
+        self.graphViolations = [] # found by the last check
 
         # configure tpg functions and variable appropriately now
         configurer.configure(self, Trainer, Agent, Team, Learner, ActionObject, Program,
@@ -298,6 +327,8 @@ class Trainer:
             # save to team populations
             self.teams.append(team)
             self.rootTeams.append(team)
+            self.trackTeam(team)
+            self.outcomeTable.attach(team)
 
     """
     Gets rootTeams/agents. Sorts decending by sortTasks, and skips individuals
@@ -305,39 +336,83 @@ class Trainer:
     """
     def getAgents(self, sortTasks=[], multiTaskType='min', skipTasks=[]):
         # remove those that get skipped
-        rTeams = [team for team in self.rootTeams
-                if len(skipTasks) == 0
-                        or any(task not in team.outcomes for task in skipTasks)]
+        rTeams = list(self.rootTeams)
+        if len(skipTasks) > 0:
+            skipped = np.all(~np.isnan(self.outcomeTable.matrix(rTeams, skipTasks)), axis=1)
+            rTeams = [team for team, skip in zip(rTeams, skipped) if not skip]
 
         if len(sortTasks) == 0: # just get all
-            return [Agent(team, self.functionsDict, num=i, actVars=self.actVars)
+            agents = [Agent(team, self.functionsDict, num=i, actVars=self.actVars)
                     for i,team in enumerate(rTeams)]
         else:
 
             if len(sortTasks) == 1:
-                rTeams = [t for t in rTeams if sortTasks[0] in t.outcomes]
-                # return teams sorted by the outcome
-                return [Agent(team, self.functionsDict, num=i, actVars=self.actVars)
-                        for i,team in enumerate(sorted(rTeams,
-                                        key=lambda tm: tm.outcomes[sortTasks[0]], reverse=True))]
+                scores = self.outcomeTable.matrix(rTeams, sortTasks)[:,0]
+                # return teams sorted by the outcome, the ones without one dropped
+                order = [i for i in np.argsort(-scores, kind="stable") if not np.isnan(scores[i])]
+                agents = [Agent(rTeams[j], self.functionsDict, num=i, actVars=self.actVars)
+                        for i,j in enumerate(order)]
 
             else:
                 # apply scores/fitness to root teams
                 self.scoreIndividuals(sortTasks, multiTaskType=multiTaskType, doElites=False)
                 # return teams sorted by fitness
-                return [Agent(team, self.functionsDict, num=i, actVars=self.actVars)
+                agents = [Agent(team, self.functionsDict, num=i, actVars=self.actVars)
                         for i,team in enumerate(sorted(rTeams,
                                         key=lambda tm: tm.fitness, reverse=True))]
 
+        if self.profileEvery is not None:
+            for agent in agents:
+                agent.profiler = self.profilers.setdefault(agent.team.id,
+                    ActProfiler(every=self.profileEvery))
+
+        return agents
+
+    """
+    Turns on profiling of the agents from getAgents, each samples every every'th
+    act into the ActProfiler of its root team (kept in self.profilers by team
+    id, across generations, until select removes the team). None turns it off and drops the profilers.
+    Profiles made in other processes stay with the agents sent there.
+    """
+    def setProfiling(self, every=100):
+        self.profileEvery = every
+        if every is None:
+            self.profilers = {}
+
+    """
+    Turns on (or off) sharing program results between learners on the same
+    frame (see BidCache) for the agents from getAgents. Only pays off when
+    acts share a frame number, given to Agent.act by the caller, as each act
+    otherwise gets a new random one and nothing is ever shared, which makes
+    acting slower. Not for trainers with memory, where programs write to it.
+    """
+    def setBidCaching(self, cache=True):
+        if not cache:
+            self.actVars.pop("bidCache", None)
+        elif self.memType is not None:
+            raise ValueError("Bids can't be cached with memory, running a program writes to it")
+        else:
+            self.actVars["bidCache"] = BidCache()
+
+    """
+    Gets the sorted indices of the state that any agent in the population can
+    read. Environments (or workers) only need to send these values, see
+    utils.scatterState to rebuild a state to act on.
+    """
+    def getReadSet(self):
+        return getReadSet(self.learners, self.inputSize)
+
     """ 
     Gets the single best team at the given task, regardless of if its root or not.
     """
     def getEliteAgent(self, task):
         
-        teams = [t for t in self.teams if task in t.outcomes]
+        teams = list(self.teams)
+        scores = self.outcomeTable.matrix(teams, [task])[:,0]
+        if np.all(np.isnan(scores)):
+            raise ValueError("No team has an outcome for {}".format(task))
 
-        return Agent(max([tm for tm in teams],
-                        key=lambda t: t.outcomes[task]),
+        return Agent(teams[np.nanargmax(scores)],
                      self.functionsDict, num=0, actVars=self.actVars)
 
     """
@@ -345,11 +420,10 @@ class Trainer:
     """
     def applyScores(self, scores): # used when multiprocessing
         for score in scores:
-            for rt in self.rootTeams:
-                if score[0] == rt.id:
-                    for task, outcome in score[1].items():
-                        rt.outcomes[task] = outcome
-                    break # on to next score
+            rt = self.rootTeams.get(score[0])
+            if rt is not None:
+                self.outcomeTable.attach(rt)
+                rt.outcomes.update(score[1])
 
         return self.rootTeams
 
@@ -363,91 +437,99 @@ class Trainer:
         self.select(extraTeams) # select individuals to keep
         self.generate(extraTeams) # create new individuals from those kept
         self.nextEpoch() # set up for next generation
-        #self.validate_graph() # validate the tpg (for debug only)
+        if self.graphChecking:
+            self.graphViolations = self.validate_graph()
     """
     Assigns a fitness to each agent based on performance at the tasks. Assigns
     fitness values, or just returns sorted root teams.
     """
     def scoreIndividuals(self, tasks, multiTaskType='min', doElites=True):
+        outcomes = self.getOutcomes(tasks)
+
         # handle generation of new elites, typically just done in evolution
         if doElites:
             # get the best agent at each task
-            self.elites = [] # clear old elites
-            for task in tasks:
-                self.elites.append(max([team for team in self.rootTeams],
-                                        key=lambda t: t.outcomes[task]))
+            self.elites = [self.rootTeams[i] for i in np.argmax(outcomes, axis=0)]
 
         if len(tasks) == 1: # single fitness
-            for team in self.rootTeams:
-                team.fitness = team.outcomes[tasks[0]]
+            for team, fitness in zip(self.rootTeams, outcomes[:,0].tolist()):
+                team.fitness = fitness
         else: # multi fitness
             # assign fitness to each agent based on tasks and score type
-            if 'pareto' not in multiTaskType or 'lexicase' not in multiTaskType:
-                self.simpleScorer(tasks, multiTaskType=multiTaskType)
+            if multiTaskType in ('min', 'max', 'average'):
+                self.simpleScorer(tasks, multiTaskType=multiTaskType, outcomes=outcomes)
             elif multiTaskType == 'paretoDominate':
-                self.paretoDominateScorer(tasks)
+                self.paretoDominateScorer(tasks, outcomes)
             elif multiTaskType == 'paretoNonDominated':
-                self.paretoNonDominatedScorer(tasks)
+                self.paretoNonDominatedScorer(tasks, outcomes)
+            elif multiTaskType == 'paretoFront':
+                self.paretoFrontScorer(tasks, outcomes)
             elif multiTaskType == 'lexicaseStatic':
                 self.lexicaseStaticScorer(tasks)
             elif multiTaskType == 'lexicaseDynamic':
-                self.lexicaseDynamicScorer(tasks)
+                self.lexicaseDynamicScorer(tasks, outcomes)
+
+    """
+    Gets the outcomes of the root teams at tasks from the outcome table, a row
+    per root team (in order) and a column per task, for the scorers. Every
+    root team must have an outcome at every task.
+    """
+    def getOutcomes(self, tasks):
+        outcomes = self.outcomeTable.matrix(self.rootTeams, tasks)
+        missing = np.argwhere(np.isnan(outcomes))
+        if len(missing) > 0:
+            raise KeyError("Root team {} has no outcome for {}".format(
+                self.rootTeams[missing[0][0]].id, tasks[missing[0][1]]))
+        return outcomes
 
     """
     Gets either the min, max, or average score from each individual for ranking.
     """
-    def simpleScorer(self, tasks, multiTaskType='min'):
-        # first find min and max in each task
-        mins = []
-        maxs = []
-        for task in tasks:
-            mins.append(min([team.outcomes[task] for team in self.rootTeams]))
-            maxs.append(max([team.outcomes[task] for team in self.rootTeams]))
+    def simpleScorer(self, tasks, multiTaskType='min', outcomes=None):
+        if outcomes is None:
+            outcomes = self.getOutcomes(tasks)
+
+        # scale each task from its min to its max
+        mins = outcomes.min(axis=0)
+        ranges = outcomes.max(axis=0) - mins
+        scaled = (outcomes - mins) / np.where(ranges > 0, ranges, 1)
 
         # assign fitness
         if multiTaskType == 'min':
-            for rt in self.rootTeams:
-                rt.fitness = min([(rt.outcomes[task]-mins[i])/(maxs[i]-mins[i])
-                        for i,task in enumerate(tasks)])
+            fitnesses = scaled.min(axis=1)
         elif multiTaskType == 'max':
-            for rt in self.rootTeams:
-                rt.fitness = max([(rt.outcomes[task]-mins[i])/(maxs[i]-mins[i])
-                        for i,task in enumerate(tasks)])
+            fitnesses = scaled.max(axis=1)
         elif multiTaskType == 'average':
-            for rt in self.rootTeams:
-                scores = [(rt.outcomes[task]-mins[i])/(maxs[i]-mins[i])
-                            for i,task in enumerate(tasks)]
-                rt.fitness = sum(scores)/len(scores)
+            fitnesses = scaled.mean(axis=1)
+        for rt, fitness in zip(self.rootTeams, fitnesses.tolist()):
+            rt.fitness = fitness
 
     """
     Rank agents based on how many other agents it dominates
     """
-    def paretoDominateScorer(self, tasks):
-        for t1 in self.rootTeams:
-            t1.fitness = 0
-            for t2 in self.rootTeams:
-                if t1 == t2:
-                    continue # don't compare to self
-
-                # compare on all tasks
-                if all([t1.outcomes[task] >= t2.outcomes[task]
-                         for task in tasks]):
-                    t1.fitness += 1
+    def paretoDominateScorer(self, tasks, outcomes=None):
+        if outcomes is None:
+            outcomes = self.getOutcomes(tasks)
+        for team, count in zip(self.rootTeams, countBeaten(outcomes, np.greater_equal)):
+            team.fitness = int(count)
 
     """
     Rank agents based on how many other agents don't dominate it
     """
-    def paretoNonDominatedScorer(self, tasks):
-        for t1 in self.rootTeams:
-            t1.fitness = 0
-            for t2 in self.rootTeams:
-                if t1 == t2:
-                    continue # don't compare to self
+    def paretoNonDominatedScorer(self, tasks, outcomes=None):
+        if outcomes is None:
+            outcomes = self.getOutcomes(tasks)
+        for team, count in zip(self.rootTeams, countBeaten(outcomes, np.less)):
+            team.fitness = -int(count)
 
-                # compare on all tasks
-                if all([t1.outcomes[task] < t2.outcomes[task]
-                         for task in tasks]):
-                    t1.fitness -= 1
+    """
+    Rank agents by the pareto front they are in, the non-dominated ones first
+    """
+    def paretoFrontScorer(self, tasks, outcomes=None):
+        if outcomes is None:
+            outcomes = self.getOutcomes(tasks)
+        for team, front in zip(self.rootTeams, paretoFronts(outcomes)):
+            team.fitness = -int(front)
 
     def lexicaseStaticScorer(self, tasks):
         stasks = list(tasks)
@@ -456,37 +538,40 @@ class Trainer:
         for rt in self.rootTeams:
             rt.fitness = rt.outcomes[tasks[0]]
 
-
-    def lexicaseDynamicScorer(self, tasks):
-        pass
+    """
+    Rank agents by how many of as many lexicase selections as there are root
+    teams pick it, each going through the tasks in a new random order
+    """
+    def lexicaseDynamicScorer(self, tasks, outcomes=None):
+        if outcomes is None:
+            outcomes = self.getOutcomes(tasks)
+        counts = lexicaseCounts(outcomes, getRng(self.mutateParams))
+        for team, count in zip(self.rootTeams, counts):
+            team.fitness = int(count)
 
     """
     Save some stats on the fitness.
     """
     def saveFitnessStats(self):
-        fitnesses = []
-        for rt in self.rootTeams:
-            fitnesses.append(rt.fitness)
+        fitnesses = np.array([rt.fitness for rt in self.rootTeams])
 
         self.fitnessStats = {}
-        self.fitnessStats['fitnesses'] = fitnesses
-        self.fitnessStats['min'] = min(fitnesses)
-        self.fitnessStats['max'] = max(fitnesses)
-        self.fitnessStats['average'] = sum(fitnesses)/len(fitnesses)
+        self.fitnessStats['fitnesses'] = fitnesses.tolist()
+        self.fitnessStats['min'] = fitnesses.min().item()
+        self.fitnessStats['max'] = fitnesses.max().item()
+        self.fitnessStats['average'] = fitnesses.mean().item()
 
     """
     Gets stats on some task.
     """
     def getTaskStats(self, task):
-        scores = []
-        for rt in self.rootTeams:
-            scores.append(rt.outcomes[task])
+        scores = self.getOutcomes([task])[:,0]
 
         scoreStats = {}
-        scoreStats['scores'] = scores
-        scoreStats['min'] = min(scores)
-        scoreStats['max'] = max(scores)
-        scoreStats['average'] = sum(scores)/len(scores)
+        scoreStats['scores'] = scores.tolist()
+        scoreStats['min'] = scores.min().item()
+        scoreStats['max'] = scores.max().item()
+        scoreStats['average'] = scores.mean().item()
 
         return scoreStats
 
@@ -499,71 +584,34 @@ class Trainer:
         numKeep = len(self.rootTeams) - int(len(self.rootTeams)*self.gap)
         deleteTeams = rankedTeams[numKeep:]
 
-        #print("BEFORE SELECTION:")        
-
-        pre_orphans = [learner for learner in self.learners if learner.numTeamsReferencing() == 0]
-
-        #print("Number of orphans before selection: {}".format(len(pre_orphans)))
-
-        orphan_teams = [team for team in self.teams if len(team.inLearners) == 0 and team not in self.rootTeams]
-        #print("Number of orphan teams before selection: {}".format(len(orphan_teams)))
-
-        #print("Learners:")
-        #for cursor in self.learners:
-        #   print("Learner {} -> [{}]{} inTeams:".format( cursor.id, "Atomic" if cursor.isActionAtomic() else "Team", cursor.actionObj.actionCode if cursor.isActionAtomic() else cursor.actionObj.teamAction.id))
-        #    for t_id in cursor.inTeams:
-        #        print("\t{}".format(t_id ))
-
-        #for cursor in self.teams:
-        #    print("Team: {} inLearners:".format(cursor.id))
-        #    for l_id in cursor.inLearners:
-        #        print("\t{}".format(l_id))
-
-        #print("-----------------------------------------------------")  
-
         # delete the team unless it is an elite (best at some task at-least)
         # don't delete elites because they may not be root - TODO: elaborate
         for team in [t for t in deleteTeams if t not in self.elites]:
 
-    
-            # remove learners from team and delete team from populations
-            if extraTeams is None or team not in extraTeams:
+            # an elite of the last generation kept as a root team, but learners
+            # point to it, so it only stops being a root team
+            if team.numLearnersReferencing() > 0:
+                self.rootTeams.remove(team)
+                continue
+
+            # remove learners from team and delete team from populations, but
+            # leave the caller's own teams (adopted ones are copies) as they are
+            if extraTeams is None or not any(team is extra for extra in extraTeams):
                 team.removeLearners()
             self.teams.remove(team)
             self.rootTeams.remove(team)
+            self.untrackTeam(team)
+            self.outcomeTable.release(team)
+            self.uuids.pop(("team", team.id), None)
+            self.profilers.pop(team.id, None)
 
-        #print("AFTER SELECTION:")
-        # Find all learners that have no teams pointing to them
-        orphans = [learner for learner in self.learners if learner.numTeamsReferencing() == 0]
-        #print("Number of orphans after selection: {}".format(len(orphans)))
-
-        #print("Orphans:")
-        #for cursor in orphans:
-        #    print("\t{}".format(cursor.id))
-
-        #print("Learners:")
-        #for cursor in self.learners:
-        #    print("Learner {} -> [{}]{} inTeams:".format( cursor.id, "Atomic" if cursor.isActionAtomic() else "Team", cursor.actionObj.actionCode if cursor.isActionAtomic() else cursor.actionObj.teamAction.id))
-        #    for t_id in cursor.inTeams:
-        #        print("\t{}".format(t_id ))
-
-        #for cursor in self.teams:
-        #    print("Team: {} inLearners:".format(cursor.id))
-        #    for l_id in cursor.inLearners:
-        #        print("\t{}".format(l_id))
+        # remove the learners no team holds any more, see Collector
+        for learner in self.collector.collect(self.learners):
+            self.uuids.pop(("learner", learner.id), None)
 
-        #print("-----------------------------------------------------")  
-
-        # These learners will be removed, but before we can do that, we should remove 
-        # their ids from any team's inLearners that the orphans are pointing to.
-        for cursor in orphans:
-            if not cursor.isActionAtomic(): # If the orphan does NOT point to an atomic action
-                # Get the team the orphan is pointing to and remove the orphan's id from the team's in learner list
-                cursor.actionObj.teamAction.inLearners.remove(str(cursor.id))
-
-        # Finaly, purge the orphans
-        self.learners = [learner for learner in self.learners if learner.numTeamsReferencing() > 0]
-                
+        # forget the copies of extras deleted
+        self.adoptedExtras = {handle: team for handle, team in self.adoptedExtras.items()
+            if self.teams.get(team.id) is team}
 
     """
     Generates new rootTeams based on existing teams.
@@ -574,14 +622,22 @@ class Trainer:
         protectedExtras = []
         extrasAdded = 0
 
-        # add extras into the population
+        # add extras into the population, as copies of teams of other trainers
+        # (adopted once, the same copy stands in for the team later on)
+        extras = []
         if extraTeams is not None:
             for team in extraTeams:
-                if team not in self.teams:
+                team = self.adoptedExtras.get(team.handle, team)
+                if self.teams.get(team.id) is not team:
+                    adopted = self.adoptTeam(team)
+                    self.adoptedExtras[team.handle] = adopted
+                    team = adopted
                     self.teams.append(team)
+                    self.trackTeam(team)
                     extrasAdded += 1
                 else:
                     protectedExtras.append(team)
+                extras.append(team)
 
         oLearners = list(self.learners)
         oTeams = list(self.teams)
@@ -604,29 +660,102 @@ class Trainer:
             child.mutate(self.mutateParams, oLearners, oTeams)
 
             self.teams.append(child)
-
-        # remove unused extras
-        if extraTeams is not None:
-            for team in extraTeams:
-                if team.numLearnersReferencing() == 0 and team not in protectedExtras:
-                    self.teams.remove(team)
+            self.trackTeam(child)
+            self.addLearnersOf(child)
+
+        # remove unused extras, and add the learners of the ones kept
+        for extra, team in zip(extraTeams or [], extras):
+            if team.numLearnersReferencing() == 0 and team not in protectedExtras:
+                self.teams.remove(team)
+                self.untrackTeam(team)
+                self.outcomeTable.release(team)
+                team.removeLearners() # any of ours it held
+                del self.adoptedExtras[extra.handle]
+            elif team not in protectedExtras:
+                self.addLearnersOf(team)
+
+    """
+    Adds the learners of a team new to the population that aren't in the
+    learner population yet. New learners only come from new teams, so only
+    those need to be looked at.
+    """
+    def addLearnersOf(self, team):
+        for learner in team.learners:
+            if learner not in self.learners:
+                self.learners.append(learner)
 
     """
-    Finalize populations and prepare for next generation/epoch.
+    Gets a copy of team, from another trainer (e.g. one of the extraTeams),
+    for this trainer, leaving the team and its trainer as they are. Its
+    learners and the teams they lead to are copied as well, except for ones
+    in this trainer's populations, and the copies get new ids from this
+    trainer's counters, as ids are only unique within a trainer. Edges are
+    recorded (inTeams, inLearners) for the copies only, the teams the copied
+    learners lead to aren't added to the population, as before.
+    """
+    def adoptTeam(self, team):
+        ours = {id(member): member for member in self.teams}
+        ours.update((id(member), member) for member in self.learners)
+        adopted = copy.deepcopy(team, dict(ours))
+
+        # the copies, those reachable from adopted without going through ours
+        teams = [adopted]
+        learners = []
+        seen = {id(adopted)}
+        for cursor in teams:
+            cursor.id = newId(self.mutateParams, "idCountTeam")
+            cursor.inLearners = []
+            for learner in cursor.learners:
+                if id(learner) in ours or id(learner) in seen:
+                    continue
+                seen.add(id(learner))
+                learners.append(learner)
+                actionTeam = learner.getActionTeam()
+                if actionTeam is not None and id(actionTeam) not in ours and id(actionTeam) not in seen:
+                    seen.add(id(actionTeam))
+                    teams.append(actionTeam)
+
+        for learner in learners:
+            learner.id = newId(self.mutateParams, "idCountLearner")
+            learner.inTeams = []
+            learner.program.id = newId(self.mutateParams, "idCountProgram")
+            actionProgram = getattr(learner.actionObj, "program", None)
+            if actionProgram is not None:
+                actionProgram.id = newId(self.mutateParams, "idCountProgram")
+
+        for cursor in teams:
+            for learner in cursor.learners:
+                learner.inTeams.append(cursor.id)
+        for learner in learners:
+            if not learner.isActionAtomic():
+                learner.getActionTeam().addInLearner(learner.id)
+
+        return adopted
+
+    """
+    Starts or stops keeping track of the root teams and orphaned learners of
+    team, as it joins or leaves the team population.
+    """
+    def trackTeam(self, team):
+        self.roots.track(team)
+        self.collector.track(team)
+
+    def untrackTeam(self, team):
+        self.roots.untrack(team)
+        self.collector.untrack(team)
+
+    """
+    Finalize populations and prepare for next generation/epoch. New learners
+    are already in the learner population, see addLearnersOf.
     """
     def nextEpoch(self):
-        # add in newly added learners, and decide root teams
-        self.rootTeams = []
-        for team in self.teams:
-            # add any new learners to the population
-            for learner in team.learners:
-                if learner not in self.learners:
-                    #print("Adding {} to trainer learners".format(learner.id))
-                    self.learners.append(learner)
-
-            # maybe make root team
-            if team.numLearnersReferencing() == 0 or team in self.elites:
+        # root teams are the ones no learner points to, and the elites
+        self.rootTeams = PopulationList(self.roots)
+        for team in self.elites:
+            if team not in self.rootTeams and team in self.teams:
                 self.rootTeams.append(team)
+        for team in self.rootTeams:
+            self.outcomeTable.attach(team)
 
         self.generation += 1
 
@@ -657,84 +786,44 @@ class Trainer:
         return learnersRemoved, teamsAffected
     
     '''
-    Go through all teams and learners and make sure their inTeams/inLearners correspond with 
-    their team.learner/teamActions as expected.
+    Checks that the teams and learners reference each other as they should
+    (see graph_check.checkGraph), returns the GraphViolations found.
     '''
     def validate_graph(self):
-        print("Validating graph")
-
-        print("Checking for broken learners")
-        for cursor in self.learners:
-            if cursor.isActionAtomic() and cursor.actionObj.actionCode == None:
-                print("{} is an action atomic learner with no actionCode!".format(str(cursor.id)))
-            if cursor.actionObj.teamAction == None and cursor.actionObj.actionCode == None:
-                print("{} has no action!".format(str(cursor.id)))
-
-        learner_map = {}
-        for cursor in self.learners:
-            if str(cursor.id) not in learner_map:
-                learner_map[str(cursor.id)] = cursor.inTeams
-            else:
-                raise Exception("Duplicate learner id in trainer!")
-        
-        '''
-        For every entry in the learner map check that the corresponding team has the learner 
-        in its learners 
-        '''
-        for i,cursor in enumerate(learner_map.items()):
-            for expected_team in cursor[1]:
-                found_team = False
-                for team in self.teams:
-                    if str(team.id) == expected_team:
-                        found_learner = 0
-                        for learner in team.learners:
-                            if str(learner.id) == cursor[0]:
-                                found_learner += 1
-                        if found_learner != 1:
-                            print("found_learner = {} for learner {} in team {}".format(found_learner, cursor[0], str(team.id)))
-                        found_team = True
-                        break
-                if found_team == False:
-                    print("Could not find expected team {} in trainer".format(expected_team))
-            print("learner {} inTeams valid [{}/{}]".format(cursor[0], i, len(learner_map.items())-1))
+        return checkGraph(self.teams, self.learners, self.roots)
+
+    '''
+    Turns on (or off) checking the graph at the end of each evolve, putting
+    what is found in self.graphViolations.
+    '''
+    def setGraphChecking(self, check=True):
+        self.graphChecking = check
+        self.graphViolations = []
 
-        '''
-        Verify that for every inLearner in a team, the learner exists in the trainer, pointing to that team
-        '''
-        team_map = {}
-        for cursor in self.teams:
-            if str(cursor.id) not in team_map:
-                team_map[str(cursor.id)] = cursor.inLearners
-            else:
-                raise Exception("Duplicate team id in trainer!")
-
-        for i,cursor in enumerate(team_map.items()):
-            for expected_learner in cursor[1]:
-                found_learner = False
-                points_to_team = False
-                for learner in self.learners:
-                    if str(learner.id) == expected_learner:
-                        found_learner = True
-                        if str(learner.actionObj.teamAction.id) == cursor[0]:
-                            points_to_team = True
-                            break
-                if found_learner == False:
-                    print("Could not find learner {} from team {} inLearners in trainer.".format(expected_learner, cursor[0]))
-                if points_to_team == False:
-                    print("Learner {} does not point to team {}".format(expected_learner, cursor[0]))
-            print("team {} inLearners valid [{}/{}]".format(cursor[0], i, len(team_map.items())-1))
     """
     Get the number of root teams currently residing in the teams population.
     """
     def countRootTeams(self):
-        numRTeams = 0
-        for team in self.teams:
-            if team.numLearnersReferencing() == 0:
-                numRTeams += 1
+        return len(self.roots)
 
-        return numRTeams
 
+    """
+    Gets the uuid standing in for the team or learner (kind) with id, for
+    exporting. Ids are only unique among teams or learners of one trainer, the
+    uuids are made the first time they are asked for and kept until the team
+    or learner leaves the population (see select).
+    """
+    def getUuid(self, kind, id):
+        key = (kind, id)
+        if key not in self.uuids:
+            self.uuids[key] = str(uuid.uuid4())
 
+        return self.uuids[key]
+
+    """
+    Gets the graph of teams, learners and actions as nodes and links, teams and
+    learners identified by their uuid (see getUuid).
+    """
     def get_graph(self):
 
 
@@ -756,7 +845,7 @@ class Trainer:
         for team in self.teams:
             result["nodes"].append(
                 {
-                    "id": str(team.id),
+                    "id": self.getUuid("team", team.id),
                     "type": "rootTeam" if team in self.rootTeams else "team"
                 }
             )
@@ -765,7 +854,7 @@ class Trainer:
         for learner in self.learners:
             result["nodes"].append(
                 {
-                    "id": str(learner.id),
+                    "id": self.getUuid("learner", learner.id),
                     "type": "learner"
                 }
             )
@@ -776,8 +865,8 @@ class Trainer:
             for learner in team.inLearners:
                 result["links"].append(
                     {
-                        "source": learner,
-                        "target": str(team.id)
+                        "source": self.getUuid("learner", learner),
+                        "target": self.getUuid("team", team.id)
                     }
                 )
         
@@ -786,8 +875,8 @@ class Trainer:
             for team in learner.inTeams:
                 result["links"].append(
                     {
-                        "source": team,
-                        "target": str(learner.id)
+                        "source": self.getUuid("team", team),
+                        "target": self.getUuid("learner", learner.id)
                     }
                 )
             
@@ -795,7 +884,7 @@ class Trainer:
             if learner.isActionAtomic():
                 result["links"].append(
                     {
-                        "source": str(learner.id),
+                        "source": self.getUuid("learner", learner.id),
                         "target": str(learner.actionObj.actionCode)
                     }
                 )
@@ -818,6 +907,8 @@ class Trainer:
     that is done at the agent level).
     """
     def configFunctions(self):
+        configurer.upgradeFunctionsDict(self.functionsDict)
+
         # first set up Agent functions
         Agent.configFunctions(self.functionsDict["Agent"])
 
@@ -833,6 +924,53 @@ class Trainer:
         # set up Program functions
         Program.configFunctions(self.functionsDict["Program"])
 
+        configurer.upgradeActVars(self.actVars, Program)
+
+    """
+    The root set and copies of extras aren't saved, see __setstate__ and
+    generate.
+    """
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["roots"] = None # tracks the teams again when loaded
+        state["adoptedExtras"] = {} # by handles, which are only good in this process
+        # the teams' outcomes are saved as dicts, attached to a new table when next used
+        state["outcomeTable"] = OutcomeTable()
+        return state
+
+    """
+    The root teams are found again from the teams (of any trainer saved before
+    they were tracked as well). Trainers saved before the collector get one
+    with the orphans there are queued, and attributes added since then get
+    the values a new trainer starts with.
+    """
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name, value in (("precision", "float64"), ("uuids", {}), ("profileEvery", None),
+                ("profilers", {}), ("graphChecking", False), ("graphViolations", []),
+                ("adoptedExtras", {}), ("outcomeTable", None)):
+            self.__dict__.setdefault(name, value)
+        if self.outcomeTable is None:
+            self.outcomeTable = OutcomeTable()
+        # saved with uuids for ids, exported as the same uuids still. Learners
+        # may point to teams select removed from the population back then.
+        if any(not isinstance(team.id, int) for team in self.teams):
+            teams = {id(team): team for team in self.teams}
+            for learner in self.learners:
+                if not learner.isActionAtomic():
+                    teams.setdefault(id(learner.getActionTeam()), learner.getActionTeam())
+            self.uuids.update(renumberIds(teams.values(), self.learners, self.mutateParams))
+            for name in ("teams", "rootTeams", "learners"):
+                setattr(self, name, PopulationList(getattr(self, name)))
+        self.roots = RootSet()
+        if "collector" not in state:
+            self.collector = Collector()
+            for learner in self.learners:
+                if learner.numTeamsReferencing() == 0:
+                    self.collector.queue(learner)
+        for team in self.teams:
+            self.trackTeam(team)
+
     """
     Save the trainer to the file, saving any class values to the instance.
     """
@@ -845,5 +983,11 @@ Load some trainer from the file, returning it and repopulate class values.
 def loadTrainer(fileName):
     trainer = pickle.load(open(fileName, 'rb'))
     trainer.configFunctions()
+
+    # trainers saved before populations were PopulationLists
+    for name in ("teams", "rootTeams", "learners"):
+        if isinstance(getattr(trainer, name), list):
+            setattr(trainer, name, PopulationList(getattr(trainer, name)))
+
     return trainer
 
@@ -1,4 +1,5 @@
 import random
+import itertools
 import numpy as np
 
 """
@@ -12,6 +13,71 @@ Coin flips, at varying levels of success based on prob.
 def flip(prob):
     return random.uniform(0.0,1.0) < prob
 
+"""
+Gets the next id from the counter params[key], one of the idCount entries of
+Trainer.mutateParams, so ids are small ints that only ever go up within a
+trainer. See Trainer.getUuid for ids to export.
+"""
+def newId(params, key):
+    id = params.get(key, 0)
+    params[key] = id + 1
+    return id
+
+"""
+Gives teams and learners (and the programs of learners and their actions) new
+ids from the counters in params (see newId), and fixes the inTeams and
+inLearners that refer to them. For teams and learners saved when ids were
+uuids, with inTeams and inLearners holding them as strings. Returns the old
+ids as strings, by ("team" or "learner", new id).
+"""
+def renumberIds(teams, learners, params):
+    teamIds = {}
+    for team in teams:
+        teamIds[str(team.id)] = team.id = newId(params, "idCountTeam")
+
+    learnerIds = {}
+    programs = {}
+    for learner in learners:
+        learnerIds[str(learner.id)] = learner.id = newId(params, "idCountLearner")
+        programs[id(learner.program)] = learner.program
+        actionProgram = getattr(learner.actionObj, "program", None)
+        if actionProgram is not None:
+            programs[id(actionProgram)] = actionProgram
+        # teams not given (e.g. outside an agent's graph) keep their old ids
+        learner.inTeams = [teamIds.get(str(id), id) for id in learner.inTeams]
+
+    for program in programs.values():
+        program.id = newId(params, "idCountProgram")
+
+    for team in teams:
+        team.inLearners = [learnerIds.get(str(id), id) for id in team.inLearners]
+
+    oldIds = {("team", new): old for old, new in teamIds.items()}
+    oldIds.update((("learner", new), old) for old, new in learnerIds.items())
+    return oldIds
+
+"""
+Gets the numpy random Generator in params["rng"] (see Trainer.mutateParams),
+making one from np.random's state if there isn't one yet, e.g. in
+mutateParams of a trainer saved before it had one.
+"""
+def getRng(params):
+    rng = params.get("rng")
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(2**31))
+        params["rng"] = rng
+    return rng
+
+_handles = itertools.count()
+
+"""
+Gets a new small integer handle, unique within this process. Teams and
+learners get one when made (or loaded/copied) for cheap visited checks while
+acting.
+"""
+def newHandle():
+    return next(_handles)
+
 """
 Returns the teams that this team references, either immediate or
 recursively.
@@ -26,14 +92,14 @@ def getTeams(team, rec=True, visited=None, result=None):
             visited = set()
             result = list()
 
-        visited.add(str(team.id))
+        visited.add(team.id)
         if team not in result:
             result.append(team)
 
         # get team count from each learner that has a team
         for lrnr in team.learners:
             lrnrTeam = lrnr.getActionTeam()
-            if lrnrTeam is not None and str(lrnrTeam.id) not in visited:
+            if lrnrTeam is not None and lrnrTeam.id not in visited:
                 getTeams(lrnrTeam, rec=True, visited=visited, result=result)
 
         if len(visited) != len(result):
@@ -54,6 +120,31 @@ def getTeams(team, rec=True, visited=None, result=None):
         return [lrnr.getActionTeam() for lrnr in team.learners
             if not lrnr.isActionAtomic()]
 
+"""
+Returns the teams and the learners reachable from team, each once, breadth
+first with team first. Goes by identity, so it doesn't compare teams or
+learners (see getTeams and getLearners) and takes time in proportion to the
+graph.
+"""
+def getGraph(team):
+    teams = [team]
+    learners = []
+    seen = {id(team)}
+
+    for cursor in teams: # grows as teams are found
+        for lrnr in cursor.learners:
+            if id(lrnr) in seen:
+                continue
+            seen.add(id(lrnr))
+            learners.append(lrnr)
+
+            lrnrTeam = lrnr.getActionTeam()
+            if lrnrTeam is not None and id(lrnrTeam) not in seen:
+                seen.add(id(lrnrTeam))
+                teams.append(lrnrTeam)
+
+    return teams, learners
+
 """
 Returns the learners on this team, immediately or recursively.
 """
@@ -67,14 +158,14 @@ def getLearners(team, rec=True, tVisited=None, lVisited=None, result=None, map=N
             result = []
             map = {}
 
-        tVisited.add(str(team.id))
-        [lVisited.add(str(lrnr.id)) for lrnr in team.learners]
+        tVisited.add(team.id)
+        [lVisited.add(lrnr.id) for lrnr in team.learners]
         
         for cursor in team.learners:
-            if str(team.id) not in map:
-                    map[str(team.id)] = [str(cursor.id)]
+            if team.id not in map:
+                    map[team.id] = [cursor.id]
             else:
-                map[str(team.id)].append(str(cursor.id))
+                map[team.id].append(cursor.id)
 
             if cursor not in result:
                 result.append(cursor)
@@ -83,7 +174,7 @@ def getLearners(team, rec=True, tVisited=None, lVisited=None, result=None, map=N
         # get learner count from each learner that has a team
         for lrnr in team.learners:
             lrnrTeam = lrnr.getActionTeam()
-            if lrnrTeam is not None and str(lrnrTeam.id) not in tVisited:
+            if lrnrTeam is not None and lrnrTeam.id not in tVisited:
                 getLearners(lrnrTeam, rec=True, tVisited=tVisited, lVisited=lVisited, result=result, map=map)
 
         if len(lVisited) != len(result):
@@ -96,10 +187,10 @@ def getLearners(team, rec=True, tVisited=None, lVisited=None, result=None, map=N
             print("[getLearners]result learner id's")
             freq = {}
             for cursor in result:
-                if str(cursor.id) not in freq:
-                    freq[str(cursor.id)] = 1
+                if cursor.id not in freq:
+                    freq[cursor.id] = 1
                 else:
-                    freq[str(cursor.id)] = freq[str(cursor.id)] + 1
+                    freq[cursor.id] = freq[cursor.id] + 1
     
             print(freq)
 
@@ -108,7 +199,7 @@ def getLearners(team, rec=True, tVisited=None, lVisited=None, result=None, map=N
                     first = None
                     second = None
                     for j in result:
-                        if str(j.id) == cursor[0]:
+                        if j.id == cursor[0]:
                             if first == None:
                                 first = j
                             else:
@@ -118,7 +209,7 @@ def getLearners(team, rec=True, tVisited=None, lVisited=None, result=None, map=N
                     print("first == second? {}".format(first.debugEq(second)))
                     print("id appears in the following teams: ")
                     for entry in map.items():
-                        if str(first.id) in entry[1]:
+                        if first.id in entry[1]:
                             print(entry[0])
 
         return result
@@ -243,4 +334,102 @@ def pathDepths(team, prevDepth=0, parents=[]):
     for nTeam in nextTeams:
         depths.extend(pathDepths(nTeam, myDepth, list(parents)))
 
-    return depths
\ No newline at end of file
+    return depths
+"""
+Returns the sorted indices of the input that the given learners can read, so the
+environment only needs to produce those. Only effective instructions count,
+along with the action programs of real valued actions.
+"""
+def getReadSet(learners, inputSize):
+    from tpg.program import Program
+
+    readSet = set()
+    for lrnr in learners:
+        programs = [lrnr.program.getEffectiveInstructions(len(lrnr.registers))]
+        if lrnr.isActionAtomic() and getattr(lrnr.actionObj, "program", None) is not None:
+            programs.append(lrnr.actionObj.program.instructions)
+
+        for insts in programs:
+            ops = insts[:,1]
+            known = ops < len(Program.opTraits)
+            readsInput = np.zeros(len(insts), dtype=bool)
+            readsInput[known] = Program.opTraits[ops[known], 1] & (insts[known,0] == 1)
+            readSet.update(np.unique(insts[readsInput,3] % inputSize).tolist())
+
+    return np.array(sorted(readSet), dtype=np.int64)
+
+"""
+Places the values of the read set indices back into a full sized state, that
+programs can be run on. The rest of the state is never read so is left as is
+(zeros for a new state). Pass the previous state as out to not reallocate.
+"""
+def scatterState(values, readSet, inputSize, out=None):
+    if out is None:
+        out = np.zeros(inputSize)
+
+    out[readSet] = values
+    return out
+
+"""
+Counts for each row of outcomes (a row of scores on each task per team,
+higher is better) the other rows it beats on every task, where beating is
+compare (e.g. np.greater_equal) of the row's score with the other's. Done a
+chunk of rows at a time so that about maxCells comparisons are held at once.
+"""
+def countBeaten(outcomes, compare, maxCells=2**24):
+    n, nTasks = outcomes.shape
+    counts = np.zeros(n, dtype=np.int64)
+    chunk = max(1, maxCells // max(1, n*nTasks))
+    for start in range(0, n, chunk):
+        rows = outcomes[start:start+chunk]
+        beats = np.all(compare(rows[:,None,:], outcomes[None,:,:]), axis=2)
+        beats[np.arange(len(rows)), np.arange(start, start+len(rows))] = False
+        counts[start:start+len(rows)] = np.count_nonzero(beats, axis=1)
+    return counts
+
+"""
+Sorts the rows of outcomes (as in countBeaten) into pareto fronts, returns
+the front of each row, 0 for the non-dominated ones, 1 for the ones only
+dominated by those, and so on. A row dominates another if it is at least as
+good on every task and better on one.
+"""
+def paretoFronts(outcomes, maxCells=2**24):
+    n, nTasks = outcomes.shape
+    dominates = np.zeros((n, n), dtype=bool)
+    chunk = max(1, maxCells // max(1, n*nTasks))
+    for start in range(0, n, chunk):
+        rows = outcomes[start:start+chunk,None,:]
+        dominates[start:start+chunk] = (np.all(rows >= outcomes[None,:,:], axis=2)
+            & np.any(rows > outcomes[None,:,:], axis=2))
+
+    fronts = np.full(n, -1, dtype=np.int64)
+    dominatedBy = np.count_nonzero(dominates, axis=0)
+    front = 0
+    while np.any(fronts < 0):
+        current = (dominatedBy == 0) & (fronts < 0)
+        fronts[current] = front
+        dominatedBy -= np.count_nonzero(dominates[current], axis=0)
+        front += 1
+    return fronts
+
+"""
+Runs as many lexicase selections on outcomes (as in countBeaten) as there are
+rows, all at once, and returns how many times each row was selected. Each
+selection goes through the tasks in its own random order, keeping only the
+rows best at each task, until one is left or the tasks run out, then picks
+one of those left at random. Missing (NaN) outcomes lose to everything.
+"""
+def lexicaseCounts(outcomes, rng):
+    outcomes = np.where(np.isnan(outcomes), -np.inf, outcomes)
+    n, nTasks = outcomes.shape
+    orders = np.argsort(rng.random((n, nTasks)), axis=1)
+
+    left = np.ones((n, n), dtype=bool) # selection x row
+    for step in range(nTasks):
+        scores = np.where(left, outcomes[:,orders[:,step]].T, -np.inf)
+        left &= scores == scores.max(axis=1)[:,None]
+        if np.all(np.count_nonzero(left, axis=1) == 1):
+            break
+
+    selected = np.argmax(np.where(left, rng.random((n, n)), -1), axis=1)
+    return np.bincount(selected, minlength=n)
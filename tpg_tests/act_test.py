@@ -1,7 +1,15 @@
-from tpg_tests.test_utils import create_dummy_team, getStateALE
+from tpg_tests.test_utils import create_dummy_team, getStateALE, evolve_trainer
+from tpg.agent import Agent
+from tpg.program import Program
+from tpg.bid_cache import BidCache
+from tpg.population_executor import PopulationExecutor
+from tpg.decision_trace import DecisionTrace
+from tpg.act_profiler import ActProfiler
+from tpg.trainer import Trainer
 import unittest
 import xmlrunner
 import numpy as np
+import copy
 
 class ActTest(unittest.TestCase):
 
@@ -54,10 +62,10 @@ class ActTest(unittest.TestCase):
         
         valid_actions = list()
         for cursor in valid_selection:
-            valid_actions.append(team.act(state=state, actVars=actVars,visited=list()))
+            valid_actions.append(team.act(state=state, actVars=actVars,visited=set()))
 
         # Ensure the chosen action is in the list of valid actions
-        self.assertIn(top_learner.getAction(state=state, visited=list()), valid_actions)
+        self.assertIn(top_learner.getAction(state=state, visited=set()), valid_actions)
 
     '''
     Create a simple cycle with three teams:
@@ -106,17 +114,17 @@ class ActTest(unittest.TestCase):
 
         # Ensure a value error is raised, as there should be no possible action
         with self.assertRaises(ValueError) as expected:
-            visited = list()
+            visited = set()
 
             action = t1.act(state=state, visited=visited, actVars=actVars)
 
             # Ensure error is raised
             self.assertIsNotNone(expected.exception)
 
-            # Ensure all teams string uuid appears in visited set
-            self.assertIn(str(t1.id), visited)
-            self.assertIn(str(t2.id), visited)
-            self.assertIn(str(t3.id), visited)
+            # Ensure all teams handles appear in visited set
+            self.assertIn(t1.handle, visited)
+            self.assertIn(t2.handle, visited)
+            self.assertIn(t3.handle, visited)
 
             # Ensure visited is length 3
             self.assertEqual(3, len(visited)) 
@@ -159,15 +167,268 @@ class ActTest(unittest.TestCase):
         # Ensure a value error is raised, as there should be no possible action here.
         with self.assertRaises(ValueError) as expected:
 
-            visited = list()
+            visited = set()
 
             action = team_1.act(state=state, visited=visited, actVars=actVars)
 
             # Ensure error is raised
             self.assertIsNotNone(expected.exception)
 
-            # Ensure team_1 string uuid appears in visited set
-            self.assertIn(str(team_1.id), visited)
+            # Ensure team_1 handle appears in visited set
+            self.assertIn(team_1.handle, visited)
+
+    '''
+    Batched act must pick the same actions as acting on each state alone with
+    freshly zeroed registers, and must not disturb the learners' registers.
+    '''
+    def test_act_batch(self):
+
+        team, learners = create_dummy_team(num_learners=6)
+        agent = Agent(team, None, actVars={"frameNum":0})
+
+        states = np.array([getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+            for _ in range(10)])
+
+        for cursor in learners:
+            cursor.registers[:] = 7
+        batch_actions = agent.actBatch(states)
+
+        # registers must be left as they were
+        for cursor in learners:
+            self.assertTrue(np.all(cursor.registers == 7))
+
+        for n in range(len(states)):
+            agent.zeroRegisters()
+            self.assertEqual(agent.act(states[n]), batch_actions[n])
+
+        # real actions too, each row from zeroed action registers of its own
+        trainer = Trainer(actions=[0,2,3], teamPopSize=10, inputSize=8)
+        self.addCleanup(trainer.cleanup) # back to the default functions
+        states = np.random.rand(10, 8)
+        for agent in trainer.getAgents():
+            batch_actions = agent.actBatch(states)
+            for n in range(len(states)):
+                agent.zeroRegisters()
+                action, real = agent.act(states[n])
+                self.assertEqual(action, batch_actions[n][0])
+                self.assertTrue(np.array_equal(real, batch_actions[n][1]))
+    '''
+    The fused team kernel must pick the same learner as bidding each learner one
+    by one, and leave every learner with the registers its own bid would have.
+    '''
+    def test_top_learner(self):
+
+        team, learners = create_dummy_team(num_learners=8)
+        state = getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+
+        valid = np.array([True]*len(learners), dtype=bool)
+        valid[0] = False
+
+        top = team.topLearner(state, valid, actVars={"frameNum":1})
+        # invalid learners are not run
+        self.assertEqual(learners[0].frameNum, 0)
+
+        for cursor in learners:
+            cursor.zeroRegisters()
+        bids = [cursor.bid(state, actVars={"frameNum":2}) for cursor in learners[1:]]
+
+        self.assertEqual(top, 1 + int(np.argmax(bids)))
+
+        # learners that already bid this frame are not rerun
+        team.learners[1].registers[0] = 1e9
+        self.assertEqual(team.topLearner(state, valid, actVars={"frameNum":2}), 1)
+
+        # the pack follows the team's learners
+        team.removeLearner(team.learners[1])
+        self.assertIsNone(team.packedInstructions)
+        self.assertNotEqual(team.topLearner(state, valid[1:], actVars={"frameNum":3}), -1)
+        self.assertEqual(len(team.packedOffsets), len(team.learners)+1)
+    '''
+    Acting through the compiled graph must pick the same actions as acting
+    through the teams, and must still fail when no action can be reached.
+    '''
+    def test_act_compiled(self):
+
+        t1, l1 = create_dummy_team(num_learners=4)
+        t2, l2 = create_dummy_team(num_learners=4)
+        t3, l3 = create_dummy_team(num_learners=4)
+
+        # t1 -> t2 -> t3, t3 -> t1 and t2 -> t1 make cycles
+        for lrnr, team in [(l1[0], t2), (l1[1], t3), (l2[0], t3), (l2[1], t1), (l3[0], t1)]:
+            lrnr.actionObj.teamAction = team
+            lrnr.actionObj.actionCode = None
+
+        agent = Agent(t1, None, actVars={"frameNum":0})
+        compiled = Agent(copy.deepcopy(t1), None, actVars={"frameNum":0}).compile()
+
+        for _ in range(20):
+            state = getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+            agent.zeroRegisters()
+            action = agent.act(state)
+            compiled.zeroRegisters()
+            self.assertEqual(action, compiled.act(state))
+
+        # registers carry over between acts the same way
+        agent.zeroRegisters()
+        compiled.zeroRegisters()
+        for _ in range(5):
+            state = getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+            self.assertEqual(agent.act(state), compiled.act(state))
+
+        # a loaded agent's learners share the compiled registers again, with
+        # the values they had
+        import pickle
+        loaded = pickle.loads(pickle.dumps(compiled))
+        for lrnr, loadedLrnr in zip(compiled.compiled["learners"], loaded.compiled["learners"]):
+            self.assertTrue(np.shares_memory(loadedLrnr.registers, loaded.compiled["registers"]))
+            self.assertTrue(np.array_equal(lrnr.registers, loadedLrnr.registers))
+        for _ in range(5):
+            state = getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+            self.assertEqual(compiled.act(state), loaded.act(state))
+            self.assertTrue(np.array_equal(compiled.compiled["registers"],
+                loaded.compiled["registers"]))
+
+        # no atomic actions anywhere
+        for lrnr in l1 + l2 + l3:
+            lrnr.actionObj.teamAction = t2 if lrnr in l1 else t1
+            lrnr.actionObj.actionCode = None
+
+        with self.assertRaises(ValueError):
+            Agent(t1, None, actVars={"frameNum":0}).compile().act(state)
+    '''
+    Learners running identical programs from identical registers on the same
+    frame must get the same bids through the bid cache as without it, with the
+    program only run once.
+    '''
+    def test_bid_cache(self):
+
+        team, learners = create_dummy_team(num_learners=6)
+        # 3 programs that differ in what they read, each shared by a pair of learners
+        for i in range(3):
+            learners[i].program = Program(instructions=[[1, 0, 0, i]])
+            learners[i+3].program = Program(instructions=[[1, 0, 0, i]])
+        team.packedInstructions = None
+        state = getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+        valid = np.array([True]*len(learners), dtype=bool)
+
+        uncached = copy.deepcopy(team)
+        bidCache = BidCache()
+
+        for frameNum in range(1, 4):
+            top = team.topLearner(state, valid, actVars={"frameNum":frameNum, "bidCache":bidCache})
+            self.assertEqual(top, uncached.topLearner(state, valid, actVars={"frameNum":frameNum}))
+            for cached, plain in zip(team.learners, uncached.learners):
+                self.assertTrue(np.array_equal(cached.registers, plain.registers))
+
+            # one entry per distinct program, frames don't pile up
+            self.assertEqual(len(bidCache.results), 3)
+
+        # bid goes through the cache as well
+        actVars = {"frameNum":4, "bidCache":bidCache}
+        self.assertEqual(learners[0].bid(state, actVars=actVars), learners[3].bid(state, actVars=actVars))
+        self.assertEqual(len(bidCache.results), 1)
+
+    '''
+    Bids from the population executor must match each learner bidding on its
+    own, and acting on the same frame must only look them up.
+    '''
+    def test_population_executor(self):
+
+        team, learners = create_dummy_team(num_learners=6)
+        state = getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+        states = np.array([getStateALE(np.random.randint(20, size=(5,5,3), dtype=np.int32))
+            for _ in range(4)])
+        plain = copy.deepcopy(learners)
+        executor = PopulationExecutor(learners)
+
+        bids = executor.bid(state, frameNum=1)
+        for lrnr, single, bid in zip(learners, plain, bids):
+            self.assertEqual(bid, single.bid(state, actVars={"frameNum":1}))
+            self.assertTrue(np.array_equal(lrnr.registers, single.registers))
+            self.assertEqual(lrnr.frameNum, 1)
+
+        # nothing runs again on the same frame
+        registers = [np.array(lrnr.registers) for lrnr in learners]
+        team.topLearner(state, np.array([True]*len(learners)), actVars={"frameNum":1})
+        for lrnr, regs in zip(learners, registers):
+            self.assertTrue(np.array_equal(lrnr.registers, regs))
+
+        matrix = executor.bidBatch(states)
+        self.assertEqual(matrix.shape, (len(states), len(learners)))
+        for l, single in enumerate(plain):
+            self.assertTrue(np.array_equal(matrix[:,l], single.bidBatch(states)))
+
+    '''
+    A decision trace must record the same teams, top learners and bids as the
+    path trace, keeping only the last few decisions.
+    '''
+    def test_decision_trace(self):
+
+        trainer = evolve_trainer(Trainer(actions=4, teamPopSize=20, inputSize=75), 3, inputSize=75)
+
+        for agent in trainer.getAgents()[:5]:
+            agent.trace = DecisionTrace(size=3, maxDepth=1, maxLearners=1)
+            paths = []
+            for _ in range(5):
+                path_trace = {}
+                action = agent.act(np.random.rand(75), path_trace=path_trace)
+                paths.append((action, path_trace['path']))
+
+            decisions = agent.trace.decisions()
+            self.assertEqual(len(decisions["actions"]), 3)
+            for d, (action, path) in enumerate(paths[-3:]):
+                self.assertEqual(decisions["actions"][d], action)
+                self.assertEqual(decisions["depths"][d], len(path))
+                for depth, segment in enumerate(path):
+                    self.assertEqual(decisions["teams"][d, depth], segment['team_id'])
+                    self.assertEqual(decisions["topLearners"][d, depth], segment['top_learner'])
+                    bids = {bid['learner_id']: bid['bid'] for bid in segment['bids']}
+                    for learner, bid in zip(decisions["learners"][d, depth], decisions["bids"][d, depth]):
+                        if learner in bids:
+                            self.assertEqual(bid, bids[learner])
+                        else:
+                            self.assertTrue(np.isnan(bid))
+                    self.assertEqual(np.count_nonzero(~np.isnan(decisions["bids"][d, depth])), len(bids))
+
+    '''
+    A profiler must only sample every few acts, and measure the same depth as
+    the path trace whether the agent acts through its teams or compiled. The
+    trainer must keep one profiler per root team across getAgents calls.
+    '''
+    def test_act_profiler(self):
+
+        trainer = evolve_trainer(Trainer(actions=4, teamPopSize=20, inputSize=75), 3, inputSize=75)
+
+        trainer.setProfiling(every=3)
+        for agent in trainer.getAgents():
+            for _ in range(7):
+                agent.act(np.random.rand(75))
+        for agent in trainer.getAgents():
+            self.assertEqual(agent.profiler.acts, 7)
+            self.assertEqual(agent.profiler.samples, 2)
+            counts, edges = agent.profiler.histograms()["latency"]
+            self.assertEqual(counts.sum(), 2)
+            self.assertEqual(len(edges), len(counts)+1)
+        self.assertEqual(len(trainer.profilers), len(trainer.rootTeams))
+
+        trainer.setProfiling(None)
+        self.assertTrue(all(agent.profiler is None for agent in trainer.getAgents()))
+
+        for agent in trainer.getAgents()[:5]:
+            compiled = copy.deepcopy(agent).compile()
+            for acting in (agent, compiled):
+                acting.profiler = ActProfiler(every=1, maxDepth=8)
+                depths = np.zeros(9, dtype=np.int64)
+                for _ in range(5):
+                    state = np.random.rand(75)
+                    path_trace = {}
+                    copy.deepcopy(acting).act(state, path_trace=path_trace)
+                    depths[min(path_trace['depth'], 8)] += 1
+                    acting.act(state)
+
+                self.assertTrue(np.array_equal(acting.profiler.depths, depths))
+                self.assertEqual(acting.profiler.instructions.sum(), 5)
+                self.assertGreater(acting.profiler.latencyPercentile(50), 0)
 
 if __name__ == '__main__':
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='test-reports'))
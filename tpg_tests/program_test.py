@@ -1,9 +1,10 @@
 import io
-import uuid
 import xmlrunner
 import unittest
 import numpy as np
-from tpg.program import Program
+from unittest import mock
+from tpg.program import Program, warmup
+from tpg.configuration.conf_program import ConfProgram
 from extras import runPopulationParallel
 
 class ProgramTest(unittest.TestCase):
@@ -27,7 +28,7 @@ class ProgramTest(unittest.TestCase):
         program = Program(maxProgramLength=max_length, initParams=mutateParams)
 
         # Assert that, after creating a program the id count has been incremented
-        self.assertTrue(isinstance(program.id, uuid.UUID))
+        self.assertTrue(isinstance(program.id, int))
 
         print(np.shape(program.instructions))
 
@@ -57,7 +58,7 @@ class ProgramTest(unittest.TestCase):
             with self.subTest():
                 p = Program(maxProgramLength=max_length, initParams=mutateParams)
                 self.assertLessEqual(np.shape(p.instructions)[0], max_length)
-                self.assertTrue(isinstance(p.id, uuid.UUID))
+                self.assertTrue(isinstance(p.id, int))
         
 
     '''
@@ -112,5 +113,189 @@ class ProgramTest(unittest.TestCase):
                 self.assertGreaterEqual(inst[3], 0)
                 self.assertLessEqual(inst[3], inputs-1)
 
+    '''
+    Mutating programs together must change every one of them, in their own
+    buffers, the same way each time for the same seed, and only the used part
+    of a buffer gets saved.
+    '''
+    def test_mutate_programs(self):
+        from tpg.configuration.conf_program import mutatePrograms
+        import pickle
+
+        def mutateAll(seed):
+            mutateParams = {
+                'nOperations': 5, 'nDestinations': 8, 'inputSize': 100,
+                'pInstDel': 0.5, 'pInstMut': 0.5, 'pInstSwp': 0.5, 'pInstAdd': 0.5,
+                'idCountProgram': 0, 'rng': np.random.default_rng(seed)
+            }
+            progs = [Program(instructions=[[0, i % 5, 1, i], [1, 2, 3, 4]], initParams=mutateParams)
+                for i in range(50)]
+            originals = [np.array(p.instructions) for p in progs]
+            buffers = [p.buffer for p in progs]
+            mutatePrograms(progs, mutateParams)
+            for p, original, buffer in zip(progs, originals, buffers):
+                self.assertFalse(np.array_equal(p.instructions, original))
+                self.assertIs(p.buffer, buffer)
+                p.validate()
+            return progs
+
+        first = mutateAll(1)
+        second = mutateAll(1)
+        for p1, p2 in zip(first, second):
+            self.assertEqual(p1, p2)
+
+        loaded = pickle.loads(pickle.dumps(first[0]))
+        self.assertEqual(loaded, first[0])
+        self.assertNotIn('instructions', loaded.__dict__)
+        self.assertEqual(len(loaded.buffer), 16)
+
+        # each mutated program is validated, like with per-program mutation
+        mutateParams = {
+            'nOperations': 5, 'nDestinations': 8, 'inputSize': 100,
+            'pInstDel': 0.5, 'pInstMut': 0.5, 'pInstSwp': 0.5, 'pInstAdd': 0.5,
+            'idCountProgram': 0, 'rng': np.random.default_rng(2)
+        }
+        progs = [Program(instructions=[[0, 1, 2, 3]], initParams=mutateParams) for _ in range(5)]
+        with mock.patch.object(Program, "validate", autospec=True) as validate:
+            mutatePrograms(progs, mutateParams)
+        self.assertEqual([call.args[0] for call in validate.call_args_list], progs)
+
+    '''
+    Executing a batch of states in one call must give the same registers as
+    executing the program on each state one at a time.
+    '''
+    def test_execute_batch(self):
+
+        program = Program(maxProgramLength=64, nOperations=5, nDestinations=8,
+            inputSize=100, initParams={'idCountProgram': 0})
+        insts = program.getExecutionInstructions(8, 100)
+
+        states = np.random.randint(0, 100, size=(20, 100)).astype(float)
+        batch_regs = np.random.rand(20, 8)
+        single_regs = np.array(batch_regs)
+
+        Program.executeBatch(Program.executeId, states, batch_regs,
+            insts[0], insts[1], insts[2], insts[3])
+
+        for n in range(len(states)):
+            Program.execute(states[n], single_regs[n],
+                insts[0], insts[1], insts[2], insts[3])
+
+        self.assertTrue(np.array_equal(batch_regs, single_regs))
+    '''
+    Running only the effective instructions must give the same bids as running
+    the whole program, over several frames since registers carry over. The
+    cached instructions must be dropped when the program mutates.
+    '''
+    def test_effective_instructions(self):
+
+        mutateParams = {
+            'nOperations': 5,
+            'nDestinations': 8,
+            'inputSize': 100,
+            'pInstDel': 0.5,
+            'pInstMut': 0.5,
+            'pInstSwp': 0.5,
+            'pInstAdd': 0.5,
+            'idCountProgram': 0
+        }
+
+        shorter = 0
+        for _ in range(50):
+            program = Program(maxProgramLength=64, nOperations=5, nDestinations=8,
+                inputSize=100, initParams=mutateParams)
+            insts = program.getExecutionInstructions(8, 100, effective=False)
+            effective = program.getExecutionInstructions(8, 100)
+            shorter += effective.shape[1] < insts.shape[1]
+
+            full_regs = np.zeros(8)
+            effective_regs = np.zeros(8)
+            for _ in range(5):
+                state = np.random.rand(100)
+                Program.execute(state, full_regs,
+                    insts[0], insts[1], insts[2], insts[3])
+                Program.execute(state, effective_regs,
+                    effective[0], effective[1], effective[2], effective[3])
+                self.assertEqual(full_regs[0], effective_regs[0])
+
+            self.assertIs(effective, program.getExecutionInstructions(8, 100))
+            program.mutate(mutateParams)
+            self.assertIsNone(program.effectiveInstructions)
+            self.assertIsNone(program.executionInstructions)
+
+        self.assertGreater(shorter, 0)
+    '''
+    Instructions for execute must have every operand in range, and badly
+    formed instructions must be rejected.
+    '''
+    def test_execution_instructions(self):
+
+        program = Program(maxProgramLength=64, nOperations=7, nDestinations=8,
+            inputSize=1000, initParams={'idCountProgram': 0})
+        raw = program.instructions
+
+        insts = program.getExecutionInstructions(8, 50, effective=False)
+        self.assertTrue(insts.flags['C_CONTIGUOUS'])
+        self.assertTrue(np.all(insts[2] < 8))
+        self.assertTrue(np.all(insts[3][insts[0] == 0] < 8))
+        self.assertTrue(np.all(insts[3][insts[0] == 1] < 50))
+        self.assertTrue(np.array_equal(insts[3][raw[:,0] == 1], raw[raw[:,0] == 1,3] % 50))
+
+        with self.assertRaises(ValueError):
+            Program(instructions=np.array([[2, 0, 0, 0]]))
+        with self.assertRaises(ValueError):
+            Program(instructions=np.array([[0, 0, -1, 0]]))
+
+        # loading an old program brings it up to date
+        state = dict(program.__dict__)
+        del state['effectiveInstructions'], state['executionInstructions']
+        loaded = Program.__new__(Program)
+        loaded.__setstate__(state)
+        self.assertTrue(np.array_equal(insts, loaded.getExecutionInstructions(8, 50, effective=False)))
+
+    '''
+    Warming up must compile the kernels for the types they are called with,
+    so running a program afterwards adds no new signatures.
+    '''
+    def test_warmup(self):
+
+        warmup(stateDtypes=(np.float64, np.int32))
+
+        program = Program(maxProgramLength=64, nOperations=5, nDestinations=8,
+            inputSize=100, initParams={'idCountProgram': 0})
+        insts = program.getExecutionInstructions(8, 100)
+
+        for kernel in (Program.execute, Program.executeBatch):
+            signatures = len(kernel.signatures)
+            self.assertGreaterEqual(signatures, 2)
+
+            if kernel is Program.execute:
+                kernel(np.random.randint(0, 100, size=100).astype(np.int32), np.zeros(8),
+                    insts[0], insts[1], insts[2], insts[3])
+            else:
+                kernel(Program.executeId, np.random.rand(5, 100), np.zeros((5, 8)),
+                    insts[0], insts[1], insts[2], insts[3])
+
+            self.assertEqual(signatures, len(kernel.signatures))
+
+    '''
+    A memory write must copy the registers into each row with that row's
+    write probability from the table, certain rows always and others never.
+    '''
+    def test_mem_write(self):
+
+        regs = np.arange(1, 9, dtype=float)
+        memMatrix = np.zeros((10, 8))
+        # row offsets 0 and 2 always written, the rest never
+        memWriteProbs = np.array([1.0, 0.0, 1.0, 0.0, 0.0])
+        insts = np.array([[0], [6], [0], [0]], dtype=np.int32)
+
+        ConfProgram.execute_mem(np.zeros(4), regs, insts[0], insts[1], insts[2], insts[3],
+            memMatrix, memMatrix.shape[0], memMatrix.shape[1], memWriteProbs)
+
+        written = np.flatnonzero(np.any(memMatrix != 0, axis=1))
+        self.assertTrue(np.array_equal(written, [2, 4, 5, 7]))
+        self.assertTrue(np.all(memMatrix[written] == regs))
+
 if __name__ == '__main__':
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='test-reports'))
@@ -74,6 +74,12 @@ class RunTest(unittest.TestCase):
 
             self.assertEqual(atomics, team.numAtomicActions())
 
+    '''
+    The graph check must find nothing wrong after the run.
+    '''
+    def test_validate_graph(self):
+        self.assertEqual(self.trainer.validate_graph(), [])
+
     @classmethod
     def tearDownClass(cls):
         cls.trainer.cleanup()
@@ -6,11 +6,11 @@ from unittest import result
 import scipy.stats as st
 import math
 import json
-import uuid
 import numpy as np
 import pprint
 
 from tpg.team import Team
+from tpg.population import LearnerSampler
 
 #from numpy.testing._private.utils import assert_equal
 import xmlrunner
@@ -44,7 +44,7 @@ class TeamTest(unittest.TestCase):
         self.assertIsNotNone(team.outcomes)
         self.assertIsNone(team.fitness)
         self.assertEqual(0,team.numLearnersReferencing())
-        self.assertIsInstance(team.id, uuid.UUID)
+        self.assertIsInstance(team.id, int)
         self.assertEqual(dummy_init_params['generation'], team.genCreate)
 
 
@@ -124,7 +124,7 @@ class TeamTest(unittest.TestCase):
         
         # Ensure the learner about to be removed has the team removing it in its inTeams list
         reference_to_removed_learner = team.learners[random_index_in_learners]
-        self.assertTrue(str(team.id) in reference_to_removed_learner.inTeams)
+        self.assertTrue(team.id in reference_to_removed_learner.inTeams)
 
         team.removeLearner(selected_learner)
 
@@ -149,7 +149,7 @@ class TeamTest(unittest.TestCase):
 
         # Ensure the learner that has been removed from the team no longer has the team's id in it's inTeams list
         print("reference to removed inTeams: {}".format(reference_to_removed_learner.inTeams))
-        self.assertFalse(str(team.id) in reference_to_removed_learner.inTeams)
+        self.assertFalse(team.id in reference_to_removed_learner.inTeams)
 
     '''
     Verify that removing all learners from a team does so, without 
@@ -384,7 +384,7 @@ class TeamTest(unittest.TestCase):
                 # Ensure the added learners now have the team in their inTeam list
                 for cursor in added_learners:
                     self.assertIn(cursor, team.learners)
-                    self.assertIn(str(team.id), cursor.inTeams)
+                    self.assertIn(team.id, cursor.inTeams)
 
             frequency = collections.Counter(results[str(i)])
             print(frequency)
@@ -638,7 +638,7 @@ class TeamTest(unittest.TestCase):
 
         team1.inLearners.append(create_dummy_learner().id)
         team2 = copy.deepcopy(team1)
-        team2.inLearners[0] = uuid.uuid4()
+        team2.inLearners[0] = -1
 
         self.assertFalse(team1 == team2)
 
@@ -710,7 +710,7 @@ class TeamTest(unittest.TestCase):
             print([item for item, count in collections.Counter(cursor.inLearners).items() if count > 1])
             print("-------")
             for inner_cursor in cursor.inLearners:
-                target_learners = [x for x in all_learners if str(x.id) == inner_cursor]
+                target_learners = [x for x in all_learners if x.id == inner_cursor]
                 print("target learners: {}".format(len(target_learners)))
                 if len(target_learners) == 0:
                     print("could not find learner {} mentioned by team {}".format( str(inner_cursor), str(cursor.id)))
@@ -726,13 +726,34 @@ class TeamTest(unittest.TestCase):
         # For every inTeam mentioned in a learner, ensure that team exists and has the learner in its list of learners
         for cursor in all_learners:
             for inner_cursor in cursor.inTeams:
-                target_teams = [x for x in all_teams if str(x.id) == str(inner_cursor)]
+                target_teams = [x for x in all_teams if x.id == inner_cursor]
                 if len(target_teams) == 0:
                     print("somehow team {} mentioned by learner {} does not exist...".format(inner_cursor, str(cursor.id)))
                 target_team = target_teams[0]
                 self.assertIsNotNone(target_team)
                 self.assertIn(cursor, target_team.learners)
 
+    '''
+    The sampler must never draw an excluded learner, draw every other one, and
+    find when there is nothing left to draw, however few are left.
+    '''
+    def test_learner_sampler(self):
+
+        learners = create_dummy_learners(50)
+        sampler = LearnerSampler(learners)
+
+        excluded = {learner.id for learner in learners[:10]}
+        drawn = {sampler.sample(excluded).id for _ in range(2000)}
+        self.assertEqual(drawn, {learner.id for learner in learners[10:]})
+
+        # almost everything excluded, found by building the pool
+        excluded = {learner.id for learner in learners[1:]}
+        self.assertIs(sampler.sample(excluded), learners[0])
+
+        excluded.add(learners[0].id)
+        self.assertIsNone(sampler.sample(excluded))
+        self.assertIsNone(LearnerSampler([]).sample(set()))
+
 
 if __name__ == '__main__':
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='test-reports'))
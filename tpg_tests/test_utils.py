@@ -6,6 +6,7 @@ from tpg.learner import Learner
 from tpg.action_object import ActionObject
 from tpg.program import Program
 from tpg.team import Team
+from tpg.trainer import Trainer
 
 
 dummy_init_params = {
@@ -111,6 +112,32 @@ def create_dummy_learners(num_learners=100):
         learners.append(create_dummy_learner())
     return learners
 
+'''
+Create a trainer with trainerArgs, seeding random and np.random first (with
+seed, if given) so the population is the same every run.
+'''
+def create_trainer(seed=None, **trainerArgs):
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    return Trainer(**trainerArgs)
+
+'''
+Evolve trainer for gens generations. Each agent acts on a random state of
+inputSize and gets a random reward. check(trainer), if given, is called after
+each generation, for what a test checks as the trainer evolves. evolveArgs go
+to Trainer.evolve.
+'''
+def evolve_trainer(trainer, gens, inputSize=8, check=None, **evolveArgs):
+    for _ in range(gens):
+        for agent in trainer.getAgents():
+            agent.act(np.random.rand(inputSize))
+            agent.reward(random.random())
+        trainer.evolve(**evolveArgs)
+        if check is not None:
+            check(trainer)
+    return trainer
+
 """
 Transform visual input from ALE to flat vector.
 inState should be made int32 before passing in.
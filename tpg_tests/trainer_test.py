@@ -3,6 +3,14 @@ from tpg import trainer
 import xmlrunner
 from tpg.trainer import Trainer
 from tpg.trainer import loadTrainer
+from tpg.population import PopulationList
+import numpy as np
+import random
+import copy
+import tempfile
+import os
+from unittest import mock
+from tpg_tests.test_utils import create_trainer, evolve_trainer
 
 class TrainerTest(unittest.TestCase):
 
@@ -88,6 +96,11 @@ class TrainerTest(unittest.TestCase):
         ("learner", True),
         ("garbage", False)]
 
+    precision = [
+        ("float64", True),
+        ("float32", True),
+        ("float16", False)]
+
     def test_init(self):
 
         # Test team pop sizes
@@ -200,6 +213,19 @@ class TrainerTest(unittest.TestCase):
                     trainer = Trainer(actions=self.dummy_actions,traversal=cursor[0])
                     self.assertIsNotNone(expected.exception)
 
+        # Test precision, registers and memory must be of that type
+        for cursor in self.precision:
+            if cursor[1]: # If this input is valid
+                trainer = Trainer(actions = self.dummy_actions, precision=cursor[0], memType="def")
+                self.assertEqual(cursor[0], trainer.precision)
+                self.assertEqual(cursor[0], trainer.memMatrix.dtype)
+                for learner in trainer.learners:
+                    self.assertEqual(cursor[0], learner.registers.dtype)
+            else: # This input is invalid, ensure it throws an exception
+                with self.assertRaises(Exception) as expected:
+                    trainer = Trainer(actions=self.dummy_actions,precision=cursor[0])
+                    self.assertIsNotNone(expected.exception)
+
         # Test pLrnDel
         for cursor in self.probability_pool:
             if cursor[1]: # If this input is valid
@@ -310,9 +336,10 @@ class TrainerTest(unittest.TestCase):
         
         trainer = Trainer(actions = self.dummy_actions)
 
-        trainer.saveToFile("test_trainer_save")
-
-        loaded_trainer = loadTrainer("test_trainer_save")
+        with tempfile.TemporaryDirectory() as directory:
+            fileName = os.path.join(directory, "test_trainer_save")
+            trainer.saveToFile(fileName)
+            loaded_trainer = loadTrainer(fileName)
 
         '''
         Ensure loaded trainer has all the same teams and learners
@@ -326,6 +353,340 @@ class TrainerTest(unittest.TestCase):
             self.assertIn(cursor, loaded_trainer.learners)
     
 
+    '''
+    The populations must stay consistent through evolution: no team or learner
+    twice, root teams among the teams, and every learner on some team.
+    '''
+    def test_populations(self):
+
+        def check(trainer):
+            for population in (trainer.teams, trainer.rootTeams, trainer.learners):
+                self.assertIsInstance(population, PopulationList)
+                self.assertEqual(len({member.id for member in population}), len(population))
+            self.assertTrue(all(team in trainer.teams for team in trainer.rootTeams))
+            self.assertEqual({lrnr.id for team in trainer.teams for lrnr in team.learners},
+                {lrnr.id for lrnr in trainer.learners})
+
+        trainer = evolve_trainer(create_trainer(0, actions=self.dummy_actions, teamPopSize=30,
+            inputSize=20), 3, inputSize=20, check=check)
+
+        team = trainer.teams[0]
+        self.assertIs(trainer.teams.get(team.id), team)
+        trainer.teams.remove(team)
+        self.assertNotIn(team, trainer.teams)
+        self.assertIsNone(trainer.teams.get(team.id))
+        with self.assertRaises(ValueError):
+            trainer.teams.remove(team)
+        trainer.teams.append(team)
+        self.assertIs(trainer.teams[-1], team)
+
+    '''
+    The multi task scorers must rank the root teams as comparing each pair of
+    them on every task would.
+    '''
+    def test_multi_task_scorers(self):
+        from tpg.utils import countBeaten, paretoFronts
+        trainer = create_trainer(0, actions=self.dummy_actions, teamPopSize=40)
+        tasks = ["a", "b", "c"]
+        for team in trainer.rootTeams:
+            team.outcomes = {task: random.randint(0, 4) for task in tasks}
+
+        def beaten(t1, compare):
+            return sum(1 for t2 in trainer.rootTeams if t2 is not t1
+                and all(compare(t1.outcomes[task], t2.outcomes[task]) for task in tasks))
+
+        trainer.scoreIndividuals(tasks, multiTaskType="paretoDominate")
+        self.assertEqual([team.fitness for team in trainer.rootTeams],
+            [beaten(team, lambda a, b: a >= b) for team in trainer.rootTeams])
+
+        trainer.scoreIndividuals(tasks, multiTaskType="paretoNonDominated")
+        self.assertEqual([team.fitness for team in trainer.rootTeams],
+            [-beaten(team, lambda a, b: a < b) for team in trainer.rootTeams])
+
+        # done in chunks the same
+        outcomes = trainer.getOutcomes(tasks)
+        self.assertTrue(np.array_equal(countBeaten(outcomes, np.greater_equal, maxCells=7),
+            countBeaten(outcomes, np.greater_equal)))
+        self.assertTrue(np.array_equal(paretoFronts(outcomes, maxCells=7), paretoFronts(outcomes)))
+
+        # no team is dominated by one in the same or a later front
+        trainer.scoreIndividuals(tasks, multiTaskType="paretoFront")
+        for t1 in trainer.rootTeams:
+            for t2 in trainer.rootTeams:
+                if t2.fitness <= t1.fitness:
+                    self.assertFalse(
+                        all(t2.outcomes[task] >= t1.outcomes[task] for task in tasks)
+                        and any(t2.outcomes[task] > t1.outcomes[task] for task in tasks))
+        self.assertEqual(max(team.fitness for team in trainer.rootTeams), 0)
+
+        # a team best at everything gets every selection
+        trainer.rootTeams[5].outcomes = {task: 5 for task in tasks}
+        trainer.scoreIndividuals(tasks, multiTaskType="lexicaseDynamic")
+        self.assertEqual([team.fitness for team in trainer.rootTeams],
+            [len(trainer.rootTeams) if i == 5 else 0 for i in range(len(trainer.rootTeams))])
+        self.assertEqual(trainer.elites, [trainer.rootTeams[5]]*len(tasks))
+
+
+    '''
+    Agents' rewards must land in the trainer's outcome table, be scored and
+    summed up from it, be kept when saved, and free their rows once the team
+    is gone.
+    '''
+    def test_outcome_table(self):
+        from tpg.outcomes import TeamOutcomes
+        import pickle
+        trainer = create_trainer(0, actions=self.dummy_actions, teamPopSize=20)
+        tasks = ["a", "b"]
+        for agent in trainer.getAgents():
+            self.assertFalse(agent.taskDone("a"))
+            for task in tasks:
+                agent.reward(random.random(), task)
+            self.assertTrue(agent.taskDone("a"))
+            self.assertIsInstance(agent.team.outcomes, TeamOutcomes)
+        self.assertEqual(len(trainer.outcomeTable), len(trainer.rootTeams))
+
+        outcomes = [[team.outcomes[task] for task in tasks] for team in trainer.rootTeams]
+        self.assertTrue(np.array_equal(trainer.getOutcomes(tasks), outcomes))
+        stats = trainer.getTaskStats("b")
+        self.assertEqual(stats["scores"], [row[1] for row in outcomes])
+        self.assertAlmostEqual(stats["average"], sum(row[1] for row in outcomes)/len(outcomes))
+
+        mins = np.min(outcomes, axis=0)
+        maxs = np.max(outcomes, axis=0)
+        trainer.scoreIndividuals(tasks, multiTaskType="average")
+        for team, row in zip(trainer.rootTeams, outcomes):
+            self.assertAlmostEqual(team.fitness, np.mean((np.array(row)-mins)/(maxs-mins)))
+
+        self.assertEqual([agent.team for agent in trainer.getAgents(sortTasks=["a"])],
+            sorted(trainer.rootTeams, key=lambda team: team.outcomes["a"], reverse=True))
+        self.assertEqual(trainer.getAgents(skipTasks=["a"]), [])
+
+        loaded = pickle.loads(pickle.dumps(trainer))
+        self.assertTrue(np.array_equal(loaded.getOutcomes(tasks), outcomes))
+
+        trainer.saveFitnessStats()
+        trainer.select()
+        self.assertEqual(len(trainer.outcomeTable), len(trainer.rootTeams))
+        trainer.generate()
+        trainer.nextEpoch()
+        self.assertLessEqual(len(trainer.outcomeTable.values), 32)
+
+
+    '''
+    The root teams tracked as learners come and go must be the teams no
+    learner points to, and no team that learners point to may be deleted.
+    '''
+    def test_root_set(self):
+        import pickle
+        def check(trainer):
+            roots = [team for team in trainer.teams if team.numLearnersReferencing() == 0]
+            self.assertEqual(sorted(team.id for team in trainer.roots), sorted(team.id for team in roots))
+            self.assertEqual(trainer.countRootTeams(), len(roots))
+            for lrnr in trainer.learners:
+                if not lrnr.isActionAtomic():
+                    self.assertIn(lrnr.getActionTeam(), trainer.teams)
+
+        trainer = evolve_trainer(create_trainer(0, actions=4, teamPopSize=30, pLrnAdd=0.7),
+            25, check=check)
+
+        loaded = pickle.loads(pickle.dumps(trainer))
+        self.assertEqual(sorted(team.id for team in loaded.roots), sorted(team.id for team in trainer.roots))
+        self.assertTrue(all(team.roots is loaded.roots for team in loaded.teams))
+
+
+    '''
+    Learners no team holds any more must be queued as they come up, and be
+    gone from the population after select, along with their references.
+    '''
+    def test_collector(self):
+        def check(trainer):
+            self.assertEqual(len(trainer.collector), 0)
+            self.assertTrue(all(lrnr.numTeamsReferencing() > 0 for lrnr in trainer.learners))
+
+        trainer = evolve_trainer(create_trainer(1, actions=4, teamPopSize=30, pLrnAdd=0.7),
+            10, check=check)
+
+        # learners dropped outside of select are collected by the next one
+        team = max(trainer.teams, key=lambda team: team.numAtomicActions())
+        dropped = [lrnr for lrnr in team.learners if lrnr.numTeamsReferencing() == 1][:2]
+        self.assertGreater(len(dropped), 0)
+        for lrnr in dropped:
+            team.removeLearner(lrnr)
+        self.assertEqual(len(trainer.collector), len(dropped))
+
+        for agent in trainer.getAgents():
+            agent.reward(random.random())
+        trainer.scoreIndividuals(["task"])
+        trainer.select()
+        for lrnr in dropped:
+            self.assertNotIn(lrnr, trainer.learners)
+            if not lrnr.isActionAtomic():
+                self.assertNotIn(lrnr.id, lrnr.getActionTeam().inLearners)
+
+
+    '''
+    The graph check must find nothing wrong with a trainer's graph as it
+    evolves, and report what is broken in it by kind and ids.
+    '''
+    def test_validate_graph(self):
+        from tpg.graph_check import GraphViolation
+        trainer = create_trainer(2, actions=4, teamPopSize=30, pLrnAdd=0.7)
+        trainer.setGraphChecking()
+        evolve_trainer(trainer, 10,
+            check=lambda trainer: self.assertEqual(trainer.graphViolations, []))
+
+        team = next(team for team in trainer.teams if team.numLearnersReferencing() > 0)
+        learnerId = team.inLearners.pop()
+        lrnr = next(lrnr for lrnr in team.learners if lrnr.isActionAtomic())
+        lrnr.inTeams.append(-1)
+        self.assertEqual(sorted(trainer.validate_graph()), sorted([
+            GraphViolation("inLearners", team.id, learnerId),
+            GraphViolation("inTeams", -1, lrnr.id)] +
+            ([GraphViolation("root", team.id, None)] if len(team.inLearners) == 0 else [])))
+
+
+    '''
+    Bid caching must be off unless asked for, and refused with memory.
+    '''
+    def test_bid_caching(self):
+        from tpg.bid_cache import BidCache
+        trainer = Trainer(actions=self.dummy_actions, teamPopSize=10)
+        self.assertNotIn("bidCache", trainer.actVars)
+        trainer.setBidCaching()
+        self.assertIsInstance(trainer.getAgents()[0].actVars["bidCache"], BidCache)
+        trainer.setBidCaching(False)
+        self.assertNotIn("bidCache", trainer.actVars)
+
+        trainer = Trainer(actions=self.dummy_actions, teamPopSize=10, memType="def")
+        with self.assertRaises(ValueError):
+            trainer.setBidCaching()
+
+
+    '''
+    Teams of another trainer given as extras are adopted as copies with ids
+    of their own, so they don't replace teams or learners that have the same
+    ids here, and the other trainer is left as it was. Populations must
+    refuse different members with the same id.
+    '''
+    def test_extra_teams(self):
+        trainer = create_trainer(3, actions=4, teamPopSize=20)
+        other = Trainer(actions=4, teamPopSize=20)
+        extras = list(other.rootTeams)[:3]
+        self.assertTrue(all(trainer.teams.get(team.id) is not None for team in extras))
+        ours = list(trainer.teams)
+
+        def graphOf(trainer):
+            return ([(team.id, [lrnr.id for lrnr in team.learners], sorted(team.inLearners))
+                    for team in trainer.teams],
+                [(lrnr.id, sorted(lrnr.inTeams)) for lrnr in trainer.learners],
+                [team.id for team in trainer.rootTeams])
+        before = graphOf(other)
+
+        def check(trainer):
+            self.assertEqual(len({team.id for team in trainer.teams}), len(trainer.teams))
+            self.assertEqual(len({lrnr.id for lrnr in trainer.learners}), len(trainer.learners))
+            self.assertFalse(any(team is extra for team in trainer.teams for extra in extras))
+            self.assertLessEqual(len(trainer.adoptedExtras), len(extras))
+
+        evolve_trainer(trainer, 3, check=check, extraTeams=extras)
+
+        for team in ours:
+            self.assertIs(trainer.teams.get(team.id) or team, team)
+        for team in trainer.adoptedExtras.values():
+            self.assertIs(trainer.teams.get(team.id), team)
+            for lrnr in team.learners:
+                self.assertIn(team.id, lrnr.inTeams)
+
+        self.assertEqual(graphOf(other), before)
+        self.assertEqual(other.validate_graph(), [])
+        for team in other.teams:
+            self.assertIs(other.teams.get(team.id), team)
+
+        with self.assertRaises(ValueError):
+            PopulationList([ours[0], copy.copy(ours[0])])
+
+    '''
+    Trainers and agents saved before the functions, attributes and integer ids
+    added since must load, act and evolve. Saved here with what was added
+    taken out again, and uuids for ids.
+    '''
+    def test_load_old(self):
+        import pickle
+        import uuid
+        from tpg.agent import Agent, loadAgent
+        from tpg.team import Team
+        from tpg.learner import Learner
+        from tpg.configuration.configurer import addedFunctions
+        trainer = evolve_trainer(create_trainer(4, actions=4, teamPopSize=10, memType="def"), 2)
+
+        for team in trainer.teams:
+            team.id = uuid.uuid4()
+        for lrnr in trainer.learners:
+            lrnr.id = lrnr.program.id = uuid.uuid4()
+        for lrnr in trainer.learners:
+            lrnr.inTeams = [str(team.id) for team in trainer.teams for l in team.learners if l is lrnr]
+        for team in trainer.teams:
+            team.inLearners = [str(lrnr.id) for lrnr in trainer.learners if lrnr.getActionTeam() is team]
+        functionsDict = {cls: {name: variant for name, variant in functions.items()
+                if name not in addedFunctions.get(cls, [])}
+            for cls, functions in trainer.functionsDict.items()}
+        actVars = {"memMatrix": trainer.actVars["memMatrix"]}
+        agent = trainer.getAgents()[0]
+        exported = str(agent.team.id)
+
+        def oldState(obj, names):
+            state = {name: value for name, value in obj.__dict__.items() if name not in names}
+            state.update((name, list(state[name])) for name in ("teams", "rootTeams", "learners")
+                if name in state)
+            state.update((name, value) for name, value in (("functionsDict", functionsDict),
+                ("actVars", actVars)) if name in state)
+            return state
+
+        with mock.patch.object(Trainer, "__getstate__", lambda self: oldState(self, ["precision",
+                    "uuids", "profileEvery", "profilers", "graphChecking", "graphViolations",
+                    "adoptedExtras", "outcomeTable", "roots", "collector"])), \
+                mock.patch.object(Agent, "__getstate__", lambda self: oldState(self,
+                    ["compiled", "trace", "profiler"]), create=True), \
+                mock.patch.object(Team, "__getstate__", lambda self: oldState(self, ["handle",
+                    "packedInstructions", "packedOffsets", "packedKey", "packedIds", "roots",
+                    "collector"])), \
+                mock.patch.object(Learner, "__getstate__", lambda self: oldState(self, ["handle"]),
+                    create=True), \
+                tempfile.TemporaryDirectory() as directory:
+            trainer.saveToFile(os.path.join(directory, "trainer"))
+            agent.saveToFile(os.path.join(directory, "agent"))
+            trainer = loadTrainer(os.path.join(directory, "trainer"))
+            agent = loadAgent(os.path.join(directory, "agent"))
+
+        self.assertTrue(all(isinstance(team.id, int) for team in trainer.teams))
+        self.assertEqual(trainer.validate_graph(), [])
+        self.assertIn(exported, trainer.uuids.values())
+        self.assertIn("memWriteProbs", trainer.actVars)
+        evolve_trainer(trainer, 2)
+        self.assertEqual(trainer.validate_graph(), [])
+
+        self.assertIsInstance(agent.team.id, int)
+        self.assertIsNone(agent.profiler)
+        self.assertIn(agent.act(np.random.rand(8)), range(4))
+
+    '''
+    The uuids for exporting and the profilers of teams and learners removed
+    from the population must go with them, not pile up over generations.
+    '''
+    def test_forget_removed(self):
+        def check(trainer):
+            teamIds = {team.id for team in trainer.teams}
+            learnerIds = {lrnr.id for lrnr in trainer.learners}
+            for kind, id in trainer.uuids:
+                self.assertIn(id, teamIds if kind == "team" else learnerIds)
+            self.assertTrue(set(trainer.profilers) <= teamIds)
+            trainer.get_graph() # uuids for the next generation to forget
+
+        trainer = create_trainer(5, actions=4, teamPopSize=10)
+        trainer.setProfiling(every=2)
+        trainer.get_graph()
+        evolve_trainer(trainer, 4, check=check)
+
 
 if __name__ == '__main__':
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='test-reports'))
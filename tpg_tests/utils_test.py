@@ -1,11 +1,15 @@
 import io
 import xmlrunner
 import unittest
-from extras import runPopulationParallel
+from extras import runPopulationParallel, getStateALE
 from tpg.trainer import Trainer
 from tpg.team import Team
 from tpg.learner import Learner
-from tpg.utils import pathDepths
+from tpg.utils import pathDepths, scatterState
+from tpg.agent import Agent
+from tpg.program import Program
+import numpy as np
+import copy
 from tpg_tests.test_utils import create_dummy_team, create_dummy_learners
 
 
@@ -47,7 +51,38 @@ class RunTest(unittest.TestCase):
 
         self.assertEqual(pathDepths(team), [1,2,3,2,3])
 
-
+    '''
+    Acting on a state rebuilt from only the read set must give the same actions
+    as acting on the whole state.
+    '''
+    def test_read_set(self):
+        # programs that read known inputs (mode 1, op 0 reads its source)
+        programs = [
+            [[1, 0, 0, 3]],
+            [[1, 0, 0, 13]],
+            [[1, 1, 0, 33], [0, 0, 0, 2]],
+            [[1, 0, 0, 105], [1, 0, 5, 40]], # 105 wraps to 5, register 5 is never read
+            [[0, 0, 0, 2], [1, 2, 2, 60]], # op 2 doesn't read its source
+            [[1, 4, 0, 3]] # 3 again
+        ]
+        team, learners = create_dummy_team(num_learners=len(programs))
+        for lrnr, instructions in zip(learners, programs):
+            lrnr.program = Program(instructions=instructions)
+        agent = Agent(team, None, actVars={"frameNum":0})
+        sparse = Agent(copy.deepcopy(team), None, actVars={"frameNum":0})
+
+        readSet = agent.getReadSet(100)
+        self.assertEqual(readSet.tolist(), [3, 5, 13, 33])
+
+        rebuilt = None
+        for _ in range(10):
+            state = np.random.rand(100)
+            rebuilt = scatterState(state[readSet], readSet, 100, out=rebuilt)
+            self.assertEqual(agent.act(state), sparse.act(rebuilt))
+
+        # ALE states can be produced for just the read set
+        screen = np.random.randint(0, 256, size=(5,20,3), dtype=np.int32)
+        self.assertTrue(np.array_equal(getStateALE(screen)[readSet], getStateALE(screen, indices=readSet)))
 
 
 if __name__ == '__main__':